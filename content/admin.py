@@ -1,6 +1,105 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.utils import get_last_value_from_parameters
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from .models import Genre, Movie, TVShow, Episode, UserProfile, Watchlist, Review
+from .images import smallest_url
+from .models import Genre, Movie, TVShow, Episode, UserProfile, Watchlist, Review, VideoRendition
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that uses the planner's row estimate for large unfiltered tables.
+
+    A filtered changelist (search, list filters, date hierarchy) still gets an
+    exact COUNT(*), since those are bounded by the indexes they hit.
+    """
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = estimate_row_count(self.object_list)
+        if estimate is None or estimate < self.exact_count_threshold:
+            return super().count
+        return estimate
+
+
+def estimate_row_count(queryset):
+    """Return a cheap row estimate for an unfiltered queryset, or None."""
+    query = getattr(queryset, 'query', None)
+    if query is None or query.where or query.distinct or query.combinator:
+        return None
+    connection = connections[queryset.db]
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            # MAX(rowid) is a B-tree seek; it over-counts only by deleted rows.
+            cursor.execute(f'SELECT MAX(rowid) FROM {table}')
+        else:
+            return None
+        row = cursor.fetchone()
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """Foreign key list filter backed by the admin autocomplete view.
+
+    ``RelatedFieldListFilter`` renders every row of the related table in the
+    sidebar; this one only loads the selected object and searches the rest
+    through the related ModelAdmin's ``search_fields``.
+    """
+    template = 'admin/content/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.attname}__exact'
+        self.lookup_val = get_last_value_from_parameters(params, self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        form_field = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(field, model_admin.admin_site),
+            required=False,
+        )
+        self.widget = form_field.widget
+        self.widget_id = f'autocomplete-filter-{field_path}'
+        self.rendered_widget = self.widget.render(
+            self.lookup_kwarg, self.lookup_val, attrs={'id': self.widget_id}
+        )
+
+    @property
+    def media(self):
+        return self.widget.media
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': 'All',
+        }
+
+
+def genre_title_count(through, field):
+    """Correlated COUNT over a genre M2M table, avoiding a join fan-out."""
+    counts = (
+        through.objects.filter(genre_id=OuterRef('pk'))
+        .values('genre_id')
+        .annotate(total=Count(field))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
 
 
 @admin.register(Genre)
@@ -9,13 +108,21 @@ class GenreAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
     list_filter = ['name']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            _movie_count=genre_title_count(Movie.genres.through, 'movie_id'),
+            _tvshow_count=genre_title_count(TVShow.genres.through, 'tvshow_id'),
+        )
+    
     def movie_count(self, obj):
-        return obj.movies.count()
+        return obj._movie_count
     movie_count.short_description = 'Movies'
+    movie_count.admin_order_field = '_movie_count'
     
     def tvshow_count(self, obj):
-        return obj.tvshows.count()
+        return obj._tvshow_count
     tvshow_count.short_description = 'TV Shows'
+    tvshow_count.admin_order_field = '_tvshow_count'
 
 
 @admin.register(Movie)
@@ -39,13 +146,19 @@ class MovieAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('genres', queryset=Genre.objects.only('name'))
+        )
+    
     def genre_list(self, obj):
         return ', '.join([genre.name for genre in obj.genres.all()])
     genre_list.short_description = 'Genres'
     
     def poster_preview(self, obj):
         if obj.poster:
-            return format_html('<img src="{}" width="50" height="75" style="border-radius: 4px;">', obj.poster.url)
+            url = smallest_url(obj.poster_renditions) or obj.poster.url
+            return format_html('<img src="{}" width="50" height="75" loading="lazy" style="border-radius: 4px;">', url)
         return 'No Image'
     poster_preview.short_description = 'Poster'
 
@@ -71,36 +184,61 @@ class TVShowAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            _episode_count=Count('episodes')
+        ).prefetch_related(
+            Prefetch('genres', queryset=Genre.objects.only('name'))
+        )
+    
     def genre_list(self, obj):
         return ', '.join([genre.name for genre in obj.genres.all()])
     genre_list.short_description = 'Genres'
     
     def episode_count(self, obj):
-        return obj.episodes.count()
+        return obj._episode_count
     episode_count.short_description = 'Episodes'
+    episode_count.admin_order_field = '_episode_count'
     
     def poster_preview(self, obj):
         if obj.poster:
-            return format_html('<img src="{}" width="50" height="75" style="border-radius: 4px;">', obj.poster.url)
+            url = smallest_url(obj.poster_renditions) or obj.poster.url
+            return format_html('<img src="{}" width="50" height="75" loading="lazy" style="border-radius: 4px;">', url)
         return 'No Image'
     poster_preview.short_description = 'Poster'
 
 
+class VideoRenditionInline(admin.TabularInline):
+    model = VideoRendition
+    fields = ['name', 'width', 'height', 'bandwidth', 'average_bandwidth', 'segment_count', 'created_at']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Episode)
 class EpisodeAdmin(admin.ModelAdmin):
     list_display = ['title', 'tv_show', 'season_number', 'episode_number', 'duration', 'release_date']
-    list_filter = ['tv_show', 'season_number', 'release_date']
+    list_filter = [('tv_show', AutocompleteFilter), 'season_number', 'release_date']
+    list_select_related = ['tv_show']
     search_fields = ['title', 'description', 'tv_show__title']
+    autocomplete_fields = ['tv_show']
     ordering = ['tv_show', 'season_number', 'episode_number']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     fieldsets = (
         ('Episode Information', {
             'fields': ('tv_show', 'season_number', 'episode_number', 'title', 'description')
         }),
         ('Media', {
-            'fields': ('duration', 'video_url', 'release_date')
+            'fields': ('duration', 'video_url', 'video_file', 'release_date')
         }),
     )
+    inlines = [VideoRenditionInline]
 
 
 @admin.register(UserProfile)
@@ -109,6 +247,12 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_filter = ['created_at', 'favorite_genres']
     search_fields = ['user__username', 'user__email', 'bio']
     filter_horizontal = ['favorite_genres']
+    list_select_related = ['user']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('favorite_genres', queryset=Genre.objects.only('name'))
+        )
     
     def favorite_genres_list(self, obj):
         return ', '.join([genre.name for genre in obj.favorite_genres.all()])
@@ -118,9 +262,13 @@ class UserProfileAdmin(admin.ModelAdmin):
 @admin.register(Watchlist)
 class WatchlistAdmin(admin.ModelAdmin):
     list_display = ['user', 'content_type', 'content_title', 'added_at']
-    list_filter = ['added_at', 'movie', 'tv_show']
+    list_filter = ['added_at', ('movie', AutocompleteFilter), ('tv_show', AutocompleteFilter)]
+    list_select_related = ['user', 'movie', 'tv_show']
     search_fields = ['user__username', 'movie__title', 'tv_show__title']
+    autocomplete_fields = ['movie', 'tv_show']
     ordering = ['-added_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     def content_type(self, obj):
         if obj.movie:
@@ -142,9 +290,13 @@ class WatchlistAdmin(admin.ModelAdmin):
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ['user', 'content_type', 'content_title', 'rating', 'created_at']
-    list_filter = ['rating', 'created_at', 'movie', 'tv_show']
+    list_filter = ['rating', 'created_at', ('movie', AutocompleteFilter), ('tv_show', AutocompleteFilter)]
+    list_select_related = ['user', 'movie', 'tv_show']
     search_fields = ['user__username', 'comment', 'movie__title', 'tv_show__title']
+    autocomplete_fields = ['movie', 'tv_show']
     ordering = ['-created_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     def content_type(self, obj):
         if obj.movie:
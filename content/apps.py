@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class ContentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'content'
+
+    def ready(self):
+        from . import catalog, checks, feeds, images, invalidation, packaging, reviews, tasks  # noqa: F401 (registers tasks and checks)
+        from .templatetags import content_cards
+
+        invalidation.connect_signals()
+        invalidation.subscribe(('movie', 'tvshow'), content_cards.forget_cards)
+        catalog.connect_signals()
+        feeds.connect_signals()
+        images.connect_signals()
+        packaging.connect_signals()
+        reviews.connect_signals()
@@ -0,0 +1,391 @@
+"""Process-local, immutable snapshot of the catalog.
+
+Genres, movies, TV shows and episodes change rarely but are read on every
+page. :func:`get` returns a :class:`CatalogSnapshot` that holds the whole
+catalog as compact ``__slots__`` records. The snapshot has id -> offset
+indexes, and every genre keeps one bitset over movie offsets and one over
+TV show offsets. Home, genre and detail pages are then served without
+catalog queries.
+
+Records mimic the models closely enough for the templates:
+* ``poster`` is falsy or has a ``.url``;
+* ``genres.all`` works;
+* lists support ``.count``.
+
+Writes still go through the ORM. Saving or deleting a catalog row, or
+changing a title's genres, bumps a version counter in the shared cache once
+the transaction commits (once per transaction, through
+``content.invalidation``). Each process checks the counter at most every
+``CATALOG_VERSION_CHECK_INTERVAL`` seconds, or straight away after its own
+writes. When the counter has moved, the process builds a new snapshot
+beside the old one and swaps the reference. Requests already running keep
+the snapshot they started with. ``QuerySet.update()`` and other bulk writes
+skip signals, so call :func:`bump_version` after them.
+
+A snapshot larger than ``CATALOG_SNAPSHOT_MAX_BYTES`` is discarded. :func:`get`
+then returns ``None`` and views fall back to the ORM.
+"""
+import logging
+import sys
+import threading
+import time
+from functools import cached_property
+from types import MappingProxyType
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'catalog:version'
+
+# Shared by every title without poster renditions; read-only
+NO_RENDITIONS = MappingProxyType({})
+
+
+class RecordList(tuple):
+    """A tuple that answers the QuerySet methods templates call."""
+
+    def all(self):
+        return self
+
+    def count(self):
+        return len(self)
+
+    def exists(self):
+        return bool(self)
+
+    def first(self):
+        return self[0] if self else None
+
+
+class PosterFile:
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __bool__(self):
+        return bool(self.name)
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def url(self):
+        from .models import Movie
+
+        return Movie._meta.get_field('poster').storage.url(self.name)
+
+
+class GenreRecord:
+    __slots__ = ('id', 'name', 'description', 'movie_bits', 'tvshow_bits')
+
+    def __init__(self, id, name, description):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.movie_bits = 0
+        self.tvshow_bits = 0
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.name
+
+
+class TitleRecord:
+    __slots__ = (
+        'id', 'title', 'description', 'release_date', 'rating', 'poster', 'poster_renditions',
+        'trailer_url', 'featured', 'created_at', 'updated_at', 'genre_mask', 'all_genres',
+    )
+
+    def __init__(self, row, all_genres):
+        for name in TitleRecord.__slots__[:-2]:
+            setattr(self, name, row[name])
+        self.rating = float(row['rating'])
+        self.poster = PosterFile(row['poster']) if row['poster'] else None
+        self.poster_renditions = row['poster_renditions'] or NO_RENDITIONS
+        self.genre_mask = 0
+        self.all_genres = all_genres
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def genres(self):
+        return RecordList(self.all_genres[offset] for offset in offsets(self.genre_mask))
+
+    def __str__(self):
+        return self.title
+
+
+class MovieRecord(TitleRecord):
+    __slots__ = ('duration',)
+    kind = 'movie'
+
+    def __init__(self, row, all_genres):
+        super().__init__(row, all_genres)
+        self.duration = row['duration']
+
+
+class TVShowRecord(TitleRecord):
+    __slots__ = ('episodes',)
+    kind = 'tvshow'
+
+    def __init__(self, row, all_genres):
+        super().__init__(row, all_genres)
+        self.episodes = RecordList()
+
+
+class EpisodeRecord:
+    __slots__ = (
+        'id', 'tv_show', 'season_number', 'episode_number', 'title', 'description', 'duration',
+        'video_url', 'release_date', 'has_stream',
+    )
+
+    def __init__(self, row, tv_show, has_stream):
+        for name in EpisodeRecord.__slots__[2:-1]:
+            setattr(self, name, row[name])
+        self.id = row['id']
+        self.tv_show = tv_show
+        self.has_stream = has_stream
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def tv_show_id(self):
+        return self.tv_show.id
+
+    def __str__(self):
+        return f"{self.tv_show.title} - S{self.season_number}E{self.episode_number}: {self.title}"
+
+
+def offsets(bits):
+    """Set bit positions of ``bits``, lowest first."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class CatalogSnapshot:
+    def __init__(self, version, genres, movies, tvshows, episodes):
+        self.version = version
+        self.genres = RecordList(genres)
+        self.movies = RecordList(movies)
+        self.tvshows = RecordList(tvshows)
+        self.genre_index = {genre.id: genre for genre in genres}
+        self.movie_index = {movie.id: offset for offset, movie in enumerate(movies)}
+        self.tvshow_index = {tvshow.id: offset for offset, tvshow in enumerate(tvshows)}
+        self.episode_index = {episode.id: episode for episode in episodes}
+        self.featured_movies = RecordList(movie for movie in movies if movie.featured)
+        self.featured_tvshows = RecordList(tvshow for tvshow in tvshows if tvshow.featured)
+        self.nbytes = 0
+
+    @property
+    def title_count(self):
+        return len(self.movies) + len(self.tvshows)
+
+    def movie(self, movie_id):
+        offset = self.movie_index.get(int(movie_id))
+        return None if offset is None else self.movies[offset]
+
+    def tvshow(self, tvshow_id):
+        offset = self.tvshow_index.get(int(tvshow_id))
+        return None if offset is None else self.tvshows[offset]
+
+    def episode(self, episode_id):
+        return self.episode_index.get(int(episode_id))
+
+    def genre(self, genre_id):
+        return self.genre_index.get(int(genre_id))
+
+    def lookup(self, model, pk):
+        from .models import Episode, Genre, Movie, TVShow
+
+        finder = {Movie: self.movie, TVShow: self.tvshow, Episode: self.episode, Genre: self.genre}[model]
+        return finder(pk)
+
+    @cached_property
+    def facets(self):
+        """Bitmap facet index over this snapshot (see content/facets.py)."""
+        from .facets import FacetIndex
+
+        return FacetIndex(self)
+
+    def in_genre(self, genre):
+        """``(movies, tvshows)`` tagged with ``genre``, in catalog order."""
+        return (
+            RecordList(self.movies[offset] for offset in offsets(genre.movie_bits)),
+            RecordList(self.tvshows[offset] for offset in offsets(genre.tvshow_bits)),
+        )
+
+
+def build(version, using=DEFAULT_DB_ALIAS):
+    """Load the catalog into a new snapshot in seven queries.
+
+    Reads go to the primary: the version was bumped after a commit that a
+    lagging replica might not have yet.
+    """
+    from .models import Episode, Genre, Movie, TVShow, VideoRendition
+
+    genres = [GenreRecord(**row) for row in Genre.objects.using(using).values('id', 'name', 'description')]
+    genre_offsets = {genre.id: offset for offset, genre in enumerate(genres)}
+    all_genres = tuple(genres)
+
+    title_fields = list(TitleRecord.__slots__[:-2])
+    movies = [MovieRecord(row, all_genres) for row in Movie.objects.using(using).values(*title_fields, 'duration')]
+    tvshows = [TVShowRecord(row, all_genres) for row in TVShow.objects.using(using).values(*title_fields)]
+    for records, model, bits_name in ((movies, Movie, 'movie_bits'), (tvshows, TVShow, 'tvshow_bits')):
+        index = {record.id: offset for offset, record in enumerate(records)}
+        through = model.genres.through
+        owner = f'{model._meta.model_name}_id'
+        for title_id, genre_id in through.objects.using(using).values_list(owner, 'genre_id'):
+            offset, genre_offset = index.get(title_id), genre_offsets.get(genre_id)
+            if offset is None or genre_offset is None:
+                continue
+            records[offset].genre_mask |= 1 << genre_offset
+            genre = genres[genre_offset]
+            setattr(genre, bits_name, getattr(genre, bits_name) | 1 << offset)
+
+    streamed = set(VideoRendition.objects.using(using).values_list('episode_id', flat=True).distinct())
+    shows = {tvshow.id: tvshow for tvshow in tvshows}
+    episode_fields = [name for name in EpisodeRecord.__slots__ if name not in ('tv_show', 'has_stream')]
+    episodes, by_show = [], {}
+    for row in Episode.objects.using(using).values(*episode_fields, 'tv_show_id'):
+        tvshow = shows.get(row['tv_show_id'])
+        if tvshow is None:
+            continue
+        episode = EpisodeRecord(row, tvshow, row['id'] in streamed)
+        episodes.append(episode)
+        by_show.setdefault(tvshow.id, []).append(episode)
+    for show_id, show_episodes in by_show.items():
+        shows[show_id].episodes = RecordList(show_episodes)
+
+    snapshot = CatalogSnapshot(version, genres, movies, tvshows, episodes)
+    snapshot.nbytes = measure(snapshot)
+    return snapshot
+
+
+def measure(snapshot):
+    """Approximate bytes held by the snapshot: records, their values and indexes."""
+    seen = set()
+    # Back-references to records that are counted where they're owned
+    shared = ('tv_show', 'all_genres')
+
+    def size(obj):
+        if obj is None or id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        total = sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            total += sum(size(key) + size(value) for key, value in obj.items())
+        elif isinstance(obj, (list, tuple)):
+            total += sum(size(item) for item in obj)
+        elif hasattr(obj, '__slots__'):
+            for cls in type(obj).__mro__:
+                for name in getattr(cls, '__slots__', ()):
+                    if name not in shared:
+                        total += size(getattr(obj, name, None))
+        return total
+
+    total = sum(size(records) for records in (snapshot.genres, snapshot.movies, snapshot.tvshows))
+    for index in (snapshot.genre_index, snapshot.movie_index, snapshot.tvshow_index, snapshot.episode_index):
+        total += sys.getsizeof(index)
+    return total
+
+
+class State:
+    __slots__ = ('snapshot', 'version', 'next_check')
+
+    def __init__(self):
+        self.snapshot = None
+        self.version = None
+        self.next_check = 0.0
+
+
+_state = State()
+_build_lock = threading.Lock()
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # A fresh value, never one a process could already hold
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+    _state.next_check = 0.0
+
+
+def get():
+    """The current snapshot, or ``None`` when disabled or over its memory budget."""
+    if not getattr(settings, 'CATALOG_SNAPSHOT_ENABLED', True):
+        return None
+    now = time.monotonic()
+    if now < _state.next_check:
+        return _state.snapshot
+    version = current_version()
+    _state.next_check = now + getattr(settings, 'CATALOG_VERSION_CHECK_INTERVAL', 1.0)
+    if _state.version == version:
+        return _state.snapshot
+    if not _build_lock.acquire(blocking=_state.version is None):
+        # Another thread is rebuilding; keep serving the previous snapshot
+        return _state.snapshot
+    try:
+        if _state.version != version:
+            snapshot = build(version)
+            budget = getattr(settings, 'CATALOG_SNAPSHOT_MAX_BYTES', 128 * 1024 * 1024)
+            if snapshot.nbytes > budget:
+                logger.error(
+                    'Catalog snapshot needs %d bytes, over CATALOG_SNAPSHOT_MAX_BYTES=%d; serving from the database',
+                    snapshot.nbytes, budget,
+                )
+                snapshot = None
+            _state.snapshot, _state.version = snapshot, version
+    finally:
+        _build_lock.release()
+    return _state.snapshot
+
+
+def reset():
+    """Forget this process's snapshot; the next :func:`get` rebuilds it."""
+    with _build_lock:
+        _state.snapshot, _state.version, _state.next_check = None, None, 0.0
+
+
+def get_or_404(model, pk):
+    """A snapshot record for ``model`` with ``pk``, or the model instance without a snapshot."""
+    snapshot = get()
+    if snapshot is None:
+        return get_object_or_404(model, pk=pk)
+    record = snapshot.lookup(model, pk)
+    if record is None:
+        raise Http404(f'No {model._meta.object_name} matches the given query.')
+    return record
+
+
+def catalog_changed(changes):
+    bump_version()
+
+
+def connect_signals():
+    from . import invalidation
+
+    invalidation.listen(('genre', 'movie', 'tvshow', 'episode'), catalog_changed)
@@ -0,0 +1,45 @@
+"""System checks for settings that only go wrong under concurrent load."""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# add/incr are atomic for every process sharing the cache
+SHARED_ATOMIC_BACKENDS = {
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+}
+# Atomic, but each process has its own
+LOCMEM_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+def ratelimit_backend():
+    alias = getattr(settings, 'RATELIMIT_CACHE', 'counters')
+    return alias, settings.CACHES.get(alias, {}).get('BACKEND')
+
+
+@register(Tags.caches)
+def check_ratelimit_cache(app_configs, **kwargs):
+    if not getattr(settings, 'RATELIMIT_ENABLED', True):
+        return []
+    alias, backend = ratelimit_backend()
+    if backend in SHARED_ATOMIC_BACKENDS or backend == LOCMEM_BACKEND:
+        return []
+    return [Error(
+        f'The rate-limit cache {alias!r} ({backend}) has no atomic add/incr.',
+        hint='Parallel requests would share one slot. Set REDIS_URL or point RATELIMIT_CACHE at Redis or Memcached.',
+        id='content.E001',
+    )]
+
+
+@register(Tags.caches, deploy=True)
+def check_ratelimit_cache_is_shared(app_configs, **kwargs):
+    if not getattr(settings, 'RATELIMIT_ENABLED', True):
+        return []
+    alias, backend = ratelimit_backend()
+    if backend != LOCMEM_BACKEND:
+        return []
+    return [Error(
+        f'The rate-limit cache {alias!r} is per process, so each worker enforces its own limit.',
+        hint='Set REDIS_URL or point RATELIMIT_CACHE at Redis or Memcached.',
+        id='content.E002',
+    )]
@@ -0,0 +1,299 @@
+"""Faceted browsing over the catalog snapshot with bitmap indexes.
+
+Every facet value owns a bitmap, a Python int, over the snapshot's title
+offsets, with one set for movies and one for TV shows:
+* genres reuse the snapshot's per-genre bitsets;
+* ratings keep a cumulative "rated at least r" bitmap for each tenth of a
+  point;
+* release years keep cumulative "released in year y or later" bitmaps;
+* duration buckets keep one bitmap each; they apply to movies only.
+
+A filter combination is a few ANDs and ORs of those ints. Each facet count
+is one ``int.bit_count()``, so a full page of counts takes microseconds
+whatever the catalog size. Counts follow the usual faceting rule: each
+facet is counted with every *other* active filter applied. Genres in
+'all' mode are the exception: they drill down, so their counts include
+the genres already chosen.
+
+The index is built lazily once per snapshot (``snapshot.facets``). A
+snapshot rebuild also rebuilds it, which keeps it in sync with genre
+changes. Without a snapshot, :func:`filter_queryset` applies the same
+filters through the ORM, with no counts.
+"""
+import math
+from datetime import date
+from itertools import islice
+from urllib.parse import urlencode
+
+from .catalog import RecordList, offsets
+
+DURATION_BUCKETS = (
+    ('short', 'Under 90 min', 0, 89),
+    ('feature', '90 min to 2 hours', 90, 120),
+    ('long', 'Over 2 hours', 121, None),
+)
+RATING_BUCKETS = (
+    ('9+', 9.0, 10.0),
+    ('8 to 9', 8.0, 8.9),
+    ('7 to 8', 7.0, 7.9),
+    ('6 to 7', 6.0, 6.9),
+    ('Under 6', 0.0, 5.9),
+)
+KINDS = ('movie', 'tvshow')
+RATING_RANGE = (0.0, 10.0)
+YEAR_RANGE = (date.min.year, date.max.year)
+
+
+def tenths(value):
+    return max(0, min(100, round(value * 10)))
+
+
+class Filters:
+    """Browse filters parsed from a query string.
+
+    Invalid or non-finite numbers are ignored; ratings and years outside
+    their range are clamped to it.
+    """
+    __slots__ = ('genres', 'match', 'rating_min', 'rating_max', 'year_from', 'year_to', 'duration', 'kind')
+
+    def __init__(self, genres=(), match='all', rating_min=None, rating_max=None, year_from=None, year_to=None,
+                 duration='', kind=''):
+        self.genres = tuple(genres)
+        self.match = match if match in ('all', 'any') else 'all'
+        self.rating_min = rating_min
+        self.rating_max = rating_max
+        self.year_from = year_from
+        self.year_to = year_to
+        self.duration = duration if duration in {key for key, *_ in DURATION_BUCKETS} else ''
+        self.kind = kind if kind in KINDS else ''
+
+    @classmethod
+    def from_query(cls, query):
+        def number(name, convert, bounds):
+            try:
+                value = convert(query.get(name, ''))
+            except ValueError:
+                return None
+            if not math.isfinite(value):
+                return None
+            return min(max(value, bounds[0]), bounds[1])
+
+        genres = []
+        for value in query.getlist('genre'):
+            if value.isdigit() and int(value) not in genres:
+                genres.append(int(value))
+        return cls(
+            genres, query.get('match', 'all'),
+            number('rating_min', float, RATING_RANGE), number('rating_max', float, RATING_RANGE),
+            number('year_from', int, YEAR_RANGE), number('year_to', int, YEAR_RANGE),
+            query.get('duration', ''), query.get('kind', ''),
+        )
+
+    def as_query(self):
+        """The filters as query parameters for pagination links."""
+        params = [('genre', genre) for genre in self.genres]
+        if self.genres and self.match != 'all':
+            params.append(('match', self.match))
+        for name in ('rating_min', 'rating_max', 'year_from', 'year_to', 'duration', 'kind'):
+            value = getattr(self, name)
+            if value not in (None, ''):
+                params.append((name, value))
+        return params
+
+    @property
+    def active(self):
+        return bool(self.as_query())
+
+    def replace(self, **changes):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return Filters(**values)
+
+    def url(self, **changes):
+        """Query string for these filters with ``changes`` applied."""
+        return '?' + urlencode(self.replace(**changes).as_query())
+
+    def page_url(self, page):
+        return '?' + urlencode(self.as_query() + [('page', page)])
+
+
+class KindIndex:
+    """Bitmaps over one kind of title (movies or TV shows)."""
+
+    def __init__(self, records, genre_bits, with_duration):
+        self.records = records
+        self.all_bits = (1 << len(records)) - 1
+        self.genre_bits = genre_bits
+
+        by_tenth = [0] * 102
+        by_year = {}
+        self.durations = {key: 0 for key, *_ in DURATION_BUCKETS} if with_duration else None
+        for offset, record in enumerate(records):
+            bit = 1 << offset
+            by_tenth[tenths(record.rating)] |= bit
+            by_year[record.release_date.year] = by_year.get(record.release_date.year, 0) | bit
+            if with_duration:
+                self.durations[duration_bucket(record.duration)] |= bit
+        # rating_ge[t]: rated at least t/10; year_ge[i]: released in years[i] or later
+        self.rating_ge = by_tenth
+        for tenth in range(100, -1, -1):
+            self.rating_ge[tenth] |= self.rating_ge[tenth + 1]
+        self.years = sorted(by_year)
+        self.year_ge = [by_year[year] for year in self.years] + [0]
+        for index in range(len(self.years) - 1, -1, -1):
+            self.year_ge[index] |= self.year_ge[index + 1]
+
+    def rating_bits(self, low, high):
+        low = 0 if low is None else tenths(low)
+        high = 100 if high is None else tenths(high)
+        return self.rating_ge[low] & ~self.rating_ge[high + 1] if low <= high else 0
+
+    def year_index(self, year):
+        """Index of the first known year >= ``year``."""
+        lo, hi = 0, len(self.years)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.years[mid] < year:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def year_bits(self, first, last):
+        start = 0 if first is None else self.year_index(first)
+        stop = len(self.years) if last is None else self.year_index(last + 1)
+        return self.year_ge[start] & ~self.year_ge[stop] if start < stop else 0
+
+    def genre_match(self, genre_offsets, match):
+        if not genre_offsets:
+            return self.all_bits
+        if match == 'any':
+            bits = 0
+            for offset in genre_offsets:
+                bits |= self.genre_bits[offset]
+            return bits
+        bits = self.all_bits
+        for offset in genre_offsets:
+            bits &= self.genre_bits[offset]
+        return bits
+
+    def facet_bits(self, filters, genre_offsets):
+        """Bitmap of each active filter, by facet name."""
+        bits = {}
+        if genre_offsets:
+            bits['genres'] = self.genre_match(genre_offsets, filters.match)
+        if filters.rating_min is not None or filters.rating_max is not None:
+            bits['rating'] = self.rating_bits(filters.rating_min, filters.rating_max)
+        if filters.year_from is not None or filters.year_to is not None:
+            bits['year'] = self.year_bits(filters.year_from, filters.year_to)
+        if filters.duration:
+            bits['duration'] = self.durations[filters.duration] if self.durations is not None else 0
+        return bits
+
+
+def duration_bucket(minutes):
+    for key, _label, low, high in DURATION_BUCKETS:
+        if minutes >= low and (high is None or minutes <= high):
+            return key
+    return DURATION_BUCKETS[0][0]
+
+
+def combine(bits, all_bits, skip=None):
+    result = all_bits
+    for name, value in bits.items():
+        if name != skip:
+            result &= value
+    return result
+
+
+class FacetIndex:
+    def __init__(self, snapshot):
+        self.genres = snapshot.genres
+        self.genre_offsets = {genre.id: offset for offset, genre in enumerate(snapshot.genres)}
+        self.kinds = {
+            'movie': KindIndex(snapshot.movies, [genre.movie_bits for genre in snapshot.genres], True),
+            'tvshow': KindIndex(snapshot.tvshows, [genre.tvshow_bits for genre in snapshot.genres], False),
+        }
+
+    def search(self, filters):
+        """Matching bitmaps per kind plus facet counts for ``filters``."""
+        genre_offsets = [self.genre_offsets[genre] for genre in filters.genres if genre in self.genre_offsets]
+        kinds = [filters.kind] if filters.kind else list(KINDS)
+        matches, partial = {}, {}
+        for kind in KINDS:
+            index = self.kinds[kind]
+            bits = index.facet_bits(filters, genre_offsets)
+            partial[kind] = (index, bits)
+            matches[kind] = combine(bits, index.all_bits) if kind in kinds else 0
+
+        def count(facet, value_bits, only=None):
+            total = 0
+            for kind in (only,) if only else kinds:
+                if kind not in kinds:
+                    continue
+                index, bits = partial[kind]
+                total += (combine(bits, index.all_bits, skip=facet) & value_bits(index)).bit_count()
+            return total
+
+        drill = filters.match == 'all'
+        counts = {
+            'genres': [
+                (genre, count(None if drill else 'genres', lambda index, offset=offset: index.genre_bits[offset]))
+                for offset, genre in enumerate(self.genres)
+            ],
+            'ratings': [
+                (label, low, high, count('rating', lambda index, low=low, high=high: index.rating_bits(low, high)))
+                for label, low, high in RATING_BUCKETS
+            ],
+            'decades': self.decade_counts(count),
+            'durations': [
+                (key, label, count('duration', lambda index, key=key: index.durations[key], only='movie'))
+                for key, label, *_ in DURATION_BUCKETS
+            ],
+            'kinds': [
+                (kind, (combine(partial[kind][1], partial[kind][0].all_bits)).bit_count())
+                for kind in KINDS
+            ],
+        }
+        return matches, counts
+
+    def decade_counts(self, count):
+        years = sorted({year for index in self.kinds.values() for year in index.years})
+        decades = sorted({year // 10 * 10 for year in years}, reverse=True)
+        return [
+            (decade, count('year', lambda index, decade=decade: index.year_bits(decade, decade + 9)))
+            for decade in decades
+        ]
+
+    def page(self, kind, bits, start, size):
+        """Records for matching offsets ``start:start + size`` in catalog order."""
+        records = self.kinds[kind].records
+        return RecordList(records[offset] for offset in islice(offsets(bits), start, start + size))
+
+
+def filter_queryset(queryset, filters, kind):
+    """Apply ``filters`` to a Movie or TVShow queryset when there's no snapshot."""
+    if filters.kind and filters.kind != kind:
+        return queryset.none()
+    if filters.genres:
+        if filters.match == 'any':
+            queryset = queryset.filter(genres__in=filters.genres).distinct()
+        else:
+            for genre in filters.genres:
+                queryset = queryset.filter(genres=genre)
+    if filters.rating_min is not None:
+        queryset = queryset.filter(rating__gte=filters.rating_min)
+    if filters.rating_max is not None:
+        queryset = queryset.filter(rating__lte=filters.rating_max)
+    if filters.year_from is not None:
+        queryset = queryset.filter(release_date__year__gte=filters.year_from)
+    if filters.year_to is not None:
+        queryset = queryset.filter(release_date__year__lte=filters.year_to)
+    if filters.duration:
+        if kind != 'movie':
+            return queryset.none()
+        _key, _label, low, high = next(bucket for bucket in DURATION_BUCKETS if bucket[0] == filters.duration)
+        queryset = queryset.filter(duration__gte=low)
+        if high is not None:
+            queryset = queryset.filter(duration__lte=high)
+    return queryset
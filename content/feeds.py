@@ -0,0 +1,154 @@
+"""Precomputed per-profile home feed.
+
+The personalized rows of the home page are materialized per profile as a
+compact dict of movie ids::
+
+    {'my_list': [12, 7, 30], 'top_picks': [4, 18, 2]}
+
+stored under ``home:feed:<FEED_VERSION>:<profile_id>``. Watchlist and review
+changes rebuild the affected profiles' feeds once per committed transaction
+(see ``content.invalidation``). Bump ``FEED_VERSION`` when the structure
+changes so old entries are never read back.
+
+Each profile also has a version, ``home:feed:version:<profile_id>``: a
+random token that every change replaces before rebuilding. A feed is
+stored stamped with the version read before it was built, and served only
+while that still is the profile's version. So a feed whose rebuild was lost
+to a cache error, or one built before a later change and written after
+it, is rebuilt on the next read instead of lasting until the timeout. A
+fresh token rather than ``incr`` keeps the bump atomic on any cache.
+
+A logged-in home render is one ``get_many`` of the feed and its version,
+plus one ``in_bulk`` fetch of the movies the rows reference.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+FEED_VERSION = 1
+
+ROW_SIZE = 20
+
+
+def feed_key(profile_id):
+    return f'home:feed:{FEED_VERSION}:{profile_id}'
+
+
+def version_key(profile_id):
+    return f'home:feed:version:{profile_id}'
+
+
+def bump(profile_ids):
+    """Give profiles a new version, so feeds built before now are never served."""
+    cache.set_many({version_key(profile_id): uuid.uuid4().hex for profile_id in profile_ids}, None)
+
+
+def versions(profile_ids):
+    """Current version of each profile, giving a first one to those without."""
+    keys = {version_key(profile_id): profile_id for profile_id in profile_ids}
+    found = cache.get_many(list(keys))
+    for key in keys.keys() - found.keys():
+        cache.add(key, uuid.uuid4().hex, None)
+        found[key] = cache.get(key)
+    return {profile_id: found[key] for key, profile_id in keys.items()}
+
+
+def feed_timeout():
+    # Rows also depend on the catalog and ratings, so rebuild now and then
+    return getattr(settings, 'HOME_FEED_TIMEOUT', 60 * 60)
+
+
+def my_list_ids(profile):
+    from .models import ProfileWatchlist
+
+    return list(
+        ProfileWatchlist.objects.filter(profile=profile, movie__isnull=False)
+        .order_by('-added_at')
+        .values_list('movie_id', flat=True)[:ROW_SIZE]
+    )
+
+
+def top_pick_ids(profile, exclude):
+    """Well-rated movies in the genres of the profile's list and liked reviews."""
+    from .models import Movie, Review
+
+    liked = set(exclude) | set(
+        Review.objects.filter(user_id=profile.user_id, movie__isnull=False, rating__gte=4)
+        .values_list('movie_id', flat=True)
+    )
+    if not liked:
+        return []
+    reviewed = Review.objects.filter(user_id=profile.user_id, movie__isnull=False).values_list('movie_id', flat=True)
+    genre_ids = Movie.genres.through.objects.filter(movie_id__in=liked).values_list('genre_id', flat=True)
+    return list(
+        Movie.objects.filter(genres__in=genre_ids)
+        .exclude(id__in=liked)
+        .exclude(id__in=reviewed)
+        .annotate(shared=Count('genres'))
+        .order_by('-shared', '-rating', 'title')
+        .values_list('id', flat=True)[:ROW_SIZE]
+    )
+
+
+def build_feed(profile):
+    my_list = my_list_ids(profile)
+    return {
+        'my_list': my_list,
+        'top_picks': top_pick_ids(profile, my_list),
+    }
+
+
+def rebuild(profile_ids):
+    """Recompute and cache the feeds of some profiles."""
+    from .models import Profile
+
+    profile_ids = list(profile_ids)
+    # Read first: a change made while building must invalidate the result
+    current = versions(profile_ids)
+    feeds = {profile.id: build_feed(profile) for profile in Profile.objects.filter(id__in=profile_ids)}
+    cache.set_many(
+        {feed_key(profile_id): (current[profile_id], feed) for profile_id, feed in feeds.items()}, feed_timeout(),
+    )
+    return feeds
+
+
+def home_feed(profile_id):
+    """Personalized home rows as lists of movies: one cache read and one in_bulk."""
+    from .models import Movie
+
+    found = cache.get_many([feed_key(profile_id), version_key(profile_id)])
+    stamped = found.get(feed_key(profile_id))
+    if stamped is not None and version_key(profile_id) in found and stamped[0] == found[version_key(profile_id)]:
+        feed = stamped[1]
+    else:
+        feed = rebuild([profile_id]).get(profile_id, {})
+    movies = Movie.objects.in_bulk({movie_id for ids in feed.values() for movie_id in ids})
+    return {
+        row: [movies[movie_id] for movie_id in ids if movie_id in movies]
+        for row, ids in feed.items()
+    }
+
+
+def changed(profile_ids):
+    profile_ids = list(profile_ids)
+    bump(profile_ids)
+    rebuild(profile_ids)
+
+
+def watchlists_changed(changes):
+    changed(changes['watchlist'])
+
+
+def reviewers_changed(changes):
+    from .models import Profile
+
+    changed(Profile.objects.filter(user_id__in=changes['reviewer']).values_list('id', flat=True))
+
+
+def connect_signals():
+    from . import invalidation
+
+    invalidation.listen('watchlist', watchlists_changed)
+    invalidation.listen('reviewer', reviewers_changed)
@@ -0,0 +1,196 @@
+"""HTTP helpers shared by the static and media file endpoints.
+
+Covers validators (ETag / Last-Modified), conditional requests and single
+byte ranges. Bodies are returned as :class:`RangeFile` objects inside a
+``FileResponse``, so WSGI servers that implement ``wsgi.file_wrapper`` with
+sendfile (gunicorn, uWSGI) send the requested span straight from the page
+cache; other servers read it through an mmap in fixed-size chunks.
+"""
+import mmap
+import os
+import re
+
+from django.http import FileResponse, HttpResponse
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CHUNK_SIZE = 256 * 1024
+
+
+def file_etag(stat):
+    return quote_etag(f'{stat.st_ino:x}-{int(stat.st_mtime):x}-{stat.st_size:x}')
+
+
+def is_not_modified(request, etag, mtime):
+    """True if the client's cached copy (If-None-Match / If-Modified-Since) is current."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def range_applies(request, etag, mtime):
+    """Honour Range only if If-Range (when sent) still matches the file."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(mtime)
+
+
+def parse_range(header, size):
+    """Parse a single ``bytes=`` range.
+
+    Returns ``(start, end)`` inclusive, ``None`` to ignore the header (multiple
+    or malformed ranges, per RFC 9110 the full body is sent), or ``False``
+    when the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        if int(last) == 0:
+            return False
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def accepted_encodings(header):
+    """``{coding: q}`` from an Accept-Encoding header; ``q == 0`` means refused."""
+    accepted = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q if 0 <= q <= 1 else 0.0
+    return accepted
+
+
+def negotiate_encoding(header, available):
+    """The best of ``available`` codings (in preference order) the client accepts, or ``None``."""
+    accepted = accepted_encodings(header)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class RangeFile:
+    """Read-only view of ``length`` bytes of a file starting at ``start``.
+
+    ``fileno()``/``tell()`` expose the real descriptor and offset so a
+    sendfile-capable ``wsgi.file_wrapper`` can send the span directly.
+    """
+
+    def __init__(self, path, start=0, length=None):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.start = start
+        self.length = size - start if length is None else length
+        self.position = 0
+        self.file.seek(start)
+        self.name = path
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        except (OSError, ValueError):
+            self.map = None
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.start + self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_SET:
+            self.position = offset - self.start
+        elif whence == os.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.length + offset
+        self.position = max(0, min(self.position, self.length))
+        self.file.seek(self.start + self.position)
+        return self.tell()
+
+    def read(self, size=-1):
+        remaining = self.length - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b''
+        offset = self.start + self.position
+        if self.map is not None:
+            data = self.map[offset:offset + size]
+        else:
+            self.file.seek(offset)
+            data = self.file.read(size)
+        self.position += len(data)
+        return data
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+
+def serve_file(request, path, content_type, cache_control):
+    """Build a 200/206/304/416 response for ``path`` honouring validators and Range."""
+    with open(path, 'rb') as fh:
+        stat = os.fstat(fh.fileno())
+    etag = file_etag(stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': cache_control,
+        'Accept-Ranges': 'bytes',
+    }
+    if is_not_modified(request, etag, stat.st_mtime):
+        return apply_headers(HttpResponse(status=304), headers)
+
+    size = stat.st_size
+    start, length, status = 0, size, 200
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and range_applies(request, etag, stat.st_mtime):
+        byte_range = parse_range(range_header, size)
+        if byte_range is False:
+            headers['Content-Range'] = f'bytes */{size}'
+            return apply_headers(HttpResponse(status=416), headers)
+        if byte_range is not None:
+            start, end = byte_range
+            length, status = end - start + 1, 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    headers['Content-Type'] = content_type
+    headers['Content-Length'] = str(length)
+
+    if request.method == 'HEAD':
+        return apply_headers(HttpResponse(status=status), headers)
+    response = FileResponse(RangeFile(path, start, length), status=status)
+    response.block_size = CHUNK_SIZE
+    response.headers.pop('Content-Disposition', None)
+    return apply_headers(response, headers)
+
+
+def apply_headers(response, headers):
+    for key, value in headers.items():
+        response[key] = value
+    return response
@@ -0,0 +1,200 @@
+"""Liveness/readiness checks and the worker warm-up hook.
+
+``/healthz`` only says the process is serving. ``/readyz`` checks that every
+configured database answers, that the shared cache round-trips, and
+whether TMDB is reachable. TMDB is informational: pages never call it
+directly. It also confirms that this worker has finished :func:`warm_up`.
+Load balancers should route to a worker only once ``/readyz`` returns 200.
+
+:func:`warm_up` runs when ``netflix_clone.wsgi`` or ``netflix_clone.asgi``
+is imported (when ``WARMUP_ON_BOOT`` is set). It opens the database
+connections, compiles the URL resolver and hot templates, renders the home
+and genre pages once and builds the title search index. That fills the
+template, card and catalog caches before a real user arrives. ASGI servers
+such as uvicorn import the application inside their event loop, where the
+ORM refuses to run, so there it warms up on a thread of its own while
+``/readyz`` reports it running.
+
+``gunicorn --preload`` imports the application in the master, and the
+forked workers would inherit any connections opened there. The project's
+``gunicorn.conf.py`` exports the master's pid as ``GUNICORN_MASTER_PID``;
+an import in that process skips the warm-up, and the config's ``post_fork``
+hook warms each worker instead.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+HOT_TEMPLATES = [
+    'base.html',
+    'content/home.html',
+    'content/movie_detail.html',
+    'content/tvshow_detail.html',
+    'content/episode_detail.html',
+    'content/genre_view.html',
+    'content/search.html',
+    'content/includes/title_card_row.html',
+    'content/includes/title_card_grid.html',
+]
+
+TMDB_CHECK_INTERVAL = 60
+
+
+class WarmupState:
+    __slots__ = ('status', 'duration', 'errors')
+
+    def __init__(self):
+        self.status = 'pending'
+        self.duration = None
+        self.errors = []
+
+
+state = WarmupState()
+_tmdb_lock = threading.Lock()
+_tmdb_result = (None, None)  # (checked_at, result)
+
+
+def timed(check):
+    started = time.perf_counter()
+    try:
+        result = check()
+    except Exception as exc:
+        result = {'ok': False, 'error': f'{type(exc).__name__}: {exc}'}
+    result['ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def check_database(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return {'ok': True}
+
+
+def check_cache():
+    key = f'health:{uuid.uuid4().hex}'
+    cache.set(key, 1, 10)
+    ok = cache.get(key) == 1
+    cache.delete(key)
+    return {'ok': ok} if ok else {'ok': False, 'error': 'value did not round-trip'}
+
+
+def check_tmdb():
+    """TMDB reachability, probed at most once a minute per process."""
+    global _tmdb_result
+    from . import tmdb
+
+    if not getattr(settings, 'TMDB_API_KEY', ''):
+        return {'ok': True, 'skipped': 'TMDB_API_KEY not set'}
+    checked_at, result = _tmdb_result
+    if checked_at is not None and time.monotonic() - checked_at < TMDB_CHECK_INTERVAL:
+        return dict(result)
+    with _tmdb_lock:
+        try:
+            tmdb.ping()
+            result = {'ok': True}
+        except Exception as exc:
+            result = {'ok': False, 'error': f'{type(exc).__name__}: {exc}'}
+        _tmdb_result = (time.monotonic(), result)
+    return dict(result)
+
+
+def readiness():
+    """Run the readiness checks. Returns ``(ready, report)``."""
+    checks = {f'database:{alias}': timed(lambda alias=alias: check_database(alias)) for alias in settings.DATABASES}
+    checks['cache'] = timed(check_cache)
+    checks['tmdb'] = timed(check_tmdb)
+    critical = [result['ok'] for name, result in checks.items() if name != 'tmdb']
+    warmed = state.status in ('done', 'skipped')
+    report = {
+        'status': 'ok' if all(critical) and warmed else 'unavailable',
+        'warmup': state.status,
+        'checks': checks,
+    }
+    return report['status'] == 'ok', report
+
+
+def warm_up():
+    """Pay the cold-start costs of a fresh worker before it takes traffic."""
+    from django.contrib.auth.models import AnonymousUser
+    from django.contrib.sessions.backends.signed_cookies import SessionStore
+    from django.template.loader import get_template
+    from django.test import RequestFactory
+    from django.urls import get_resolver
+
+    from . import views
+    from .models import Genre
+
+    started = time.perf_counter()
+    state.status, state.errors = 'running', []
+
+    def step(name, func):
+        try:
+            func()
+        except Exception as exc:
+            logger.warning('Warm-up step %s failed: %s', name, exc)
+            state.errors.append(f'{name}: {type(exc).__name__}: {exc}')
+
+    def render(view, path, **kwargs):
+        request = RequestFactory().get(path)
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        view(request, **kwargs)
+
+    for alias in settings.DATABASES:
+        step(f'database:{alias}', connections[alias].ensure_connection)
+    step('urls', lambda: get_resolver().url_patterns)
+    for name in HOT_TEMPLATES:
+        step(f'template:{name}', lambda name=name: get_template(name))
+    step('page:/', lambda: render(views.home, '/'))
+    genre_ids = []
+    step('genres', lambda: genre_ids.extend(
+        Genre.objects.values_list('id', flat=True)[:getattr(settings, 'WARMUP_GENRES', 8)]
+    ))
+    for genre_id in genre_ids:
+        path = f'/genre/{genre_id}/'
+        step(f'page:{path}', lambda path=path, genre_id=genre_id: render(views.genre_view, path, genre_id=genre_id))
+    # Builds the title search index from the snapshot
+    step('page:/search/', lambda: render(views.search, '/search/?q=warm'))
+
+    state.duration = time.perf_counter() - started
+    state.status = 'done'
+    logger.info('Warm-up finished in %.0f ms (%d errors)', state.duration * 1000, len(state.errors))
+    return state
+
+
+def warm_up_in_thread():
+    try:
+        warm_up()
+    finally:
+        connections.close_all()  # this thread's own; requests never see them
+
+
+def warm_up_on_boot(forked=False):
+    """Warm up the worker importing the application; returns the thread doing it, if any.
+
+    ``forked`` is passed by the ``post_fork`` hook of a preloading gunicorn.
+    """
+    if not getattr(settings, 'WARMUP_ON_BOOT', True):
+        state.status = 'skipped'
+        return None
+    if not forked and os.environ.get('GUNICORN_MASTER_PID') == str(os.getpid()):
+        return None  # the preloading master; its workers warm up after the fork
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        warm_up()
+        return None
+    state.status = 'running'
+    thread = threading.Thread(target=warm_up_in_thread, name='warm-up', daemon=True)
+    thread.start()
+    return thread
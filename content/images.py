@@ -0,0 +1,183 @@
+"""Resized WebP/AVIF derivatives ("renditions") of uploaded posters and avatars.
+
+Each image field listed in ``IMAGE_FIELDS`` has a sibling JSON field named
+``<field>_renditions`` that records the derivatives generated for the current
+upload::
+
+    {
+        "source": "posters/inception.jpg",
+        "hash": "3f1c9a0b2d4e5f60",
+        "width": 1000,
+        "formats": {"webp": {"160": "renditions/3f1c...-160w.webp", ...}},
+    }
+
+Derivative file names embed a digest of the source bytes, so they never change
+once written and can be served with far-future cache headers. Generation runs
+off the request path as a background job once the upload is committed.
+The manifest is stored with ``QuerySet.update()``, which sends no signals,
+so the title's invalidation keys are recorded by hand; otherwise the catalog
+snapshot and memoized cards would keep the empty manifest.
+"""
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from . import invalidation
+
+logger = logging.getLogger(__name__)
+
+# model label -> image fields that get renditions
+IMAGE_FIELDS = {
+    'content.Movie': ['poster'],
+    'content.TVShow': ['poster'],
+    'content.Profile': ['avatar_image'],
+    'content.UserProfile': ['profile_picture'],
+}
+
+DEFAULT_WIDTHS = [160, 320, 640]
+DEFAULT_FORMATS = ['avif', 'webp']
+
+# Pillow format name and encoder options per output format
+ENCODERS = {
+    'avif': ('AVIF', {'quality': 50}),
+    'webp': ('WEBP', {'quality': 75, 'method': 4}),
+}
+
+MIME_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+}
+
+
+def rendition_widths():
+    return getattr(settings, 'IMAGE_RENDITION_WIDTHS', DEFAULT_WIDTHS)
+
+
+def rendition_formats():
+    """Configured output formats that this Pillow build can encode."""
+    from PIL import features
+
+    formats = getattr(settings, 'IMAGE_RENDITION_FORMATS', DEFAULT_FORMATS)
+    return [fmt for fmt in formats if fmt in ENCODERS and features.check(fmt)]
+
+
+def renditions_field(field_name):
+    return f'{field_name}_renditions'
+
+
+def build_renditions(source_name, storage=None):
+    """Generate every configured size/format of an image and return its manifest."""
+    from PIL import Image, ImageOps
+
+    storage = storage or default_storage
+    with storage.open(source_name, 'rb') as fh:
+        data = fh.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        source_width, source_height = image.size
+
+        formats = {}
+        for fmt in rendition_formats():
+            pil_format, options = ENCODERS[fmt]
+            outputs = {}
+            for width in rendition_widths():
+                if width > source_width and outputs:
+                    # Never upscale; the largest rendition covers the rest
+                    break
+                name = f'renditions/{digest}-{width}w.{fmt}'
+                if not storage.exists(name):
+                    target_width = min(width, source_width)
+                    target_height = max(1, round(source_height * target_width / source_width))
+                    resized = image.resize((target_width, target_height), Image.Resampling.LANCZOS)
+                    buffer = io.BytesIO()
+                    resized.save(buffer, pil_format, **options)
+                    name = storage.save(name, ContentFile(buffer.getvalue()))
+                outputs[str(width)] = name
+            formats[fmt] = outputs
+
+    return {
+        'source': source_name,
+        'hash': digest,
+        'width': source_width,
+        'formats': formats,
+    }
+
+
+def process_image_field(model, pk, field_name, source_name):
+    """Build renditions for one instance's image and store the manifest."""
+    try:
+        manifest = build_renditions(source_name)
+    except Exception:
+        logger.exception('Could not build renditions for %s %s.%s', model.__name__, pk, field_name)
+        return None
+    changes = {renditions_field(field_name): manifest}
+    if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+        # Retires memoized cards that still point at the original upload
+        changes['updated_at'] = timezone.now()
+    # Only record the manifest if the image wasn't replaced while we worked
+    if model._default_manager.filter(pk=pk, **{field_name: source_name}).update(**changes):
+        invalidation.record(invalidation.keys_for(model(pk=pk)))
+    return manifest
+
+
+def schedule_renditions(model, pk, field_name, source_name):
+    from .tasks import build_image_renditions
+
+    build_image_renditions.enqueue(
+        model._meta.label, pk, field_name, source_name,
+        idempotency_key=f'renditions:{model._meta.label}:{pk}:{field_name}:{source_name}',
+    )
+
+
+def image_saved(sender, instance, raw=False, **kwargs):
+    """post_save handler: queue renditions for new uploads, clear stale ones."""
+    if raw:
+        return
+    for field_name in IMAGE_FIELDS.get(sender._meta.label, []):
+        source_name = getattr(instance, field_name).name or ''
+        manifest = getattr(instance, renditions_field(field_name)) or {}
+        if manifest.get('source', '') == source_name:
+            continue
+        if not source_name:
+            sender._default_manager.filter(pk=instance.pk).update(**{renditions_field(field_name): {}})
+            setattr(instance, renditions_field(field_name), {})
+            invalidation.record(invalidation.keys_for(instance))
+            continue
+        transaction.on_commit(
+            lambda f=field_name, s=source_name: schedule_renditions(sender, instance.pk, f, s)
+        )
+
+
+def connect_signals():
+    from django.apps import apps
+
+    for label in IMAGE_FIELDS:
+        post_save.connect(image_saved, sender=apps.get_model(label), dispatch_uid=f'renditions-{label}')
+
+
+def srcset(manifest, fmt):
+    """``srcset`` attribute value for one format of a rendition manifest."""
+    outputs = (manifest or {}).get('formats', {}).get(fmt) or {}
+    return ', '.join(
+        f'{default_storage.url(name)} {width}w'
+        for width, name in sorted(outputs.items(), key=lambda item: int(item[0]))
+    )
+
+
+def smallest_url(manifest, fmt='webp'):
+    outputs = (manifest or {}).get('formats', {}).get(fmt) or {}
+    if not outputs:
+        return ''
+    width = min(outputs, key=int)
+    return default_storage.url(outputs[width])
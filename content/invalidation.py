@@ -0,0 +1,288 @@
+"""Signal-driven cache invalidation, coalesced per transaction and shared
+across worker processes.
+
+Saving or deleting a Movie, TVShow, Episode, Genre, VideoRendition, Review
+or ProfileWatchlist, or changing a title's genres, records *keys* such as
+``('movie', 12)`` or ``('watchlist', 7)``; see :func:`keys_for`. The keys of
+a transaction collect in a per-thread pending set, and one
+``on_commit`` flush publishes them all, so a request saving ten rows
+publishes once. A rolled back transaction publishes nothing of its own.
+Its keys stay pending and go out with the thread's next commit, and keys
+recorded inside a rolled-back savepoint go out with the rest of the
+transaction: invalidating too much is harmless.
+
+A publish reaches two kinds of handlers. Both get ``{topic: {ids}}``
+restricted to the topics they registered for:
+* :func:`listen` handlers run once, in the committing process. They suit
+  shared state, such as the catalog version counter or the per-profile
+  feeds in the cache.
+* :func:`subscribe` handlers run in *every* process and drop process-local
+  caches. The publishing process calls them straight away. Others learn
+  of the keys through the ``InvalidationEvent`` table: each publish inserts
+  its keys in chunks of ``INVALIDATION_CHUNK_SIZE``, and the rows'
+  autoincrement ids are the channel's sequence numbers. :func:`poll` runs
+  from ``InvalidationMiddleware`` at most every
+  ``INVALIDATION_POLL_INTERVAL`` seconds. It reads the rows from the last id
+  it saw onwards in one indexed query on the primary.
+
+The database hands out each id once, however many workers publish at the
+same moment, so no event can overwrite another. Ids can still become
+visible out of order: a publisher whose insert hasn't committed holds a
+lower id than one that has. Nothing after such a gap is delivered until it
+fills, or until ``INVALIDATION_GAP_TIMEOUT`` seconds pass and the missing
+event counts as lost (its transaction rolled back).
+
+A process cannot always trust that it has seen every event:
+* the last event it read is gone, because it was pruned or the table was
+  emptied;
+* more than ``INVALIDATION_MAX_BACKLOG`` events are waiting;
+* a gap outlived the timeout.
+In each case subscribers get ``None`` and drop everything. Publishers prune
+events older than ``INVALIDATION_EVENT_TIMEOUT`` seconds as they go.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Publishers prune old events once per this many
+PRUNE_EVERY = 100
+
+
+def keys_for(instance):
+    """The invalidation keys a saved or deleted ``instance`` touches."""
+    name = instance._meta.model_name
+    if name in ('movie', 'tvshow', 'genre'):
+        return {(name, instance.pk)}
+    if name == 'episode':
+        return {('episode', instance.pk), ('tvshow', instance.tv_show_id)}
+    if name == 'videorendition':
+        return {('episode', instance.episode_id)}
+    if name == 'review':
+        keys = {('reviewer', instance.user_id)}
+        if instance.movie_id:
+            keys.add(('movie-reviews', instance.movie_id))
+        if instance.tv_show_id:
+            keys.add(('tvshow-reviews', instance.tv_show_id))
+        return keys
+    if name == 'profilewatchlist':
+        return {('watchlist', instance.profile_id)}
+    return set()
+
+
+class Pending(threading.local):
+    def __init__(self):
+        self.keys = defaultdict(set)  # database alias -> keys
+
+
+_pending = Pending()
+
+
+def record(keys, using='default'):
+    """Publish ``keys`` once the current transaction on ``using`` commits."""
+    if not keys:
+        return
+    _pending.keys[using].update(keys)
+    # One callback per write: a savepoint rollback discards only its own,
+    # and the first callback left at commit flushes everything pending
+    transaction.on_commit(lambda: flush(using), using=using)
+
+
+def flush(using='default'):
+    keys = _pending.keys.pop(using, None)
+    if keys:
+        publish(keys)
+
+
+def model_changed(sender, instance, raw=False, using='default', **kwargs):
+    if not raw:
+        record(keys_for(instance), using)
+
+
+def genres_changed(sender, instance, action, reverse, model, pk_set, using='default', **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # genre.movies.add(...): instance is the Genre, pk_set the titles
+        keys = {('genre', instance.pk)} | {(model._meta.model_name, pk) for pk in pk_set or ()}
+    else:
+        keys = {(instance._meta.model_name, instance.pk)} | {('genre', pk) for pk in pk_set or ()}
+    record(keys, using)
+
+
+_listeners = []
+_subscribers = []
+
+
+def listen(topics, handler):
+    """Call ``handler({topic: ids})`` in the committing process after each publish touching ``topics``."""
+    _listeners.append((frozenset([topics] if isinstance(topics, str) else topics), handler))
+
+
+def subscribe(topics, handler):
+    """Call ``handler({topic: ids})``, or ``handler(None)`` to drop everything, in every process."""
+    _subscribers.append((frozenset([topics] if isinstance(topics, str) else topics), handler))
+
+
+def group(keys):
+    changes = defaultdict(set)
+    for topic, ident in keys:
+        changes[topic].add(ident)
+    return changes
+
+
+def dispatch(handlers, changes):
+    for topics, handler in handlers:
+        if changes is None:
+            selected = None
+        else:
+            selected = {topic: ids for topic, ids in changes.items() if topic in topics}
+            if not selected:
+                continue
+        try:
+            handler(selected)
+        except Exception:
+            logger.exception('Invalidation handler %r failed', handler)
+
+
+class State:
+    __slots__ = ('last_seq', 'next_poll', 'gap_since', 'own', 'lock')
+
+    def __init__(self):
+        self.last_seq = None
+        self.next_poll = 0.0
+        self.gap_since = None
+        self.own = set()  # sequence numbers this process published
+        self.lock = threading.Lock()
+
+
+_state = State()
+
+
+def latest_sequence():
+    from .models import InvalidationEvent
+
+    return InvalidationEvent.objects.using(DEFAULT_DB_ALIAS).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def prune():
+    """Delete the events every process has had time to read."""
+    from .models import InvalidationEvent
+
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'INVALIDATION_EVENT_TIMEOUT', 300))
+    return InvalidationEvent.objects.using(DEFAULT_DB_ALIAS).filter(created_at__lt=cutoff).delete()[0]
+
+
+def publish(keys):
+    """Run the listeners, write ``keys`` to the channel and notify local subscribers."""
+    from .models import InvalidationEvent
+
+    changes = group(keys)
+    dispatch(_listeners, changes)
+    encoded = sorted(f'{topic}:{ident}' for topic, ident in keys)
+    size = getattr(settings, 'INVALIDATION_CHUNK_SIZE', 500)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        seqs = [
+            InvalidationEvent.objects.using(DEFAULT_DB_ALIAS).create(keys=encoded[start:start + size]).id
+            for start in range(0, len(encoded), size)
+        ]
+    with _state.lock:
+        if _state.last_seq is not None:
+            # So poll() doesn't deliver them a second time; a process that
+            # never polled starts reading after them anyway
+            _state.own.update(seqs)
+    dispatch(_subscribers, changes)
+    if any(seq % PRUNE_EVERY == 0 for seq in seqs):
+        prune()
+    return seqs
+
+
+def decode(entry):
+    topic, _, ident = entry.rpartition(':')
+    return topic, int(ident) if ident.isdigit() else ident
+
+
+def poll(force=False):
+    """Deliver other processes' events to this process's subscribers."""
+    from .models import InvalidationEvent
+
+    now = time.monotonic()
+    if not force and now < _state.next_poll:
+        return
+    if not _state.lock.acquire(blocking=False):
+        return  # another thread of this process is polling
+    try:
+        _state.next_poll = now + getattr(settings, 'INVALIDATION_POLL_INTERVAL', 1.0)
+        if _state.last_seq is None:
+            # A fresh process has nothing cached yet
+            _state.last_seq = latest_sequence()
+            return
+        backlog = getattr(settings, 'INVALIDATION_MAX_BACKLOG', 1000)
+        # Starting from the last event read, which shows nothing was pruned in between
+        rows = list(
+            InvalidationEvent.objects.using(DEFAULT_DB_ALIAS).filter(id__gte=_state.last_seq)
+            .order_by('id').values_list('id', 'keys')[:backlog + 2]
+        )
+        if _state.last_seq:
+            if not rows or rows[0][0] != _state.last_seq:
+                resync(latest_sequence())
+                return
+            rows = rows[1:]
+        if len(rows) > backlog:
+            resync(latest_sequence())
+            return
+        keys = set()
+        for seq, entries in rows:
+            if seq != _state.last_seq + 1:
+                if _state.gap_since is None:
+                    _state.gap_since = now
+                if now - _state.gap_since < getattr(settings, 'INVALIDATION_GAP_TIMEOUT', 5.0):
+                    break  # not committed yet; retry next poll
+                logger.warning('Invalidation event %d is missing; dropping all local caches', _state.last_seq + 1)
+                resync(latest_sequence())
+                return
+            _state.gap_since = None
+            if seq in _state.own:
+                _state.own.discard(seq)
+            else:
+                keys.update(decode(entry) for entry in entries)
+            _state.last_seq = seq
+        if keys:
+            dispatch(_subscribers, group(keys))
+    finally:
+        _state.lock.release()
+
+
+def resync(head):
+    _state.last_seq, _state.gap_since = head, None
+    _state.own = {seq for seq in _state.own if seq > head}
+    dispatch(_subscribers, None)
+
+
+def reset():
+    """Forget pending keys and this process's channel position."""
+    _pending.keys.clear()
+    with _state.lock:
+        _state.last_seq, _state.next_poll, _state.gap_since = None, 0.0, None
+        _state.own.clear()
+
+
+def connect_signals():
+    from .models import Episode, Genre, Movie, ProfileWatchlist, Review, TVShow, VideoRendition
+
+    for model in (Genre, Movie, TVShow, Episode, VideoRendition, Review, ProfileWatchlist):
+        name = model._meta.model_name
+        post_save.connect(model_changed, sender=model, dispatch_uid=f'invalidation-{name}-save')
+        post_delete.connect(model_changed, sender=model, dispatch_uid=f'invalidation-{name}-delete')
+    for model in (Movie, TVShow):
+        m2m_changed.connect(
+            genres_changed, sender=model.genres.through, dispatch_uid=f'invalidation-{model._meta.model_name}-genres',
+        )
@@ -0,0 +1,450 @@
+"""Load testing with scripted user journeys.
+
+``manage.py load_test`` starts the site under a real server and runs
+closed-loop virtual users against it, one thread each. Every user:
+1. logs in through the login form (``/admin/login/``, the site's only one);
+2. opens the profile picker and picks a profile;
+3. runs a handful of weighted journeys (:data:`JOURNEYS`), such as browsing
+   home and detail pages, searching with the occasional typo, toggling a
+   watchlist entry, or reviewing a title;
+4. starts over with fresh cookies, so logins stay a realistic share of
+   traffic.
+
+Each request is timed with its journey step. :class:`Stats` reports
+throughput, error rate and latency percentiles per run and per step. A 429
+from the rate limiter is counted as *throttled* rather than as an error.
+Any other status the step didn't expect is an error: a 403 from a missing
+CSRF token, a 404, a 5xx. Connection failures count as errors too.
+
+TMDB is replaced by :class:`TmdbStub`, a local HTTP server that answers the
+three endpoints ``content.tmdb`` uses after an injected delay, and can be
+made to fail a fraction of the time. The server and job workers under test
+reach it through ``TMDB_API_URL``.
+
+Load-test users are named ``loadtest-<n>``. They are staff accounts, since
+the admin login form refuses anyone else, and have no permissions. Each run
+gives them all a fresh random password (one PBKDF2 run for the lot), so
+accounts left behind by ``--keep-users`` or a killed run can't be signed
+into afterwards. :func:`clean_up` deletes them along with their reviews and
+lists, and drops the TMDB details the stub supplied from the cache. Entries
+fetched from anywhere else, such as the real TMDB behind a ``--url``
+server, stay.
+"""
+import hashlib
+import http.client
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from http.cookies import CookieError, SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from django.urls import reverse
+
+USER_PREFIX = 'loadtest-'
+PERCENTILES = (50, 90, 95, 99)
+
+_profile_link = re.compile(r'href="(/profiles/use/\d+/)"')
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile ``q`` (0-100) of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+class Stats:
+    """Latency samples and outcomes per journey step; safe to share between users.
+
+    Requests that start before ``started`` (the warm-up) are not recorded.
+    """
+
+    def __init__(self, started=0.0):
+        self.started = started
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)  # step -> seconds
+        self.outcomes = defaultdict(Counter)  # step -> Counter of ok/error/throttled
+        self.statuses = Counter()  # unexpected statuses, None for connection errors
+
+    def record(self, step, status, expected, start, elapsed):
+        if start < self.started:
+            return
+        if status in expected:
+            outcome = 'ok'
+        elif status == 429:
+            outcome = 'throttled'
+        else:
+            outcome = 'error'
+        with self.lock:
+            self.latencies[step].append(elapsed)
+            self.outcomes[step][outcome] += 1
+            if outcome == 'error':
+                self.statuses[status] += 1
+
+    def summarize(self, latencies, outcomes, window):
+        latencies = sorted(latencies)
+        requests = len(latencies)
+        summary = {
+            'requests': requests,
+            'throughput': requests / window if window else 0.0,
+            'errors': outcomes['error'],
+            'error_rate': outcomes['error'] / requests if requests else 0.0,
+            'throttled': outcomes['throttled'],
+            'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+        }
+        for q in PERCENTILES:
+            summary[f'p{q}_ms'] = percentile(latencies, q) * 1000
+        return summary
+
+    def summary(self, window):
+        """Totals plus a per-step breakdown for a measured ``window`` of seconds."""
+        with self.lock:
+            everything, outcomes = [], Counter()
+            for step, latencies in self.latencies.items():
+                everything += latencies
+                outcomes.update(self.outcomes[step])
+            result = self.summarize(everything, outcomes, window)
+            result['steps'] = {
+                step: self.summarize(latencies, self.outcomes[step], window)
+                for step, latencies in sorted(self.latencies.items())
+            }
+            result['statuses'] = {str(status): count for status, count in self.statuses.most_common()}
+        return result
+
+
+class Client:
+    """One virtual user's cookie jar.
+
+    Every request opens its own connection. Keep-alive against the
+    development server stalls each response on a delayed ACK (the headers
+    and body go out as separate small writes), which adds ~40 ms and would
+    swamp what's being measured; a loopback connect costs well under 1 ms.
+    """
+
+    def __init__(self, base_url, stats, timeout=30):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.origin = f'http://{self.host}:{self.port}'
+        self.stats = stats
+        self.timeout = timeout
+        self.cookies = {}
+        self.page = '/'  # sent as the Referer of form posts, like a browser
+
+    def get(self, step, path, expected=(200,)):
+        status, body = self.request(step, 'GET', path, None, expected)
+        if status == 200:
+            self.page = path
+        return status, body
+
+    def post(self, step, path, data, expected=(302,)):
+        data = dict(data, csrfmiddlewaretoken=self.cookies.get('csrftoken', ''))
+        return self.request(step, 'POST', path, urlencode(data), expected)
+
+    def request(self, step, method, path, body, expected):
+        """Send one request and record it; returns ``(status, text)``, or ``(None, '')`` if the connection failed."""
+        headers = {'Connection': 'close'}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['Referer'] = self.origin + self.page
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException):
+            self.stats.record(step, None, expected, start, time.perf_counter() - start)
+            return None, ''
+        finally:
+            connection.close()
+        elapsed = time.perf_counter() - start
+        self.store_cookies(response.headers.get_all('Set-Cookie') or ())
+        self.stats.record(step, response.status, expected, start, elapsed)
+        return response.status, payload.decode('utf-8', 'replace')
+
+    def store_cookies(self, headers):
+        for header in headers:
+            try:
+                cookie = SimpleCookie(header)
+            except CookieError:
+                continue
+            for name, morsel in cookie.items():
+                if morsel['max-age'] == '0' or not morsel.value:
+                    self.cookies.pop(name, None)  # deleted, e.g. the session on logout
+                else:
+                    self.cookies[name] = morsel.value
+
+
+class Workload:
+    """Titles and search terms the journeys pick from."""
+
+    def __init__(self, movies, tvshows, terms):
+        self.movies = movies  # ids
+        self.tvshows = tvshows
+        self.terms = terms
+
+    @classmethod
+    def from_database(cls, sample=500):
+        from .models import Movie, TVShow
+
+        movies = list(Movie.objects.order_by('?').values_list('id', 'title')[:sample])
+        tvshows = list(TVShow.objects.order_by('?').values_list('id', flat=True)[:sample])
+        terms = sorted({word for _id, title in movies for word in title.split() if len(word) > 3})
+        return cls([pk for pk, _title in movies], tvshows, terms or ['the'])
+
+    def search_term(self, rng):
+        term = rng.choice(self.terms)
+        if len(term) > 4 and rng.random() < 0.3:
+            # Swap two letters, as people do
+            i = rng.randrange(len(term) - 1)
+            term = term[:i] + term[i + 1] + term[i] + term[i + 2:]
+        return term
+
+
+class VirtualUser:
+    def __init__(self, base_url, stats, workload, username, password, rng, think=0.0):
+        self.base_url = base_url
+        self.stats = stats
+        self.workload = workload
+        self.username = username
+        self.password = password
+        self.rng = rng
+        self.think = think
+        self.client = None
+
+    def pause(self):
+        if self.think:
+            time.sleep(self.rng.expovariate(1 / self.think))
+
+    def run(self, deadline):
+        while time.perf_counter() < deadline:
+            self.client = Client(self.base_url, self.stats)
+            if not self.sign_in():
+                self.pause()
+                continue
+            for _ in range(self.rng.randint(5, 15)):
+                if time.perf_counter() >= deadline:
+                    break
+                journey = self.rng.choices([name for name, _weight in JOURNEYS], [w for _name, w in JOURNEYS])[0]
+                getattr(self, journey)()
+
+    def sign_in(self):
+        """Log in and pick a profile; False if either failed."""
+        login = reverse('admin:login') + '?' + urlencode({'next': reverse('profile_select')})
+        self.client.get('login_form', login)
+        status, _body = self.client.post('login', login, {'username': self.username, 'password': self.password})
+        if status != 302:
+            return False
+        self.pause()
+        status, page = self.client.get('profile_select', reverse('profile_select'))
+        links = _profile_link.findall(page)
+        if not links:
+            return False
+        self.pause()
+        status, _body = self.client.get('profile_use', self.rng.choice(links), expected=(302,))
+        return status == 302
+
+    def movie(self):
+        return self.rng.choice(self.workload.movies)
+
+    def browse(self):
+        self.client.get('home', reverse('home'))
+        self.pause()
+        self.client.get('movie_detail', reverse('movie_detail', args=[self.movie()]))
+        if self.workload.tvshows:
+            self.pause()
+            self.client.get('tvshow_detail', reverse('tvshow_detail', args=[self.rng.choice(self.workload.tvshows)]))
+        self.pause()
+
+    def search(self):
+        self.client.get('search', reverse('search') + '?' + urlencode({'q': self.workload.search_term(self.rng)}))
+        self.pause()
+        self.client.get('movie_detail', reverse('movie_detail', args=[self.movie()]))
+        self.pause()
+
+    def watchlist(self):
+        movie = self.movie()
+        data = {'content_type': 'movie', 'content_id': movie}
+        self.client.get('movie_detail', reverse('movie_detail', args=[movie]))
+        self.pause()
+        self.client.post('watchlist_add', reverse('add_to_watchlist'), data)
+        self.pause()
+        self.client.get('watchlist', reverse('watchlist'))
+        self.pause()
+        self.client.post('watchlist_remove', reverse('remove_from_watchlist'), data)
+        self.pause()
+
+    def review(self):
+        movie = self.movie()
+        self.client.get('movie_detail', reverse('movie_detail', args=[movie]))
+        self.pause()
+        self.client.post('review', reverse('add_review'), {
+            'content_type': 'movie', 'content_id': movie, 'rating': self.rng.randint(1, 5), 'comment': 'Load test',
+        })
+        self.pause()
+
+
+# (VirtualUser method, relative weight)
+JOURNEYS = (
+    ('browse', 5),
+    ('search', 3),
+    ('watchlist', 2),
+    ('review', 1),
+)
+
+
+def run(base_url, workload, usernames, password, concurrency, duration, warmup=0.0, think=0.0, seed=None):
+    """Run ``concurrency`` virtual users for ``warmup + duration`` seconds; returns the measured summary."""
+    rng = random.Random(seed)
+    now = time.perf_counter()
+    stats = Stats(started=now + warmup)
+    deadline = stats.started + duration
+    users = [
+        VirtualUser(
+            base_url, stats, workload, usernames[n % len(usernames)], password, random.Random(rng.random()), think,
+        )
+        for n in range(concurrency)
+    ]
+    threads = [threading.Thread(target=user.run, args=(deadline,), daemon=True) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats.summary(duration)
+
+
+def ensure_users(count, password):
+    """Usernames of ``count`` load-test users, each with one profile, creating any that are missing.
+
+    All of them, old and new, get ``password``.
+    """
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+
+    from .models import Profile
+
+    usernames = [f'{USER_PREFIX}{n}' for n in range(count)]
+    encoded = make_password(password)
+    User.objects.filter(username__in=usernames).update(password=encoded)
+    existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    missing = [name for name in usernames if name not in existing]
+    if missing:
+        User.objects.bulk_create(User(username=name, password=encoded, is_staff=True) for name in missing)
+    Profile.objects.bulk_create(
+        Profile(user=user, name='Main') for user in User.objects.filter(username__in=usernames, profiles__isnull=True)
+    )
+    return usernames
+
+
+def clean_up(workload, stub):
+    """Delete the load-test users (with their reviews and lists) and the TMDB details ``stub`` supplied."""
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+
+    from .tmdb import movie_cache_key
+
+    if stub.served:
+        cached = cache.get_many([movie_cache_key(pk) for pk in workload.movies])
+        cache.delete_many([
+            key for key, context in cached.items()
+            if (context.get('tmdb') or {}).get('id') in stub.served
+        ])
+    return User.objects.filter(username__startswith=USER_PREFIX).delete()[0]
+
+
+class TmdbStub:
+    """Local stand-in for the TMDB API with injected latency and failures.
+
+    Answers ``configuration``, ``search/movie`` and ``movie/<id>`` under
+    :attr:`url`. Each response waits a normally distributed ``latency``
+    (seconds, with ``jitter`` as the standard deviation). ``error_rate`` of
+    the requests get a 503 instead.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.05, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()  # endpoint -> requests, plus 'failed'
+        self.served = set()  # ids of the movie details answered
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/3'
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def handle(self, request):
+        parts = urlsplit(request.path)
+        params = {name: values[0] for name, values in parse_qs(parts.query).items()}
+        path = parts.path.removeprefix('/3/')
+        with self.lock:
+            delay = max(0.0, self.rng.gauss(self.latency, self.jitter))
+            failed = self.rng.random() < self.error_rate
+            endpoint = 'movie' if path.startswith('movie/') else path
+            self.calls[endpoint] += 1
+            if failed:
+                self.calls['failed'] += 1
+        time.sleep(delay)
+        if failed:
+            return self.respond(request, 503, {'status_message': 'Injected failure'})
+        if not params.get('api_key'):
+            return self.respond(request, 401, {'status_message': 'Invalid API key'})
+        if path == 'configuration':
+            return self.respond(request, 200, {'images': {'base_url': 'http://image.tmdb.org/t/p/'}})
+        if path == 'search/movie':
+            query = params.get('query', '')
+            # A stable fake id per title
+            tmdb_id = int(hashlib.md5(query.encode()).hexdigest()[:8], 16)
+            return self.respond(request, 200, {'results': [{'id': tmdb_id, 'title': query}] if query else []})
+        if path.startswith('movie/') and path[6:].isdigit():
+            tmdb_id = int(path[6:])
+            with self.lock:
+                self.served.add(tmdb_id)
+            return self.respond(request, 200, {
+                'id': tmdb_id,
+                'overview': 'Served by the load-test TMDB stub.',
+                'poster_path': f'/stub-{tmdb_id}.jpg',
+                'backdrop_path': f'/stub-{tmdb_id}-backdrop.jpg',
+                'images': {'backdrops': [], 'posters': []},
+                'videos': {'results': [{'site': 'YouTube', 'key': f'stub{tmdb_id}', 'type': 'Trailer'}]},
+            })
+        return self.respond(request, 404, {'status_message': 'Not found'})
+
+    def respond(self, request, status, payload):
+        body = json.dumps(payload).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
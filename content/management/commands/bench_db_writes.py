@@ -0,0 +1,111 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from netflix_clone.database import SQLITE_PRAGMAS
+
+SCHEMA = '''
+CREATE TABLE review (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    movie_id INTEGER NOT NULL,
+    rating INTEGER NOT NULL,
+    comment TEXT NOT NULL
+);
+CREATE INDEX review_movie ON review (movie_id);
+'''
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent SQLite writes/reads with default settings vs the tuned profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writes', type=int, default=200, help='Transactions per writer')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"profile":10}{"writes/s":>12}{"reads/s":>12}{"locked":>10}{"seconds":>10}')
+        for profile in ('default', 'tuned'):
+            result = self.run_profile(profile, options['writers'], options['readers'], options['writes'])
+            self.stdout.write(
+                f'{profile:10}{result["writes_per_sec"]:>12,.0f}{result["reads_per_sec"]:>12,.0f}'
+                f'{result["locked"]:>10}{result["elapsed"]:>10.2f}'
+            )
+
+    def connect(self, path, profile):
+        if profile == 'tuned':
+            conn = sqlite3.connect(path, timeout=SQLITE_PRAGMAS['busy_timeout'] / 1000, isolation_level=None)
+            for name, value in SQLITE_PRAGMAS.items():
+                conn.execute(f'PRAGMA {name} = {value}')
+        else:
+            # Django's defaults: rollback journal, synchronous=FULL, deferred BEGIN
+            conn = sqlite3.connect(path, isolation_level=None)
+        return conn
+
+    def run_profile(self, profile, writers, readers, writes):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.sqlite3')
+            setup = self.connect(path, profile)
+            setup.executescript(SCHEMA)
+            setup.close()
+
+            counters = {'writes': 0, 'reads': 0, 'locked': 0}
+            lock = threading.Lock()
+            done = threading.Event()
+            begin = 'BEGIN IMMEDIATE' if profile == 'tuned' else 'BEGIN'
+
+            def writer(worker):
+                conn = self.connect(path, profile)
+                for i in range(writes):
+                    try:
+                        conn.execute(begin)
+                        conn.execute('SELECT COUNT(*) FROM review WHERE movie_id = ?', (i % 50,)).fetchone()
+                        conn.execute(
+                            'INSERT INTO review (user_id, movie_id, rating, comment) VALUES (?, ?, ?, ?)',
+                            (worker, i % 50, i % 5 + 1, 'Benchmark review'),
+                        )
+                        conn.execute('COMMIT')
+                        with lock:
+                            counters['writes'] += 1
+                    except sqlite3.OperationalError:
+                        if conn.in_transaction:
+                            conn.execute('ROLLBACK')
+                        with lock:
+                            counters['locked'] += 1
+                conn.close()
+
+            def reader():
+                conn = self.connect(path, profile)
+                while not done.is_set():
+                    try:
+                        conn.execute('SELECT AVG(rating) FROM review WHERE movie_id = 7').fetchone()
+                        with lock:
+                            counters['reads'] += 1
+                    except sqlite3.OperationalError:
+                        with lock:
+                            counters['locked'] += 1
+                conn.close()
+
+            threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+            read_threads = [threading.Thread(target=reader) for _ in range(readers)]
+            start = time.perf_counter()
+            for thread in read_threads + threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            done.set()
+            for thread in read_threads:
+                thread.join()
+
+        return {
+            'writes_per_sec': counters['writes'] / elapsed,
+            'reads_per_sec': counters['reads'] / elapsed,
+            'locked': counters['locked'],
+            'elapsed': elapsed,
+        }
@@ -0,0 +1,80 @@
+import http.client
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.test import override_settings
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Measure media endpoint throughput for concurrent clients seeking through a video file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=64, help='Video file size in MiB')
+        parser.add_argument('--clients', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=50, help='Range requests per client')
+        parser.add_argument('--chunk', type=int, default=1024, help='Bytes per range request, in KiB')
+
+    def handle(self, *args, **options):
+        size = options['size'] * 1024 * 1024
+        chunk = options['chunk'] * 1024
+        with tempfile.TemporaryDirectory() as root, override_settings(MEDIA_ROOT=root, ALLOWED_HOSTS=['*']):
+            with open(os.path.join(root, 'episode.mp4'), 'wb') as fh:
+                fh.write(os.urandom(size))
+            server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+            server.set_app(WSGIHandler())
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                port = server.server_address[1]
+                started = time.perf_counter()
+                with ThreadPoolExecutor(options['clients']) as pool:
+                    results = list(pool.map(
+                        lambda seed: self.client(port, seed, size, chunk, options['requests']),
+                        range(options['clients']),
+                    ))
+                elapsed = time.perf_counter() - started
+            finally:
+                server.shutdown()
+                server.server_close()
+
+        requests = sum(count for count, _bytes in results)
+        sent = sum(received for _count, received in results)
+        self.stdout.write(
+            f'{options["clients"]} clients, {requests} range requests of {options["chunk"]} KiB '
+            f'into a {options["size"]} MiB file'
+        )
+        self.stdout.write(f'  {requests / elapsed:,.0f} req/s, {sent / elapsed / 2 ** 20:,.1f} MiB/s')
+        self.stdout.write(
+            f'  {sent / 2 ** 20:,.1f} MiB sent; whole-file responses would have sent '
+            f'{requests * size / 2 ** 20:,.1f} MiB'
+        )
+
+    @staticmethod
+    def client(port, seed, size, chunk, count):
+        rng = random.Random(seed)
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        received = 0
+        try:
+            for _ in range(count):
+                start = rng.randrange(0, size - chunk)
+                connection.request('GET', '/media/episode.mp4', headers={'Range': f'bytes={start}-{start + chunk - 1}'})
+                response = connection.getresponse()
+                body = response.read()
+                if response.status != 206 or len(body) != chunk:
+                    raise RuntimeError(f'Unexpected response {response.status} with {len(body)} bytes')
+                received += len(body)
+        finally:
+            connection.close()
+        return count, received
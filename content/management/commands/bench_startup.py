@@ -0,0 +1,69 @@
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+# Run in a fresh interpreter; prints seconds from first import to a ready app
+BOOT_SCRIPTS = {
+    'web worker': (
+        'import time; t = time.perf_counter()\n'
+        'from django.core.wsgi import get_wsgi_application\n'
+        'get_wsgi_application()\n'
+        'from django.urls import get_resolver; get_resolver().url_patterns\n'
+        'print(time.perf_counter() - t)\n'
+    ),
+    'job worker': (
+        'import time; t = time.perf_counter()\n'
+        'import django; django.setup()\n'
+        'from content import taskqueue; taskqueue.registry\n'
+        'print(time.perf_counter() - t)\n'
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure import time of `manage.py check` and how long web/job workers take to boot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--top', type=int, default=10, help='Slowest project modules to list')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'netflix_clone.settings'))
+        cwd = str(settings.BASE_DIR)
+
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', 'manage.py', 'check'],
+            cwd=cwd, env=env, capture_output=True, text=True,
+        )
+        modules = []
+        for line in result.stderr.splitlines():
+            match = IMPORTTIME_RE.match(line)
+            if match:
+                self_us, cumulative_us, indent, name = match.groups()
+                modules.append((name, int(self_us), int(cumulative_us), len(indent) == 1))
+        total = sum(cumulative for _name, _self, cumulative, top_level in modules if top_level)
+        self.stdout.write(f'manage.py check imports: {len(modules)} modules, {total / 1000:.1f} ms')
+        project = [row for row in modules if row[0].split('.')[0] in ('content', 'netflix_clone')]
+        for name, _self_us, cumulative_us, _top in sorted(project, key=lambda row: row[2], reverse=True)[:options['top']]:
+            self.stdout.write(f'  {cumulative_us / 1000:>7.1f} ms  {name}')
+
+        for label, script in BOOT_SCRIPTS.items():
+            timings = []
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                output = subprocess.run(
+                    [sys.executable, '-c', script], cwd=cwd, env=env, capture_output=True, text=True, check=True,
+                ).stdout
+                wall = time.perf_counter() - started
+                timings.append((float(output.strip().splitlines()[-1]), wall))
+            ready = statistics.median(timing[0] for timing in timings) * 1000
+            wall = statistics.median(timing[1] for timing in timings) * 1000
+            self.stdout.write(f'{label}: ready in {ready:.0f} ms (process wall time {wall:.0f} ms)')
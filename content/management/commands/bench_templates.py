@@ -0,0 +1,77 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from content.models import Movie, TVShow
+from content.templatetags.content_cards import clear_cards
+
+PLAIN_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+CACHED_LOADERS = [('django.template.loaders.cached.Loader', PLAIN_LOADERS)]
+
+
+def templates(loaders):
+    engine = dict(settings.TEMPLATES[0])
+    engine['OPTIONS'] = dict(engine['OPTIONS'], loaders=loaders)
+    engine.pop('APP_DIRS', None)
+    return [engine]
+
+
+def catalog():
+    """60 unsaved titles split across the home page rows."""
+    now = timezone.now()
+    movies = [Movie(id=i, title=f'Movie {i}', rating=7.5, updated_at=now) for i in range(1, 31)]
+    tvshows = [TVShow(id=i, title=f'Show {i}', rating=8.0, updated_at=now) for i in range(1, 31)]
+    return {
+        'featured_movies': movies[:6],
+        'featured_tvshows': tvshows[:6],
+        'genres': [],
+        'recent_movies': movies[6:],
+        'recent_tvshows': tvshows[6:],
+        'my_list_movies': [],
+        'top_picks': [],
+        'continue_watching': [],
+        'trending': [],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Measure home page render time with 60 title cards under different template setups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--renders', type=int, default=200)
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        context = catalog()
+
+        setups = [
+            ('uncached loader', PLAIN_LOADERS, 0),
+            ('cached loader', CACHED_LOADERS, 0),
+            ('cached loader + card memo', CACHED_LOADERS, 2000),
+        ]
+        self.stdout.write(f'{"":28}{"median ms":>12}{"p95 ms":>10}')
+        for label, loaders, memo_size in setups:
+            with override_settings(TEMPLATES=templates(loaders), CARD_MEMO_SIZE=memo_size, DEBUG=False):
+                clear_cards()
+                render_to_string('content/home.html', context, request=request)  # warm up
+                timings = []
+                for _ in range(options['renders']):
+                    started = time.perf_counter()
+                    render_to_string('content/home.html', context, request=request)
+                    timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            self.stdout.write(f'{label:28}{statistics.median(timings):>12.2f}{p95:>10.2f}')
+        clear_cards()
@@ -0,0 +1,28 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from content.images import IMAGE_FIELDS, process_image_field, renditions_field
+
+
+class Command(BaseCommand):
+    help = 'Build missing or stale poster/avatar renditions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild renditions that are already up to date')
+
+    def handle(self, *args, **options):
+        built = 0
+        for label, field_names in IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            for field_name in field_names:
+                rows = (
+                    model._default_manager.exclude(**{field_name: ''})
+                    .exclude(**{f'{field_name}__isnull': True})
+                    .values_list('pk', field_name, renditions_field(field_name))
+                )
+                for pk, source_name, manifest in rows.iterator():
+                    if not options['force'] and (manifest or {}).get('source') == source_name:
+                        continue
+                    if process_image_field(model, pk, field_name, source_name):
+                        built += 1
+        self.stdout.write(self.style.SUCCESS(f'Built renditions for {built} image(s)'))
@@ -0,0 +1,55 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from content import catalog, facets
+from content.models import Genre, Movie
+
+
+def timed(func, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = 'Build the in-memory catalog snapshot and report its size, build time and lookup speed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            snapshot = catalog.build(catalog.current_version())
+            build_ms = (time.perf_counter() - started) * 1000
+        titles = snapshot.title_count or 1
+        self.stdout.write(
+            f'{len(snapshot.genres)} genres, {len(snapshot.movies)} movies, {len(snapshot.tvshows)} TV shows, '
+            f'{len(snapshot.episode_index)} episodes'
+        )
+        self.stdout.write(f'built in {build_ms:.1f} ms with {len(ctx.captured_queries)} queries')
+        self.stdout.write(f'{snapshot.nbytes / 1024:.0f} KiB, {snapshot.nbytes / titles:.0f} bytes per title')
+
+        runs = options['runs']
+        movie = snapshot.movies.first()
+        genre = max(snapshot.genres, key=lambda genre: genre.movie_bits.bit_count(), default=None)
+        if movie is None or genre is None:
+            return
+        filters = facets.Filters(genres=[genre.id], rating_min=7.0)
+        self.stdout.write(f'\n{"":30}{"snapshot us":>14}{"ORM us":>10}')
+        rows = [
+            ('movie by id', lambda: snapshot.movie(movie.id), lambda: Movie.objects.get(id=movie.id)),
+            (f'genre "{genre.name}" titles', lambda: snapshot.in_genre(genre),
+             lambda: (list(Movie.objects.filter(genres=genre.id)), list(Genre.objects.get(id=genre.id).tvshows.all()))),
+            ('facet search and counts', lambda: snapshot.facets.search(filters),
+             lambda: facets.filter_queryset(Movie.objects.all(), filters, 'movie').count()),
+        ]
+        for label, from_snapshot, from_orm in rows:
+            self.stdout.write(f'{label:30}{timed(from_snapshot, runs):>14.1f}{timed(from_orm, runs):>10.1f}')
@@ -0,0 +1,52 @@
+import glob
+import os
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from content.sampling import read_stacks
+
+
+class Command(BaseCommand):
+    help = 'Merge sampled request stacks from every worker into collapsed flamegraph input'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None, help='Defaults to SAMPLING_PROFILER_DIR')
+        parser.add_argument('--route', default=None, help="Only stacks rooted at this label, e.g. 'GET home'")
+        parser.add_argument('--output', '-o', default=None, help='Write collapsed stacks here instead of stdout')
+        parser.add_argument('--top', type=int, default=0, help='Print the N hottest functions instead')
+
+    def handle(self, *args, **options):
+        directory = str(options['dir'] or settings.SAMPLING_PROFILER_DIR)
+        paths = sorted(glob.glob(os.path.join(directory, 'stacks-*.txt')))
+        if not paths:
+            raise CommandError(f'No stacks-*.txt files in {directory}')
+        stacks = read_stacks(paths)
+        if options['route']:
+            stacks = Counter({stack: count for stack, count in stacks.items()
+                              if stack.split(';', 1)[0] == options['route']})
+
+        if options['top']:
+            self.print_hottest(stacks, options['top'])
+            return
+        lines = [f'{stack} {count}' for stack, count in sorted(stacks.items())]
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write('\n'.join(lines) + '\n')
+            self.stderr.write(f'{len(lines)} stacks, {sum(stacks.values())} samples from {len(paths)} files')
+        else:
+            self.stdout.write('\n'.join(lines))
+
+    def print_hottest(self, stacks, top):
+        total = sum(stacks.values()) or 1
+        own, inclusive = Counter(), Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')[1:]
+            if frames:
+                own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        self.stdout.write(f'{total} samples\n{"self %":>8}{"total %":>9}  function')
+        for frame, count in own.most_common(top):
+            self.stdout.write(f'{count * 100 / total:>8.1f}{inclusive[frame] * 100 / total:>9.1f}  {frame}')
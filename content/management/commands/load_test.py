@@ -0,0 +1,181 @@
+import importlib.util
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from content import loadtest
+
+APPLICATIONS = {'wsgi': 'netflix_clone.wsgi:application', 'asgi': 'netflix_clone.asgi:application'}
+
+
+class Command(BaseCommand):
+    help = 'Replay user journeys against the site under WSGI and/or ASGI and report throughput and latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', nargs='+', choices=['wsgi', 'asgi'], default=['wsgi', 'asgi'])
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help='Virtual users per run')
+        parser.add_argument('--duration', type=float, default=30.0, help='Measured seconds per run')
+        parser.add_argument('--warmup', type=float, default=5.0, help='Unmeasured seconds before each run')
+        parser.add_argument('--think', type=float, default=0.0, help='Mean pause between requests, in seconds')
+        parser.add_argument('--workers', type=int, default=2, help='Server worker processes (gunicorn/uvicorn)')
+        parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker')
+        parser.add_argument('--job-workers', type=int, default=1, help='`run_workers` processes; 0 to skip jobs')
+        parser.add_argument('--port', type=int, default=0, help='Server port (default: a free one)')
+        parser.add_argument('--url', help='Test an already running server instead of starting one')
+        parser.add_argument('--tmdb-latency', type=float, default=0.2, help='Mean TMDB stub delay, in seconds')
+        parser.add_argument('--tmdb-jitter', type=float, default=0.05)
+        parser.add_argument('--tmdb-error-rate', type=float, default=0.0)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--by-step', action='store_true', help='Break each run down by journey step')
+        parser.add_argument('--json', help='Also write the results to this file')
+        parser.add_argument('--keep-users', action='store_true', help='Leave the loadtest-* users, their data and the stub TMDB details')
+        parser.add_argument(
+            '--allow-non-debug', action='store_true',
+            help='Run even though DEBUG is off; the run creates staff users and writes reviews and lists',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['allow_non_debug']:
+            raise CommandError(
+                'DEBUG is off, so this may be a real database; load tests add staff users, reviews and lists. '
+                'Pass --allow-non-debug if that is intended'
+            )
+        modes = ['external'] if options['url'] else options['mode']
+        for mode in modes:
+            if mode == 'asgi' and not importlib.util.find_spec('uvicorn'):
+                raise CommandError('ASGI mode runs under uvicorn: pip install uvicorn, or pass --mode wsgi')
+
+        workload = loadtest.Workload.from_database()
+        if not workload.movies:
+            raise CommandError('The catalog is empty; run `manage.py populate_sample_data` first')
+        password = secrets.token_urlsafe()
+        usernames = loadtest.ensure_users(max(options['concurrency']), password)
+
+        stub = loadtest.TmdbStub(
+            options['tmdb_latency'], options['tmdb_jitter'], options['tmdb_error_rate'], seed=options['seed'],
+        )
+        env = dict(
+            os.environ, TMDB_API_KEY='loadtest', TMDB_API_URL=stub.start(),
+            DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'netflix_clone.settings'),
+        )
+        results = []
+        try:
+            self.write_header()
+            for mode in modes:
+                results += self.run_mode(mode, workload, usernames, password, env, options)
+        finally:
+            stub.stop()
+            if not options['keep_users']:
+                loadtest.clean_up(workload, stub)
+
+        calls = sum(count for endpoint, count in stub.calls.items() if endpoint != 'failed')
+        self.stdout.write(f'TMDB stub: {calls} request(s), {stub.calls["failed"]} failed on purpose')
+        if options['json']:
+            with open(options['json'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f'Wrote {options["json"]}')
+
+    def run_mode(self, mode, workload, usernames, password, env, options):
+        results = []
+        processes = []
+        with tempfile.TemporaryFile('w+') as log:
+            try:
+                if options['url']:
+                    base_url = options['url']
+                else:
+                    port = options['port'] or free_port()
+                    base_url = f'http://127.0.0.1:{port}'
+                    processes.append(self.start_server(mode, port, env, log, options))
+                    if options['job_workers']:
+                        processes.append(subprocess.Popen(
+                            [sys.executable, 'manage.py', 'run_workers', '--processes', str(options['job_workers'])],
+                            cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+                        ))
+                    wait_until_ready(base_url, processes[0], log)
+                for concurrency in options['concurrency']:
+                    summary = loadtest.run(
+                        base_url, workload, usernames, password, concurrency, options['duration'],
+                        warmup=options['warmup'], think=options['think'], seed=options['seed'],
+                    )
+                    summary.update(mode=mode, concurrency=concurrency)
+                    results.append(summary)
+                    self.write_summary(summary, options['by_step'])
+            finally:
+                for process in processes:
+                    process.terminate()
+                for process in processes:
+                    try:
+                        process.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+        return results
+
+    def start_server(self, mode, port, env, log, options):
+        address = f'127.0.0.1:{port}'
+        if mode == 'asgi':
+            command = [
+                sys.executable, '-m', 'uvicorn', APPLICATIONS['asgi'], '--host', '127.0.0.1', '--port', str(port),
+                '--workers', str(options['workers']), '--log-level', 'warning', '--no-access-log',
+            ]
+        elif importlib.util.find_spec('gunicorn'):
+            command = [
+                sys.executable, '-m', 'gunicorn', APPLICATIONS['wsgi'], '--bind', address,
+                '--workers', str(options['workers']), '--threads', str(options['threads']), '--log-level', 'warning',
+            ]
+        else:
+            self.stderr.write('gunicorn is not installed; WSGI mode uses the threaded development server')
+            command = [sys.executable, 'manage.py', 'runserver', address, '--noreload']
+        return subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    def write_header(self):
+        self.stdout.write(
+            f'{"mode":18}{"users":>6}{"requests":>10}{"req/s":>9}{"errors":>8}{"throttled":>10}'
+            + ''.join(f'{f"p{q}":>8}' for q in loadtest.PERCENTILES) + f'{"max":>8}   (ms)'
+        )
+
+    def write_row(self, label, users, summary):
+        self.stdout.write(
+            f'{label:18}{users:>6}{summary["requests"]:>10,}{summary["throughput"]:>9.1f}'
+            f'{summary["error_rate"]:>8.1%}{summary["throttled"]:>10,}'
+            + ''.join(f'{summary[f"p{q}_ms"]:>8.0f}' for q in loadtest.PERCENTILES) + f'{summary["max_ms"]:>8.0f}'
+        )
+
+    def write_summary(self, summary, by_step):
+        self.write_row(summary['mode'], summary['concurrency'], summary)
+        if summary['statuses']:
+            self.stdout.write('  unexpected statuses: ' + ', '.join(
+                f'{status}: {count}' for status, count in summary['statuses'].items()
+            ))
+        if by_step:
+            for step, step_summary in summary['steps'].items():
+                self.write_row(f'  {step}', '', step_summary)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(base_url, process, log, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            with urlopen(base_url + '/healthz', timeout=2):
+                return
+        except (URLError, OSError):
+            time.sleep(0.2)
+    log.seek(0)
+    raise CommandError(f'The server at {base_url} did not come up:\n{log.read()[-2000:]}')
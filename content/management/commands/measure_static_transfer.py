@@ -0,0 +1,83 @@
+import re
+import tempfile
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from django.views.static import serve
+
+from content import views
+from content.middleware import StaticFilesMiddleware
+
+PLAIN_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+PIPELINE_STORAGE = 'content.storage.CompressedManifestStaticFilesStorage'
+
+ASSET_RE = re.compile(r'(?:href|src)="(/static/[^"]+)"')
+
+
+def storages(backend):
+    return {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': backend},
+    }
+
+
+def body_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = 'Measure static bytes transferred per home page view, before and after the static pipeline'
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        rows = []
+        for label, backend in [('before', PLAIN_STORAGE), ('after', PIPELINE_STORAGE)]:
+            with tempfile.TemporaryDirectory() as root, override_settings(
+                STATIC_ROOT=root, STORAGES=storages(backend), DEBUG=False
+            ):
+                call_command('collectstatic', interactive=False, verbosity=0)
+                assets = self.page_assets(factory)
+                if label == 'before':
+                    first, repeat_requests, repeat_bytes = self.measure_plain(factory, root, assets)
+                else:
+                    first, repeat_requests, repeat_bytes = self.measure_pipeline(factory, assets)
+                rows.append((label, len(assets), first, repeat_requests, repeat_bytes))
+
+        self.stdout.write('Local static assets on the home page (CDN assets not included)')
+        self.stdout.write(f'{"":8}{"assets":>8}{"first view":>14}{"repeat reqs":>14}{"repeat bytes":>14}')
+        for label, count, first, repeat_requests, repeat_bytes in rows:
+            self.stdout.write(f'{label:8}{count:>8}{first:>14,}{repeat_requests:>14}{repeat_bytes:>14,}')
+
+    def page_assets(self, factory):
+        request = factory.get('/')
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        html = views.home(request).content.decode()
+        return sorted(set(ASSET_RE.findall(html)))
+
+    def measure_plain(self, factory, root, assets):
+        """Plain names, no compression, revalidated with If-Modified-Since on every view."""
+        first = repeat_bytes = 0
+        for url in assets:
+            path = url[len('/static/'):]
+            response = serve(factory.get(url), path, document_root=root)
+            first += body_size(response)
+            revalidate = factory.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            repeat_bytes += body_size(serve(revalidate, path, document_root=root))
+        return first, len(assets), repeat_bytes
+
+    def measure_pipeline(self, factory, assets):
+        """Hashed, pre-compressed names; immutable, so repeat views make no requests."""
+        middleware = StaticFilesMiddleware(lambda request: None)
+        first = repeat_requests = 0
+        for url in assets:
+            response = middleware(factory.get(url, HTTP_ACCEPT_ENCODING='gzip, br'))
+            first += body_size(response)
+            if 'immutable' not in response['Cache-Control']:
+                repeat_requests += 1
+        return first, repeat_requests, 0
@@ -0,0 +1,63 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def worker_main(index, poll_interval, burst):
+    import django
+
+    django.setup()
+    from content.taskqueue import default_worker_id, run_worker
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *args: stopping.append(True))
+    run_worker(
+        worker_id=f'{default_worker_id()}:{index}',
+        poll_interval=poll_interval,
+        burst=burst,
+        should_stop=lambda: bool(stopping),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Number of worker processes')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        if processes == 1:
+            # Run in-process; handy for debugging and for --burst in cron jobs
+            from content.taskqueue import run_worker
+
+            processed = run_worker(poll_interval=options['poll_interval'], burst=options['burst'])
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} job(s)'))
+            return
+
+        # Children must not inherit the parent's open database connections
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(
+                target=worker_main,
+                args=(index, options['poll_interval'], options['burst']),
+                name=f'job-worker-{index}',
+            )
+            for index in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Started {processes} worker process(es)')
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
@@ -0,0 +1,51 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from content.sqlprofile import fingerprint, read_log
+
+SORT_KEYS = {
+    'total': lambda group: group['total_ms'],
+    'count': lambda group: group['count'],
+    'max': lambda group: group['max_ms'],
+}
+
+
+class Command(BaseCommand):
+    help = 'Summarize the slow-query log: top offending queries by the line of code that issued them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=None, help='Defaults to SQL_SLOW_QUERY_LOG')
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='total')
+        parser.add_argument('--kind', choices=['slow', 'duplicate', 'repeated'], default=None)
+
+    def handle(self, *args, **options):
+        path = str(options['log'] or settings.SQL_SLOW_QUERY_LOG)
+        groups = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'paths': set()})
+        records = 0
+        for record in read_log(path):
+            if options['kind'] and record.get('kind') != options['kind']:
+                continue
+            records += 1
+            origin = (record.get('origin') or ['<unknown>'])[0]
+            group = groups[(record.get('kind'), origin, fingerprint(record.get('sql', '')))]
+            # duplicate/repeated records stand for `count` executions in one request
+            group['count'] += record.get('count', 1)
+            group['total_ms'] += record.get('ms', 0) * record.get('count', 1)
+            group['max_ms'] = max(group['max_ms'], record.get('ms', 0))
+            group['paths'].add(record.get('path'))
+
+        if not records:
+            self.stdout.write(f'No records in {path}')
+            return
+        self.stdout.write(f'{records} records in {path}, {len(groups)} distinct offenders\n')
+        ranked = sorted(groups.items(), key=lambda item: SORT_KEYS[options['sort']](item[1]), reverse=True)
+        for (kind, origin, sql), group in ranked[:options['top']]:
+            self.stdout.write(
+                f'{kind:10}{group["count"]:>7}x {group["total_ms"]:>10.1f} ms total {group["max_ms"]:>8.1f} ms max'
+                f'  {origin}'
+            )
+            self.stdout.write(f'    {sql[:160]}')
+            self.stdout.write(f'    paths: {", ".join(sorted(str(path) for path in group["paths"])[:5])}')
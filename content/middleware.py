@@ -0,0 +1,261 @@
+import json
+import mimetypes
+import os
+import sys
+import time
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.utils.http import http_date, quote_etag
+
+from .fileserving import RangeFile, apply_headers, is_not_modified, negotiate_encoding, parse_range, range_applies
+from .routers import PIN_SESSION_KEY, request_scope
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+
+# Preferred first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+class StaticFile:
+    __slots__ = ('path', 'size', 'mtime', 'etag', 'last_modified', 'content_type', 'variants', 'immutable')
+
+    def __init__(self, path, immutable):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        tag = f'{int(stat.st_mtime):x}-{stat.st_size:x}'
+        self.etag = quote_etag(tag)
+        self.last_modified = http_date(stat.st_mtime)
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in ('application/javascript', 'image/svg+xml'):
+            self.content_type += '; charset=utf-8'
+        self.immutable = immutable
+        # encoding -> (path, size, etag); each encoding is its own representation
+        self.variants = {}
+        for encoding, suffix in ENCODINGS:
+            if os.path.exists(path + suffix):
+                self.variants[encoding] = (path + suffix, os.path.getsize(path + suffix), quote_etag(f'{tag}-{encoding}'))
+
+
+class StaticFilesMiddleware:
+    """Serve collected static files from STATIC_ROOT inside the app.
+
+    Files are indexed once at startup. Fingerprinted names from the
+    staticfiles manifest get a one-year ``immutable`` Cache-Control; everything
+    is served with ETags, pre-compressed gzip/brotli variants when the client
+    accepts them (by Accept-Encoding q-value, each with its own ETag), and
+    single byte ranges. Requests for unknown paths fall through to the rest
+    of the stack (e.g. the staticfiles app under DEBUG).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = urlparse(settings.STATIC_URL or '/static/').path
+        self.files = self.scan(settings.STATIC_ROOT) if settings.STATIC_ROOT else {}
+
+    @staticmethod
+    def scan(root):
+        root = str(root)
+        if not os.path.isdir(root):
+            return {}
+        immutable = set()
+        manifest_path = os.path.join(root, 'staticfiles.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as fh:
+                immutable = set(json.load(fh).get('paths', {}).values())
+        files = {}
+        for directory, _dirs, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(('.gz', '.br')) or filename == 'staticfiles.json':
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                files[name] = StaticFile(path, name in immutable)
+        return files
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefix):
+            static_file = self.files.get(request.path_info[len(self.prefix):])
+            if static_file is not None:
+                return self.serve(request, static_file)
+        return self.get_response(request)
+
+    def serve(self, request, static_file):
+        # Ranges are served from the uncompressed file
+        encoding = None
+        if static_file.variants and not request.META.get('HTTP_RANGE'):
+            encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), static_file.variants)
+        path, size, etag = static_file.variants[encoding] if encoding else (
+            static_file.path, static_file.size, static_file.etag
+        )
+        headers = {
+            'ETag': etag,
+            'Last-Modified': static_file.last_modified,
+            'Cache-Control': IMMUTABLE_CACHE_CONTROL if static_file.immutable else DEFAULT_CACHE_CONTROL,
+            'Accept-Ranges': 'bytes',
+        }
+        if static_file.variants:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if is_not_modified(request, etag, static_file.mtime):
+            return apply_headers(HttpResponse(status=304), headers)
+
+        range_header = request.META.get('HTTP_RANGE')
+        if range_header and range_applies(request, static_file.etag, static_file.mtime):
+            byte_range = parse_range(range_header, static_file.size)
+            if byte_range is False:
+                headers['Content-Range'] = f'bytes */{static_file.size}'
+                return apply_headers(HttpResponse(status=416), headers)
+            if byte_range is not None:
+                return self.serve_range(request, static_file, byte_range, headers)
+
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        headers['Content-Type'] = static_file.content_type
+        headers['Content-Length'] = str(size)
+        if request.method == 'HEAD':
+            return apply_headers(HttpResponse(), headers)
+        response = FileResponse(open(path, 'rb'))
+        response.headers.pop('Content-Disposition', None)
+        return apply_headers(response, headers)
+
+    def serve_range(self, request, static_file, byte_range, headers):
+        start, end = byte_range
+        length = end - start + 1
+        headers['Content-Type'] = static_file.content_type
+        headers['Content-Range'] = f'bytes {start}-{end}/{static_file.size}'
+        headers['Content-Length'] = str(length)
+        if request.method == 'HEAD':
+            return apply_headers(HttpResponse(status=206), headers)
+        response = FileResponse(RangeFile(static_file.path, start, length), status=206)
+        response.headers.pop('Content-Disposition', None)
+        return apply_headers(response, headers)
+
+
+class HealthCheckMiddleware:
+    """Answer ``/healthz`` and ``/readyz`` before the rest of the stack.
+
+    Probes come from load balancers that address workers by IP and over
+    plain HTTP. Answering here, ahead of SecurityMiddleware, means
+    ALLOWED_HOSTS, SSL redirects, sessions and URL resolution never get in
+    the way of a probe. See ``content.health`` for what each endpoint checks.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path_info == '/healthz':
+            return self.respond({'status': 'ok'}, 200)
+        if request.path_info == '/readyz':
+            from . import health
+
+            ready, report = health.readiness()
+            return self.respond(report, 200 if ready else 503)
+        return self.get_response(request)
+
+    @staticmethod
+    def respond(payload, status):
+        response = JsonResponse(payload, status=status)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+class InvalidationMiddleware:
+    """Apply other workers' cache invalidations before handling a request.
+
+    Polls the shared channel at most every ``INVALIDATION_POLL_INTERVAL``
+    seconds; see ``content.invalidation``.
+    """
+
+    def __init__(self, get_response):
+        from . import invalidation
+
+        self.get_response = get_response
+        self.invalidation = invalidation
+
+    def __call__(self, request):
+        self.invalidation.poll()
+        return self.get_response(request)
+
+
+class QueryProfilerMiddleware:
+    """Profile each request's SQL when ``SQL_PROFILER_ENABLED`` is set.
+
+    Slow, duplicate and repeated queries go to the slow-query log (see
+    ``content.sqlprofile``), and every response gets a ``Server-Timing: db``
+    header with the query count and total database time.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SQL_PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from . import sqlprofile
+
+        with sqlprofile.profile() as profiler:
+            response = self.get_response(request)
+        sqlprofile.log_request(request, profiler)
+        response['Server-Timing'] = f'db;dur={profiler.total_ms:.1f};desc="{len(profiler.queries)} queries"'
+        return response
+
+
+class SamplingProfilerMiddleware:
+    """Sample the stacks of selected requests when ``SAMPLING_PROFILER_ENABLED`` is set.
+
+    The decision is made in ``process_view``, once the URL name is known;
+    see ``content.sampling`` for how requests are picked.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SAMPLING_PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        from . import sampling
+
+        self.sampling = sampling
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._sampling_stop_frame = sys._getframe()
+        try:
+            return self.get_response(request)
+        finally:
+            if getattr(request, '_sampled', False):
+                self.sampling.get_sampler().unregister()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        if self.sampling.should_sample(request, url_name):
+            request._sampled = True
+            label = f'{request.method} {url_name or request.path}'
+            self.sampling.get_sampler().register(label, request._sampling_stop_frame)
+
+
+class ReplicaPinningMiddleware:
+    """Route a session's reads to the primary for a while after it writes.
+
+    Non-safe requests (POST etc.) read from the primary and then pin the
+    session for ``REPLICA_PIN_SECONDS``, so the redirect that follows a write
+    never shows stale replica data. Other requests read from one replica
+    throughout.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        write = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        session = getattr(request, 'session', None)
+        pinned_until = session.get(PIN_SESSION_KEY, 0) if session is not None else 0
+        with request_scope(pinned=write or pinned_until > time.time()):
+            response = self.get_response(request)
+        if write and session is not None and response.status_code < 400:
+            session[PIN_SESSION_KEY] = time.time() + getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        return response
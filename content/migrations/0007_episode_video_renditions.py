@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0006_trending'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='episode',
+            name='video_file',
+            field=models.FileField(blank=True, help_text='Packaged into HLS renditions after upload', upload_to='episodes/'),
+        ),
+        migrations.AlterField(
+            model_name='episode',
+            name='video_url',
+            field=models.URLField(blank=True),
+        ),
+        migrations.CreateModel(
+            name='VideoRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='video_file name this was built from', max_length=255)),
+                ('name', models.CharField(max_length=20)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('bandwidth', models.PositiveIntegerField(help_text='Peak bits per second')),
+                ('average_bandwidth', models.PositiveIntegerField()),
+                ('codecs', models.CharField(max_length=100)),
+                ('playlist', models.CharField(help_text='Media playlist path in MEDIA_ROOT', max_length=255)),
+                ('segment_count', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('episode', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='content.episode')),
+            ],
+            options={
+                'ordering': ['-bandwidth'],
+                'unique_together': {('episode', 'name')},
+            },
+        ),
+    ]
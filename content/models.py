@@ -21,6 +21,7 @@ class Movie(models.Model):
     duration = models.IntegerField(help_text="Duration in minutes")
     rating = models.DecimalField(max_digits=3, decimal_places=1, validators=[MinValueValidator(0), MaxValueValidator(10)])
     poster = models.ImageField(upload_to='posters/', null=True, blank=True)
+    poster_renditions = models.JSONField(default=dict, blank=True, editable=False)
     trailer_url = models.URLField(blank=True)
     genres = models.ManyToManyField(Genre, related_name='movies')
     featured = models.BooleanField(default=False)
@@ -40,6 +41,7 @@ class TVShow(models.Model):
     release_date = models.DateField()
     rating = models.DecimalField(max_digits=3, decimal_places=1, validators=[MinValueValidator(0), MaxValueValidator(10)])
     poster = models.ImageField(upload_to='posters/', null=True, blank=True)
+    poster_renditions = models.JSONField(default=dict, blank=True, editable=False)
     trailer_url = models.URLField(blank=True)
     genres = models.ManyToManyField(Genre, related_name='tvshows')
     featured = models.BooleanField(default=False)
@@ -60,7 +62,8 @@ class Episode(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
     duration = models.IntegerField(help_text="Duration in minutes")
-    video_url = models.URLField()
+    video_url = models.URLField(blank=True)
+    video_file = models.FileField(upload_to='episodes/', blank=True, help_text="Packaged into HLS renditions after upload")
     release_date = models.DateField()
     
     def __str__(self):
@@ -71,9 +74,32 @@ class Episode(models.Model):
         unique_together = ['tv_show', 'season_number', 'episode_number']
 
 
+class VideoRendition(models.Model):
+    """One bitrate of an episode's HLS packaging (see content/packaging.py)"""
+    episode = models.ForeignKey(Episode, on_delete=models.CASCADE, related_name='renditions')
+    source = models.CharField(max_length=255, help_text="video_file name this was built from")
+    name = models.CharField(max_length=20)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    bandwidth = models.PositiveIntegerField(help_text="Peak bits per second")
+    average_bandwidth = models.PositiveIntegerField()
+    codecs = models.CharField(max_length=100)
+    playlist = models.CharField(max_length=255, help_text="Media playlist path in MEDIA_ROOT")
+    segment_count = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.episode} - {self.name}"
+
+    class Meta:
+        ordering = ['-bandwidth']
+        unique_together = ['episode', 'name']
+
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     profile_picture = models.ImageField(upload_to='profiles/', null=True, blank=True)
+    profile_picture_renditions = models.JSONField(default=dict, blank=True, editable=False)
     bio = models.TextField(blank=True)
     favorite_genres = models.ManyToManyField(Genre, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -112,12 +138,61 @@ class Review(models.Model):
         if self.movie:
             return f"{self.user.username} - {self.movie.title} ({self.rating}/5)"
         return f"{self.user.username} - {self.tv_show.title} ({self.rating}/5)"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        review = super().from_db(db, field_names, values)
+        # Lets a save move the review between stars in its ReviewSummary
+        if {'movie_id', 'tv_show_id', 'rating'} <= set(field_names):
+            review._counted = (review.movie_id, review.tv_show_id, review.rating)
+        return review
     
     class Meta:
         unique_together = [
             ['user', 'movie'],
             ['user', 'tv_show']
         ]
+        indexes = [
+            # Keyset pages of a title's reviews, newest first (see content/reviews.py)
+            models.Index(fields=['movie', '-created_at', '-id'], name='review_movie_recent_idx'),
+            models.Index(fields=['tv_show', '-created_at', '-id'], name='review_tvshow_recent_idx'),
+        ]
+
+
+class ReviewSummary(models.Model):
+    """Star histogram of a title's reviews, kept in step by content/reviews.py."""
+    STARS = (5, 4, 3, 2, 1)
+
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, null=True, blank=True, related_name='review_summary')
+    tv_show = models.OneToOneField(
+        TVShow, on_delete=models.CASCADE, null=True, blank=True, related_name='review_summary',
+    )
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.movie or self.tv_show} ({self.count} reviews)"
+
+    def stars(self, rating):
+        return getattr(self, f'stars_{rating}')
+
+    @property
+    def count(self):
+        return sum(self.stars(rating) for rating in self.STARS)
+
+    @property
+    def average(self):
+        count = self.count
+        return sum(rating * self.stars(rating) for rating in self.STARS) / count if count else None
+
+    def histogram(self):
+        """(stars, count, percent of reviews) from 5 stars down to 1."""
+        count = self.count
+        return [(rating, self.stars(rating), round(100 * self.stars(rating) / count) if count else 0)
+                for rating in self.STARS]
 
 
 class Profile(models.Model):
@@ -125,6 +200,7 @@ class Profile(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='profiles')
     name = models.CharField(max_length=50)
     avatar_image = models.ImageField(upload_to='profile_avatars/', null=True, blank=True)
+    avatar_image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -151,4 +227,119 @@ class ProfileWatchlist(models.Model):
     def __str__(self):
         if self.movie:
             return f"{self.profile} - {self.movie.title}"
-        return f"{self.profile} - {self.tv_show.title}"
\ No newline at end of file
+        return f"{self.profile} - {self.tv_show.title}"
+
+
+class Job(models.Model):
+    """Background task queued by the request path and run by `run_workers`."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.IntegerField(default=0, help_text="Higher runs first")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at'], name='job_claim_idx'),
+        ]
+        constraints = [
+            # A key can only be pending once; finished jobs may be re-queued
+            models.UniqueConstraint(
+                fields=['idempotency_key'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='job_active_idempotency_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class InvalidationEvent(models.Model):
+    """A chunk of cache invalidation keys for every worker; see content/invalidation.py."""
+    keys = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Invalidation #{self.pk} ({len(self.keys)} keys)"
+
+
+class WatchProgress(models.Model):
+    """Playback position of a movie or episode for a profile (Continue Watching)."""
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='progress')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, null=True, blank=True)
+    episode = models.ForeignKey(Episode, on_delete=models.CASCADE, null=True, blank=True)
+    position_seconds = models.PositiveIntegerField(default=0)
+    duration_seconds = models.PositiveIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = [
+            ['profile', 'movie'],
+            ['profile', 'episode']
+        ]
+        indexes = [
+            models.Index(fields=['profile', '-updated_at'], name='progress_recent_idx'),
+        ]
+        ordering = ['-updated_at']
+
+    def __str__(self):
+        content = self.movie or self.episode
+        return f"{self.profile} - {content} @ {self.position_seconds}s"
+
+
+class TrendingBucket(models.Model):
+    """Engagement counts for one title in one time bucket."""
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, null=True, blank=True)
+    tv_show = models.ForeignKey(TVShow, on_delete=models.CASCADE, null=True, blank=True)
+    bucket_start = models.DateTimeField()
+    views = models.PositiveIntegerField(default=0)
+    list_adds = models.PositiveIntegerField(default=0)
+    reviews = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [
+            ['movie', 'bucket_start'],
+            ['tv_show', 'bucket_start']
+        ]
+        indexes = [
+            models.Index(fields=['bucket_start'], name='trending_bucket_start_idx'),
+        ]
+
+
+class TrendingScore(models.Model):
+    """Precomputed time-decayed popularity of a title (Trending Now)."""
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, null=True, blank=True)
+    tv_show = models.OneToOneField(TVShow, on_delete=models.CASCADE, null=True, blank=True)
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-score']
+        indexes = [
+            models.Index(fields=['-score'], name='trending_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.movie or self.tv_show} ({self.score:.2f})"
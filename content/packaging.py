@@ -0,0 +1,247 @@
+"""Multi-bitrate HLS packaging of uploaded episode videos.
+
+An episode's ``video_file`` is transcoded by a local ffmpeg into one HLS
+media playlist per rung of ``VIDEO_HLS_LADDER`` (never above the source
+resolution), with fixed-length segments aligned on keyframes across rungs so
+players can switch bitrate at any segment boundary::
+
+    hls/<source digest>/720p/index.m3u8
+    hls/<source digest>/720p/seg_00000.ts ...
+
+Rungs are transcoded in parallel in a process pool, each ffmpeg getting an
+equal share of the CPU threads. The result is recorded as ``VideoRendition``
+rows, from which :func:`master_playlist` builds the adaptive manifest served
+by ``episode_manifest``. Output directories are named after a digest of the
+source, so segments never change once written and are served as immutable.
+
+Packaging writes next to the upload, so it needs a filesystem ``default``
+storage.
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_save
+
+DEFAULT_LADDER = [
+    {'name': '1080p', 'height': 1080, 'video_bitrate': 5000, 'audio_bitrate': 192, 'level': '4.0'},
+    {'name': '720p', 'height': 720, 'video_bitrate': 2800, 'audio_bitrate': 128, 'level': '3.1'},
+    {'name': '480p', 'height': 480, 'video_bitrate': 1400, 'audio_bitrate': 128, 'level': '3.0'},
+    {'name': '360p', 'height': 360, 'video_bitrate': 800, 'audio_bitrate': 96, 'level': '3.0'},
+]
+
+SEGMENT_SECONDS = 6
+
+PLAYLIST_NAME = 'index.m3u8'
+
+AUDIO_CODEC = 'mp4a.40.2'
+
+
+class PackagingError(Exception):
+    pass
+
+
+def ladder():
+    return getattr(settings, 'VIDEO_HLS_LADDER', DEFAULT_LADDER)
+
+
+def ffmpeg_binary(name='ffmpeg'):
+    configured = getattr(settings, f'{name.upper()}_BINARY', None)
+    binary = configured or shutil.which(name)
+    if not binary:
+        raise PackagingError(f'{name} was not found; install it or set {name.upper()}_BINARY')
+    return binary
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()[:16]
+
+
+def probe(path):
+    """Width and height of the first video stream."""
+    output = subprocess.run(
+        [ffmpeg_binary('ffprobe'), '-v', 'error', '-select_streams', 'v:0',
+         '-show_entries', 'stream=width,height', '-of', 'json', path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    streams = json.loads(output).get('streams') or []
+    if not streams:
+        raise PackagingError(f'{path} has no video stream')
+    return streams[0]['width'], streams[0]['height']
+
+
+def rungs_for(source_height):
+    """Ladder rungs to build for a source, highest first; never upscales."""
+    rungs = sorted(ladder(), key=lambda rung: rung['height'], reverse=True)
+    selected = [rung for rung in rungs if rung['height'] <= source_height]
+    if not selected:
+        # Tiny source: one rung at its own height
+        selected = [dict(rungs[-1], height=source_height - source_height % 2)]
+    return selected
+
+
+def scaled_width(source_width, source_height, height):
+    width = round(source_width * height / source_height)
+    return width - width % 2
+
+
+def codecs(rung):
+    # H.264 Main profile (0x4d, constraint flags 0x40) at the rung's level
+    return f'avc1.4d40{round(float(rung["level"]) * 10):02x},{AUDIO_CODEC}'
+
+
+def ffmpeg_command(ffmpeg, source, out_dir, rung, width, threads, segment_seconds=SEGMENT_SECONDS):
+    video_bitrate = rung['video_bitrate']
+    # Fixed GOP so every rung has keyframes at the same segment boundaries
+    gop = f'expr:gte(t,n_forced*{segment_seconds})'
+    return [
+        ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-i', source,
+        '-threads', str(threads),
+        '-vf', f'scale={width}:{rung["height"]}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main', '-level', rung['level'],
+        '-b:v', f'{video_bitrate}k', '-maxrate', f'{round(video_bitrate * 1.07)}k',
+        '-bufsize', f'{round(video_bitrate * 1.5)}k',
+        '-force_key_frames', gop, '-sc_threshold', '0',
+        '-c:a', 'aac', '-b:a', f'{rung["audio_bitrate"]}k', '-ac', '2',
+        '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(out_dir, 'seg_%05d.ts'),
+        os.path.join(out_dir, PLAYLIST_NAME),
+    ]
+
+
+def measure_playlist(path):
+    """Peak and average bits per second and segment count of a media playlist."""
+    directory = os.path.dirname(path)
+    peak = total_bits = total_seconds = count = 0
+    duration = None
+    with open(path) as fh:
+        for line in fh:
+            line = line.strip()
+            if line.startswith('#EXTINF:'):
+                duration = float(line[len('#EXTINF:'):].split(',')[0])
+            elif line and not line.startswith('#') and duration:
+                bits = os.path.getsize(os.path.join(directory, line)) * 8
+                peak = max(peak, bits / duration)
+                total_bits += bits
+                total_seconds += duration
+                count += 1
+                duration = None
+    average = total_bits / total_seconds if total_seconds else 0
+    return round(peak), round(average), count
+
+
+def transcode_rung(ffmpeg, source, out_dir, rung, width, threads):
+    """Process pool entry point: build one rung and describe the result."""
+    os.makedirs(out_dir, exist_ok=True)
+    result = subprocess.run(
+        ffmpeg_command(ffmpeg, source, out_dir, rung, width, threads), capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise PackagingError(f'ffmpeg failed for {rung["name"]}: {result.stderr.strip()[-500:]}')
+    peak, average, count = measure_playlist(os.path.join(out_dir, PLAYLIST_NAME))
+    return {
+        'name': rung['name'],
+        'width': width,
+        'height': rung['height'],
+        'bandwidth': peak,
+        'average_bandwidth': average,
+        'codecs': codecs(rung),
+        'segment_count': count,
+    }
+
+
+def run_ladder(jobs):
+    """Run ``transcode_rung`` for each job, in parallel when configured to."""
+    processes = min(len(jobs), getattr(settings, 'VIDEO_PACKAGING_PROCESSES', os.cpu_count() or 1))
+    if processes <= 1:
+        return [transcode_rung(*job) for job in jobs]
+    # multiprocessing is slow to import and only workers that package video need it
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(transcode_rung, *zip(*jobs)))
+
+
+def package_episode(episode_id, source_name):
+    """Transcode an episode's upload into HLS and record its renditions."""
+    from .models import Episode, VideoRendition
+
+    source = default_storage.path(source_name)
+    digest = file_digest(source)
+    source_width, source_height = probe(source)
+    rungs = rungs_for(source_height)
+    threads = max(1, (os.cpu_count() or 1) // len(rungs))
+    ffmpeg = ffmpeg_binary()
+    base = f'hls/{digest}'
+    jobs = [
+        (ffmpeg, source, default_storage.path(f'{base}/{rung["name"]}'), rung,
+         scaled_width(source_width, source_height, rung['height']), threads)
+        for rung in rungs
+    ]
+    results = run_ladder(jobs)
+
+    with transaction.atomic():
+        # The video may have been replaced while we were transcoding
+        if not Episode.objects.filter(pk=episode_id, video_file=source_name).exists():
+            return []
+        VideoRendition.objects.filter(episode_id=episode_id).delete()
+        return VideoRendition.objects.bulk_create([
+            VideoRendition(
+                episode_id=episode_id,
+                source=source_name,
+                playlist=f'{base}/{result["name"]}/{PLAYLIST_NAME}',
+                **result,
+            )
+            for result in results
+        ])
+
+
+def master_playlist(renditions):
+    """HLS multivariant playlist listing every rendition, highest bandwidth first."""
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-INDEPENDENT-SEGMENTS']
+    for rendition in sorted(renditions, key=lambda item: item.bandwidth, reverse=True):
+        lines.append(
+            f'#EXT-X-STREAM-INF:BANDWIDTH={rendition.bandwidth},'
+            f'AVERAGE-BANDWIDTH={rendition.average_bandwidth},'
+            f'RESOLUTION={rendition.width}x{rendition.height},CODECS="{rendition.codecs}"'
+        )
+        lines.append(default_storage.url(rendition.playlist))
+    return '\n'.join(lines) + '\n'
+
+
+def schedule_packaging(episode_id, source_name):
+    from .tasks import package_episode_video
+
+    package_episode_video.enqueue(
+        episode_id, source_name, idempotency_key=f'hls:{episode_id}:{source_name}',
+    )
+
+
+def episode_saved(sender, instance, raw=False, **kwargs):
+    """post_save handler: queue packaging when an episode gets a new video."""
+    from .models import VideoRendition
+
+    if raw:
+        return
+    source_name = instance.video_file.name or ''
+    if not source_name:
+        VideoRendition.objects.filter(episode_id=instance.pk).delete()
+        return
+    if VideoRendition.objects.filter(episode_id=instance.pk, source=source_name).exists():
+        return
+    transaction.on_commit(lambda: schedule_packaging(instance.pk, source_name))
+
+
+def connect_signals():
+    from .models import Episode
+
+    post_save.connect(episode_saved, sender=Episode, dispatch_uid='hls-packaging')
@@ -0,0 +1,203 @@
+"""Playback progress heartbeats and the per-profile Continue Watching index.
+
+Players report their position every few seconds, which would be a write per
+viewer per heartbeat. Instead :func:`record_heartbeat` only updates an
+in-process buffer keyed by (profile, title), so repeated heartbeats collapse to
+the latest position. :func:`flush` writes the buffer with one batched upsert
+per content type at most every ``PROGRESS_FLUSH_INTERVAL`` seconds, then
+refreshes the cached Continue Watching index of the profiles it touched.
+Positions and durations are clamped to the columns' range. If a batch fails
+anyway, for instance while the database is unreachable, its heartbeats go back
+into the buffer for the next flush unless a newer one has arrived.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('movie', 'episode')
+
+# A title counts as watched once this fraction has been played
+COMPLETED_FRACTION = 0.95
+
+INDEX_SIZE = 20
+
+# PositiveIntegerField's range on every backend
+MAX_SECONDS = 2147483647
+
+_buffer = {}
+_lock = threading.Lock()
+_timer = None
+
+
+def flush_interval():
+    return getattr(settings, 'PROGRESS_FLUSH_INTERVAL', 10)
+
+
+def index_key(profile_id):
+    return f'progress:continue:{profile_id}'
+
+
+def record_heartbeat(profile_id, kind, object_id, position, duration):
+    """Buffer a player heartbeat; it reaches the database on the next flush."""
+    global _timer
+
+    if kind not in KINDS:
+        raise ValueError(f'Unknown content kind {kind!r}')
+    with _lock:
+        _buffer[(profile_id, kind, object_id)] = (clamp(position), clamp(duration), timezone.now())
+        full = len(_buffer) >= getattr(settings, 'PROGRESS_MAX_BUFFER', 5000)
+        interval = flush_interval()
+        if not full and interval > 0 and _timer is None:
+            _timer = threading.Timer(interval, _flush_from_timer)
+            _timer.daemon = True
+            _timer.start()
+    if full or interval <= 0:
+        flush()
+
+
+def clamp(seconds):
+    return min(max(0, int(seconds)), MAX_SECONDS)
+
+
+def requeue(pending):
+    """Put unwritten heartbeats back, keeping any newer ones recorded since."""
+    with _lock:
+        for key, value in pending.items():
+            _buffer.setdefault(key, value)
+
+
+def pending_count():
+    with _lock:
+        return len(_buffer)
+
+
+def flush():
+    """Write buffered heartbeats with batched upserts. Returns rows written."""
+    global _timer
+    from .models import Episode, Movie, WatchProgress
+
+    with _lock:
+        pending = dict(_buffer)
+        _buffer.clear()
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if not pending:
+        return 0
+
+    rows = {kind: [] for kind in KINDS}
+    for (profile_id, kind, object_id), (position, duration, seen_at) in pending.items():
+        rows[kind].append((profile_id, object_id, position, duration, seen_at))
+
+    # Drop heartbeats for titles that don't exist rather than fail the batch
+    valid = {
+        'movie': set(
+            Movie.objects.filter(id__in={row[1] for row in rows['movie']}).order_by().values_list('id', flat=True)
+        ),
+        'episode': set(
+            Episode.objects.filter(id__in={row[1] for row in rows['episode']}).order_by().values_list('id', flat=True)
+        ),
+    }
+    update_fields = ['position_seconds', 'duration_seconds', 'completed', 'updated_at']
+    written = 0
+    for index, kind in enumerate(KINDS):
+        objs = [
+            WatchProgress(
+                profile_id=profile_id,
+                position_seconds=position,
+                duration_seconds=duration,
+                completed=bool(duration) and position >= duration * COMPLETED_FRACTION,
+                updated_at=seen_at,
+                **{f'{kind}_id': object_id},
+            )
+            for profile_id, object_id, position, duration, seen_at in rows[kind]
+            if object_id in valid[kind]
+        ]
+        if objs:
+            try:
+                WatchProgress.objects.bulk_create(
+                    objs, update_conflicts=True, unique_fields=['profile', kind], update_fields=update_fields,
+                )
+            except Exception:
+                unwritten = KINDS[index:]
+                requeue({key: value for key, value in pending.items() if key[1] in unwritten})
+                raise
+            written += len(objs)
+    rebuild_index({profile_id for profile_id, _kind, _id in pending})
+    return written
+
+
+def rebuild_index(profile_ids):
+    """Recompute and cache the Continue Watching index for some profiles."""
+    from .models import WatchProgress
+
+    profile_ids = list(profile_ids)
+    indexes = {profile_id: [] for profile_id in profile_ids}
+    rows = (
+        WatchProgress.objects.filter(profile_id__in=profile_ids, completed=False)
+        .order_by('profile_id', '-updated_at')
+        .values_list('profile_id', 'movie_id', 'episode_id', 'position_seconds', 'duration_seconds')
+    )
+    for profile_id, movie_id, episode_id, position, duration in rows:
+        index = indexes[profile_id]
+        if len(index) < INDEX_SIZE:
+            if movie_id:
+                index.append(('movie', movie_id, position, duration))
+            else:
+                index.append(('episode', episode_id, position, duration))
+    cache.set_many({index_key(profile_id): index for profile_id, index in indexes.items()}, None)
+    return indexes
+
+
+def continue_watching(profile_id):
+    """Continue Watching row for a profile: one cache read plus one fetch per kind."""
+    from .models import Episode, Movie
+
+    index = cache.get(index_key(profile_id))
+    if index is None:
+        index = rebuild_index([profile_id])[profile_id]
+    if not index:
+        return []
+    movies = Movie.objects.in_bulk([object_id for kind, object_id, *_ in index if kind == 'movie'])
+    episodes = Episode.objects.select_related('tv_show').in_bulk(
+        [object_id for kind, object_id, *_ in index if kind == 'episode']
+    )
+    items = []
+    for kind, object_id, position, duration in index:
+        obj = (movies if kind == 'movie' else episodes).get(object_id)
+        if obj is None:
+            continue
+        items.append({
+            'kind': kind,
+            'object': obj,
+            'position': position,
+            'duration': duration,
+            'percent': min(100, round(100 * position / duration)) if duration else 0,
+        })
+    return items
+
+
+def _flush_from_timer():
+    from django.db import connections
+
+    try:
+        flush()
+    except Exception:
+        logger.exception('Could not flush watch progress')
+    finally:
+        # The timer thread's connections would otherwise stay open
+        connections.close_all()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception('Could not flush watch progress on exit')
@@ -0,0 +1,122 @@
+"""Fixed-window rate limiting for views.
+
+Each (scope, client) pair may make ``count`` requests per ``period``-second
+window, counted under ``ratelimit:<scope>:<client>:<window>``. A request
+claims its slot with ``cache.add`` (the window's first request) or
+``cache.incr``; one that finds the window full hands its slot back with
+``decr``, skips the view and gets a ``429`` with ``Retry-After`` set to the
+window's end. A client can fit up to ``2 * count`` requests across a window
+boundary, which is fine for stopping floods.
+
+Rates are named in ``RATELIMITS`` (``{'search': '30/m'}``) so they can be tuned
+per deployment, and applied with :func:`ratelimit`::
+
+    @ratelimit('search')
+    def search(request): ...
+
+The counters live in the ``RATELIMIT_CACHE`` alias. That cache must make
+``add`` and ``incr`` atomic for every worker, or parallel requests all
+claim the same slot: Redis or Memcached in deployments, or LocMem under the
+single-process development server. ``content.checks`` rejects anything else.
+"""
+import functools
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+DEFAULT_RATES = {
+    'search': '30/m',
+    'review': '10/m',
+    'watchlist': '30/m',
+    'progress': '30/m',
+}
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """``'10/m'`` -> ``(10, 60)``; the period may carry a multiplier (``'5/10s'``)."""
+    count, _, period = rate.partition('/')
+    multiplier = int(period[:-1] or 1)
+    return int(count), multiplier * PERIODS[period[-1]]
+
+
+def get_rate(scope):
+    rates = {**DEFAULT_RATES, **getattr(settings, 'RATELIMITS', {})}
+    return parse_rate(rates[scope])
+
+
+def client_ip(request):
+    if getattr(settings, 'RATELIMIT_TRUST_FORWARDED_FOR', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_key(request):
+    """Signed-in users are limited per account, everyone else per IP."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{client_ip(request)}'
+
+
+def bucket_key(scope, client):
+    return f'ratelimit:{scope}:{client}'
+
+
+def counters():
+    return caches[getattr(settings, 'RATELIMIT_CACHE', 'counters')]
+
+
+def consume(key, count, period, now=None):
+    """Claim a slot in the current window. Returns ``(allowed, retry_after_seconds)``."""
+    now = time.time() if now is None else now
+    window = int(now // period)
+    window_key = f'{key}:{window}'
+    store = counters()
+    # Outlive the window a little so a late incr doesn't recreate it
+    if store.add(window_key, 1, period + 1):
+        used = 1
+    else:
+        try:
+            used = store.incr(window_key)
+        except ValueError:
+            # Expired between the add and the incr
+            store.add(window_key, 0, period + 1)
+            used = store.incr(window_key)
+    if used <= count:
+        return True, 0.0
+    store.decr(window_key)
+    return False, (window + 1) * period - now
+
+
+def too_many_requests(retry_after, json=False):
+    if json:
+        response = JsonResponse({'error': 'Too many requests'}, status=429)
+    else:
+        response = HttpResponse('Too many requests. Please slow down.', status=429, content_type='text/plain')
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def ratelimit(scope, methods=None, json=False):
+    """Limit a view to the ``scope`` rate, optionally only for some HTTP methods.
+
+    ``json=True`` answers over-limit requests with a JSON body, for API views.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if getattr(settings, 'RATELIMIT_ENABLED', True) and (methods is None or request.method in methods):
+                count, period = get_rate(scope)
+                allowed, retry_after = consume(bucket_key(scope, client_key(request)), count, period)
+                if not allowed:
+                    return too_many_requests(retry_after, json)
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,196 @@
+"""Paginated review lists and per-title star histograms.
+
+A title's reviews are listed newest first by ``(created_at, id)``, with
+keyset pagination. A page link carries the position of the row at its edge
+as a cursor (``<microseconds>.<id>``). The next page is the rows strictly
+older than the cursor::
+
+    WHERE movie_id = 7 AND created_at <= t AND (created_at < t OR id < 42)
+    ORDER BY created_at DESC, id DESC LIMIT 21
+
+``review_movie_recent_idx`` and ``review_tvshow_recent_idx`` index
+``(title, created_at, id)``. The database seeks straight to the cursor and
+reads the page in index order, so page 5000 costs the same as page 1,
+where an OFFSET would step over every earlier review. The index holds the
+seek and sort keys, and the page's rows are then fetched by primary key.
+That's ``size`` lookups whatever the title's review count. The one extra
+row tells whether there is another page.
+
+:class:`~content.models.ReviewSummary` keeps each title's 1-5 star counts.
+Saving or deleting a Review adjusts them with a single
+``UPDATE ... SET stars_n = stars_n + 1``. Moving a review from 3 stars to 5
+is one UPDATE of both columns. A title with no summary row yet, such as one
+whose reviews predate it, gets one built by a ``GROUP BY``: on its first
+read, or by the first review saved for it. A delete never builds one, since
+it may be part of deleting the title.
+
+A build counts the reviews and then inserts the row. That has to be ordered
+against reviews written meanwhile. Otherwise, on PostgreSQL, a count that
+misses an uncommitted review, followed by that review's UPDATE finding no
+row yet, would lose it. So builds, and any UPDATE that finds no row, first
+lock the title's own row with ``SELECT ... FOR UPDATE``: whichever comes
+second sees the first one's work. SQLite has no row locks, but its
+transactions here begin IMMEDIATE, which already serializes them. Save
+reviews inside a transaction, as ``update_or_create()`` does. A review
+committed on its own, before its UPDATE runs, can be counted twice by a
+build that lands in between.
+``QuerySet.update()``, ``bulk_create()`` and raw SQL skip the signals; call
+:func:`rebuild_summary` after them.
+"""
+from datetime import datetime, timedelta, timezone
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_delete, post_save
+
+REVIEW_PAGE_SIZE = 20
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Page kind -> Review foreign key
+TITLE_FIELDS = {'movie': 'movie_id', 'tvshow': 'tv_show_id'}
+
+
+def encode(review):
+    micros = (review.created_at - EPOCH) // timedelta(microseconds=1)
+    return f'{micros}.{review.id}'
+
+
+def decode(cursor):
+    """``(created_at, id)`` from a cursor, or ``None`` if it's malformed."""
+    micros, _, pk = (cursor or '').partition('.')
+    if not micros.lstrip('-').isdigit() or not pk.isdigit():
+        return None
+    try:
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except OverflowError:
+        return None
+
+
+class ReviewPage:
+    __slots__ = ('reviews', 'next_cursor', 'previous_cursor')
+
+    def __init__(self, reviews, next_cursor=None, previous_cursor=None):
+        self.reviews = reviews
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+
+def review_page(kind, title_id, after='', before='', size=REVIEW_PAGE_SIZE):
+    """Reviews of a title, newest first, older than cursor ``after`` or newer than ``before``."""
+    from .models import Review
+
+    reviews = Review.objects.filter(**{TITLE_FIELDS[kind]: title_id}).select_related('user')
+    position = decode(before)
+    if position is not None:
+        created_at, pk = position
+        newer = reviews.filter(Q(created_at__gt=created_at) | Q(id__gt=pk), created_at__gte=created_at)
+        rows = list(newer.order_by('created_at', 'id')[:size + 1])
+        if not rows:
+            return review_page(kind, title_id, size=size)
+        more = len(rows) > size
+        rows = rows[:size][::-1]
+        # The cursor's own row starts the next page
+        return ReviewPage(rows, encode(rows[-1]), encode(rows[0]) if more else None)
+
+    position = decode(after)
+    if position is not None:
+        created_at, pk = position
+        reviews = reviews.filter(Q(created_at__lt=created_at) | Q(id__lt=pk), created_at__lte=created_at)
+    rows = list(reviews.order_by('-created_at', '-id')[:size + 1])
+    more = len(rows) > size
+    rows = rows[:size]
+    previous = None
+    if position is not None:
+        previous = encode(rows[0]) if rows else after
+    return ReviewPage(rows, encode(rows[-1]) if more else None, previous)
+
+
+def summary_for(kind, title_id):
+    """The title's ReviewSummary, built from its reviews if it has none yet."""
+    from .models import ReviewSummary
+
+    try:
+        return ReviewSummary.objects.get(**{TITLE_FIELDS[kind]: title_id})
+    except ReviewSummary.DoesNotExist:
+        return rebuild_summary(**{TITLE_FIELDS[kind]: title_id})
+
+
+def lock_title(movie_id, tv_show_id, using):
+    """Lock the title's row for the rest of the transaction; False if it's gone."""
+    from .models import Movie, TVShow
+
+    if not connections[using].features.has_select_for_update:
+        return True  # SQLite: the transaction took the database's write lock at BEGIN
+    model, pk = (Movie, movie_id) if movie_id is not None else (TVShow, tv_show_id)
+    return model.objects.using(using).select_for_update().filter(pk=pk).exists()
+
+
+def rebuild_summary(movie_id=None, tv_show_id=None, using=DEFAULT_DB_ALIAS):
+    """Recount a title's star histogram from its reviews."""
+    from .models import Review, ReviewSummary
+
+    with transaction.atomic(using=using):
+        lock_title(movie_id, tv_show_id, using)
+        counts = dict(
+            Review.objects.using(using).filter(movie_id=movie_id, tv_show_id=tv_show_id)
+            .order_by().values_list('rating').annotate(count=Count('id'))
+        )
+        summary, _created = ReviewSummary.objects.using(using).update_or_create(
+            movie_id=movie_id, tv_show_id=tv_show_id,
+            defaults={f'stars_{rating}': counts.get(rating, 0) for rating in ReviewSummary.STARS},
+        )
+    return summary
+
+
+def counted(review):
+    return review.movie_id, review.tv_show_id, review.rating
+
+
+def shift(title, deltas, using, build=True):
+    """Add ``{rating: delta}`` to a title's summary.
+
+    A title without one is counted from scratch if ``build`` is set, and
+    left to its first read otherwise.
+    """
+    from .models import ReviewSummary
+
+    movie_id, tv_show_id = title
+    summary = ReviewSummary.objects.using(using).filter(movie_id=movie_id, tv_show_id=tv_show_id)
+    changes = {f'stars_{rating}': F(f'stars_{rating}') + delta for rating, delta in deltas.items()}
+    if summary.update(**changes):
+        return
+    with transaction.atomic(using=using):
+        # Waits out a build in progress, whose row the UPDATE then finds
+        if lock_title(movie_id, tv_show_id, using) and not summary.update(**changes) and build:
+            rebuild_summary(movie_id, tv_show_id, using)
+
+
+def review_saved(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    current = counted(instance)
+    # Set by Review.from_db: what the summary counted this review as
+    previous = None if created else getattr(instance, '_counted', None)
+    if previous is None and not created:
+        # Saved without being loaded first: what it replaced is unknown
+        rebuild_summary(*current[:2], using=using)
+    elif previous is None:
+        shift(current[:2], {current[2]: 1}, using)
+    elif previous[:2] != current[:2]:
+        shift(previous[:2], {previous[2]: -1}, using, build=False)
+        shift(current[:2], {current[2]: 1}, using)
+    elif previous[2] != current[2]:
+        shift(current[:2], {previous[2]: -1, current[2]: 1}, using)
+    instance._counted = current
+
+
+def review_deleted(sender, instance, using='default', **kwargs):
+    previous = getattr(instance, '_counted', None) or counted(instance)
+    shift(previous[:2], {previous[2]: -1}, using, build=False)
+
+
+def connect_signals():
+    from .models import Review
+
+    post_save.connect(review_saved, sender=Review, dispatch_uid='reviews-saved')
+    post_delete.connect(review_deleted, sender=Review, dispatch_uid='reviews-deleted')
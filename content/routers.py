@@ -0,0 +1,145 @@
+"""Read-replica database routing.
+
+Reads go to a healthy replica from ``settings.DATABASE_REPLICAS`` and writes
+go to ``default``. A request is pinned to the primary when it is a write
+(non-safe method), when it runs inside a transaction on the primary, or for
+``REPLICA_PIN_SECONDS`` after the session's last write, so users always read
+their own writes. See ``ReplicaPinningMiddleware``.
+
+A request, or a thread outside one such as a job worker, reads from a
+single replica, picked on its first read, so its queries all see the same
+point in time. It moves on only if that replica falls out of health.
+:func:`request_scope` starts that choice afresh for each request.
+Models in ``PRIMARY_ONLY_MODELS`` are read from the primary, since their
+readers act on rows they've just written.
+"""
+import contextlib
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+PIN_SESSION_KEY = '_pin_primary_until'
+
+# Apps and models whose reads must always see the latest write
+PRIMARY_ONLY_APPS = {'sessions'}
+PRIMARY_ONLY_MODELS = {'content.job'}
+
+_pinned = contextvars.ContextVar('pin_primary', default=False)
+# The replica the current request or thread reads from
+_replica = contextvars.ContextVar('replica', default=None)
+
+
+def pin_primary():
+    """Send the rest of the current request's reads to the primary."""
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def current_replica():
+    """The replica the current request or thread reads from, if it has read yet."""
+    return _replica.get()
+
+
+@contextlib.contextmanager
+def request_scope(pinned=False):
+    """Route one request's reads: all to the primary if ``pinned``, else to one replica."""
+    pinned_token = _pinned.set(pinned)
+    # Picked afresh on the request's first read
+    replica_token = _replica.set(None)
+    try:
+        yield
+    finally:
+        _pinned.reset(pinned_token)
+        _replica.reset(replica_token)
+
+
+def replica_lag(alias):
+    """Seconds the replica is behind the primary (0 when it can't be measured)."""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)'
+            )
+        else:
+            cursor.execute('SELECT 0')
+        return float(cursor.fetchone()[0])
+
+
+class ReplicaHealth:
+    """Per-process view of which replicas are reachable and within the lag budget."""
+
+    def __init__(self, aliases, max_lag=None, interval=None):
+        self.aliases = list(aliases)
+        self.max_lag = max_lag if max_lag is not None else getattr(settings, 'REPLICA_MAX_LAG', 10)
+        self.interval = interval if interval is not None else getattr(settings, 'REPLICA_HEALTH_INTERVAL', 15)
+        self.checked_at = None
+        self.available = list(self.aliases)
+        self.lock = threading.Lock()
+
+    def check(self):
+        available = []
+        for alias in self.aliases:
+            try:
+                lag = replica_lag(alias)
+            except Exception:
+                logger.warning('Replica %s is unreachable; routing reads elsewhere', alias)
+                continue
+            if lag > self.max_lag:
+                logger.warning('Replica %s is %.1fs behind; routing reads elsewhere', alias, lag)
+                continue
+            available.append(alias)
+        self.available = available
+        self.checked_at = time.monotonic()
+        return available
+
+    def healthy(self):
+        if self.checked_at is None or time.monotonic() - self.checked_at > self.interval:
+            # One thread refreshes; others keep using the last result
+            if self.lock.acquire(blocking=False):
+                try:
+                    self.check()
+                finally:
+                    self.lock.release()
+        return self.available
+
+
+class ReplicaRouter:
+    def __init__(self, replicas=None):
+        if replicas is None:
+            replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        self.health = ReplicaHealth(replicas)
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS or model._meta.label_lower in PRIMARY_ONLY_MODELS:
+            return DEFAULT_DB_ALIAS
+        if is_pinned() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = self.health.healthy()
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        replica = _replica.get()
+        if replica not in replicas:
+            replica = random.choice(replicas)
+            _replica.set(replica)
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,204 @@
+"""Low-overhead sampling profiler for live requests.
+
+``SamplingProfilerMiddleware`` picks the requests to profile:
+* every request to a URL name listed in ``SAMPLING_PROFILER_ROUTES``;
+* one request in ``SAMPLING_PROFILER_RATE``;
+* any request that sends ``X-Profile: <SAMPLING_PROFILER_TOKEN>``.
+
+Requests served on the main thread, such as gunicorn sync workers, are
+sampled with ``SIGPROF``. An ``ITIMER_PROF`` interval timer interrupts the
+request every ``SAMPLING_PROFILER_INTERVAL`` seconds of CPU time, and the
+handler records the stack at that bytecode. Requests on other threads
+register with the process's sampler thread instead. At the same interval
+it reads their frames through ``sys._current_frames()``. It can only run
+when the request thread releases the GIL, so these samples over-weight
+C calls that release it, such as database drivers. Set
+``SAMPLING_PROFILER_MODE = 'thread'`` to force the thread sampler. Either
+way, each stack is counted in collapsed form::
+
+    GET movie_detail;content.views:movie_detail;django.shortcuts:render;... 17
+
+Each stack is rooted at the request's method and URL name. It is cut off
+below the middleware, so it shows view code, template rendering and ORM
+materialization, not the server loop. Unsampled requests pay only the
+sampling decision, and the sampler thread sleeps while nothing is
+registered.
+
+Counts accumulate per process. They are written to
+``SAMPLING_PROFILER_DIR/stacks-<pid>.txt`` every
+``SAMPLING_PROFILER_FLUSH_INTERVAL`` seconds and at exit. ``manage.py
+flamegraph`` merges every process's file into input for flamegraph.pl or
+speedscope.
+"""
+import atexit
+import logging
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_DEPTH = 128
+
+
+class SampledRequest:
+    __slots__ = ('label', 'stop_frame')
+
+    def __init__(self, label, stop_frame):
+        self.label = label
+        self.stop_frame = stop_frame
+
+
+def frame_label(frame):
+    return f'{frame.f_globals.get("__name__", "?")}:{frame.f_code.co_name}'
+
+
+def collapse(frame, sampled):
+    """Root-first ``a;b;c`` for ``frame``, stopping at the request's stop frame."""
+    names = []
+    while frame is not None and frame is not sampled.stop_frame and len(names) < MAX_DEPTH:
+        names.append(frame_label(frame))
+        frame = frame.f_back
+    names.append(sampled.label)
+    return ';'.join(reversed(names))
+
+
+class Sampler:
+    def __init__(self, interval, output_dir=None, flush_interval=30, mode='auto'):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.flush_interval = flush_interval
+        self.mode = mode
+        # CPU time left until the next SIGPROF, carried over between
+        # requests so views shorter than the interval are sampled fairly
+        self.remaining = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.active = {}  # thread id -> SampledRequest
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.last_flush = time.monotonic()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='sampling-profiler', daemon=True)
+                self.thread.start()
+
+    def use_signals(self):
+        return (
+            self.mode in ('auto', 'signal') and hasattr(signal, 'setitimer')
+            and threading.current_thread() is threading.main_thread()
+        )
+
+    def register(self, label, stop_frame):
+        sampled = SampledRequest(label, stop_frame)
+        if self.use_signals():
+            signal.signal(signal.SIGPROF, lambda signum, frame: self.count(collapse(frame, sampled)))
+            signal.setitimer(signal.ITIMER_PROF, self.remaining, self.interval)
+            return
+        self.start()
+        with self.lock:
+            self.active[threading.get_ident()] = sampled
+        self.wake.set()
+
+    def unregister(self):
+        if self.use_signals():
+            self.remaining = signal.setitimer(signal.ITIMER_PROF, 0)[0] or self.interval
+            return
+        with self.lock:
+            self.active.pop(threading.get_ident(), None)
+            if not self.active:
+                self.wake.clear()
+
+    def count(self, stack):
+        # Runs inside the SIGPROF handler: taking self.lock could deadlock
+        self.stacks[stack] += 1
+        self.samples += 1
+
+    def sample(self):
+        with self.lock:
+            active = dict(self.active)
+        if not active:
+            return
+        frames = sys._current_frames()
+        stacks = [collapse(frames[ident], sampled) for ident, sampled in active.items() if ident in frames]
+        with self.lock:
+            self.stacks.update(stacks)
+            self.samples += len(stacks)
+
+    def run(self):
+        while True:
+            self.wake.wait(self.flush_interval)
+            try:
+                self.sample()
+                if self.output_dir and time.monotonic() - self.last_flush >= self.flush_interval:
+                    self.flush()
+            except Exception:
+                logger.exception('Sampling profiler failed')
+            time.sleep(self.interval)
+
+    def flush(self):
+        """Rewrite this process's stacks file with everything counted so far."""
+        self.last_flush = time.monotonic()
+        with self.lock:
+            stacks = dict(self.stacks)
+        if not stacks or not self.output_dir:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(str(self.output_dir), f'stacks-{os.getpid()}.txt')
+        with open(path + '.tmp', 'w') as fh:
+            for stack, count in stacks.items():
+                fh.write(f'{stack} {count}\n')
+        os.replace(path + '.tmp', path)
+        return path
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = Sampler(
+                    getattr(settings, 'SAMPLING_PROFILER_INTERVAL', 0.005),
+                    getattr(settings, 'SAMPLING_PROFILER_DIR', None),
+                    getattr(settings, 'SAMPLING_PROFILER_FLUSH_INTERVAL', 30),
+                    getattr(settings, 'SAMPLING_PROFILER_MODE', 'auto'),
+                )
+                if _sampler.output_dir:
+                    _sampler.start()
+                atexit.register(_sampler.flush)
+    return _sampler
+
+
+def should_sample(request, url_name):
+    token = getattr(settings, 'SAMPLING_PROFILER_TOKEN', '')
+    if token and request.headers.get('X-Profile') == token:
+        return True
+    if url_name and url_name in getattr(settings, 'SAMPLING_PROFILER_ROUTES', ()):
+        return True
+    rate = getattr(settings, 'SAMPLING_PROFILER_RATE', 0)
+    return rate > 0 and random.randrange(rate) == 0
+
+
+def read_stacks(paths):
+    """Sum collapsed-stack files into one Counter."""
+    stacks = Counter()
+    for path in paths:
+        with open(path) as fh:
+            for line in fh:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    stacks[stack] += int(count)
+    return stacks
@@ -0,0 +1,199 @@
+"""Opt-in SQL profiling with stack attribution and a slow-query log.
+
+:func:`profile` installs a ``connection.execute_wrapper`` on every database
+connection. Each query is recorded with its duration and row count. The
+row count is only known when the backend reports one: writes on every
+backend, SELECTs on PostgreSQL/MySQL but not SQLite. The record also keeps
+the project frame that issued it, e.g. ``content/views.py:52 in
+movie_detail``. ``QueryProfilerMiddleware`` wraps each request in
+:func:`profile` when ``SQL_PROFILER_ENABLED`` is set and writes JSON lines
+to a rotating log at ``SQL_SLOW_QUERY_LOG``:
+
+* ``slow``: a query that took at least ``SQL_SLOW_QUERY_MS``;
+* ``duplicate``: the same SQL *and* parameters run more than once in a request;
+* ``repeated``: the same SQL with different parameters run at least
+  ``SQL_REPEATED_QUERY_THRESHOLD`` times in a request, the usual N+1 shape.
+
+Bound parameters can hold password hashes, session keys and personal data,
+so records carry only the SQL and the number of parameters. Set
+``SQL_SLOW_QUERY_LOG_PARAMS`` to log their values too, e.g. while
+reproducing a problem locally.
+
+``manage.py sql_report`` summarizes the log.
+"""
+import contextlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('content.sql')
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+SKIP_FILES = (__file__, os.path.join('content', 'middleware.py'))
+
+_handler_path = None
+
+
+class QueryRecord:
+    __slots__ = ('alias', 'sql', 'params', 'many', 'ms', 'rows', 'origin')
+
+    def __init__(self, alias, sql, params, many, ms, rows, origin):
+        self.alias = alias
+        self.sql = sql
+        self.params = params
+        self.many = many
+        self.ms = ms
+        self.rows = rows
+        self.origin = origin
+
+    def as_dict(self, with_params=False):
+        return {
+            'alias': self.alias,
+            'sql': self.sql,
+            'param_count': None if self.many else len(self.params or ()),
+            'params': [repr(param) for param in self.params or ()] if with_params and not self.many else None,
+            'ms': round(self.ms, 3),
+            'rows': self.rows,
+            'origin': self.origin,
+        }
+
+
+def fingerprint(sql):
+    """SQL with ``IN`` lists of any length collapsed, for grouping."""
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+def project_frames(limit=3):
+    """``path:line in function`` for the innermost project frames, caller first."""
+    root = str(settings.BASE_DIR) + os.sep
+    frames = []
+    frame = sys._getframe(2)
+    while frame is not None and len(frames) < limit:
+        filename = frame.f_code.co_filename
+        if filename.startswith(root) and not filename.endswith(SKIP_FILES):
+            frames.append(f'{filename[len(root):]}:{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return frames
+
+
+class QueryProfiler:
+    """``execute_wrapper`` that records every query it sees."""
+
+    def __init__(self, frames=3):
+        self.frames = frames
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            rowcount = getattr(context['cursor'], 'rowcount', -1)
+            self.queries.append(QueryRecord(
+                context['connection'].alias, sql, params, many, ms,
+                rowcount if rowcount >= 0 else None, project_frames(self.frames),
+            ))
+
+    @property
+    def total_ms(self):
+        return sum(query.ms for query in self.queries)
+
+    def slow(self, threshold_ms):
+        return [query for query in self.queries if query.ms >= threshold_ms]
+
+    def duplicates(self):
+        """``(record, count)`` for identical SQL and parameters run more than once."""
+        counts = Counter((query.sql, repr(query.params)) for query in self.queries if not query.many)
+        first = {}
+        for query in self.queries:
+            first.setdefault((query.sql, repr(query.params)), query)
+        return [(first[key], count) for key, count in counts.items() if count > 1]
+
+    def repeated(self, threshold):
+        """``(record, count)`` for SQL run ``threshold`` or more times with any parameters."""
+        counts = Counter(fingerprint(query.sql) for query in self.queries)
+        first = {}
+        for query in self.queries:
+            first.setdefault(fingerprint(query.sql), query)
+        return [(first[key], count) for key, count in counts.items() if count >= threshold]
+
+
+@contextlib.contextmanager
+def profile(frames=3):
+    """Record every query run on any connection inside the block."""
+    profiler = QueryProfiler(frames)
+    with contextlib.ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profiler))
+        yield profiler
+
+
+def slow_query_logger():
+    """``content.sql`` with a rotating file handler for ``SQL_SLOW_QUERY_LOG``."""
+    global _handler_path
+    path = str(settings.SQL_SLOW_QUERY_LOG)
+    if _handler_path != path:
+        for handler in list(logger.handlers):
+            if isinstance(handler, RotatingFileHandler):
+                logger.removeHandler(handler)
+                handler.close()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = RotatingFileHandler(
+            path, maxBytes=getattr(settings, 'SQL_SLOW_QUERY_LOG_BYTES', 10 * 1024 * 1024),
+            backupCount=getattr(settings, 'SQL_SLOW_QUERY_LOG_BACKUPS', 5), delay=True,
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        _handler_path = path
+    return logger
+
+
+def log_request(request, profiler):
+    """Write the slow, duplicate and repeated queries of one request to the log."""
+    entries = [('slow', query, 1) for query in profiler.slow(getattr(settings, 'SQL_SLOW_QUERY_MS', 100))]
+    entries += [('duplicate', query, count) for query, count in profiler.duplicates()]
+    threshold = getattr(settings, 'SQL_REPEATED_QUERY_THRESHOLD', 5)
+    entries += [('repeated', query, count) for query, count in profiler.repeated(threshold)]
+    if not entries:
+        return 0
+    log = slow_query_logger()
+    with_params = getattr(settings, 'SQL_SLOW_QUERY_LOG_PARAMS', False)
+    base = {
+        'ts': round(time.time(), 3),
+        'method': request.method,
+        'path': request.path,
+        'request_queries': len(profiler.queries),
+        'request_ms': round(profiler.total_ms, 3),
+    }
+    for kind, query, count in entries:
+        log.info(json.dumps({**base, 'kind': kind, 'count': count, **query.as_dict(with_params)}))
+    return len(entries)
+
+
+def read_log(path):
+    """Yield records from the log and its rotated backups, oldest file first."""
+    paths = [path]
+    index = 1
+    while os.path.exists(f'{path}.{index}'):
+        paths.append(f'{path}.{index}')
+        index += 1
+    for name in reversed(paths):
+        if not os.path.exists(name):
+            continue
+        with open(name) as fh:
+            for line in fh:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
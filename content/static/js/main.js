@@ -131,3 +131,53 @@ function setupRatingInput() {
 
 // Initialize rating inputs when DOM is loaded
 document.addEventListener('DOMContentLoaded', setupRatingInput);
+
+// Playback progress heartbeats for <video data-progress-type="movie|episode" data-progress-id="..." data-progress-url="...">
+function setupProgressHeartbeats() {
+    const csrfCookie = document.cookie.split('; ').find(row => row.startsWith('csrftoken='));
+    const csrfToken = csrfCookie ? csrfCookie.split('=')[1] : '';
+
+    document.querySelectorAll('video[data-progress-url]').forEach(video => {
+        let lastSent = 0;
+        const send = () => {
+            const body = new URLSearchParams({
+                content_type: video.dataset.progressType,
+                content_id: video.dataset.progressId,
+                position: Math.floor(video.currentTime),
+                duration: Math.floor(video.duration || 0),
+            });
+            fetch(video.dataset.progressUrl, {
+                method: 'POST',
+                headers: {'X-CSRFToken': csrfToken},
+                body: body,
+                keepalive: true,
+            });
+        };
+        video.addEventListener('timeupdate', () => {
+            if (Date.now() - lastSent >= 10000) {
+                lastSent = Date.now();
+                send();
+            }
+        });
+        video.addEventListener('pause', send);
+        video.addEventListener('ended', send);
+    });
+}
+
+document.addEventListener('DOMContentLoaded', setupProgressHeartbeats);
+
+// Adaptive (HLS) playback: native in Safari, hls.js elsewhere
+function setupAdaptivePlayers() {
+    document.querySelectorAll('video[data-hls-src]').forEach(video => {
+        const source = video.dataset.hlsSrc;
+        if (video.canPlayType('application/vnd.apple.mpegurl')) {
+            video.src = source;
+        } else if (window.Hls && Hls.isSupported()) {
+            const hls = new Hls();
+            hls.loadSource(source);
+            hls.attachMedia(video);
+        }
+    });
+}
+
+document.addEventListener('DOMContentLoaded', setupAdaptivePlayers);
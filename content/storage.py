@@ -0,0 +1,55 @@
+"""Static files storage that fingerprints and pre-compresses collected assets."""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # optional; gzip variants are always written
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico'}
+
+# Only keep a compressed variant if it saves at least this fraction
+MIN_SAVING = 0.05
+
+
+def compress_file(path):
+    """Write ``path.gz`` (and ``path.br`` when brotli is installed) next to ``path``.
+
+    Returns the list of variant paths written.
+    """
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    encoders = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        encoders.append(('.br', lambda d: brotli.compress(d, quality=11)))
+    written = []
+    for suffix, encode in encoders:
+        compressed = encode(data)
+        if len(compressed) > len(data) * (1 - MIN_SAVING):
+            continue
+        with open(path + suffix, 'wb') as fh:
+            fh.write(compressed)
+        written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also writes gzip/brotli variants.
+
+    Hashed names are safe to cache forever; the compressed siblings let the
+    static middleware serve them without compressing per request.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            if self.exists(name):
+                compress_file(self.path(name))
@@ -0,0 +1,256 @@
+"""Database-backed background task queue.
+
+Slow side effects are registered with :func:`task` and queued from the request
+path with ``some_task.enqueue(...)``; ``manage.py run_workers`` executes them.
+Jobs live in the ``Job`` table, so no external broker is needed::
+
+    @task(max_attempts=5)
+    def refresh_tmdb_movie(movie_id):
+        ...
+
+    refresh_tmdb_movie.enqueue(movie.id, idempotency_key=f'tmdb:movie:{movie.id}')
+
+Workers claim a job with a conditional UPDATE (``WHERE status = 'queued'``), so
+several processes can poll the same table without a row-locking database.
+Failed jobs are retried with exponential backoff until ``max_attempts``.
+With ``TASK_QUEUE_EAGER`` (the development settings) ``enqueue`` runs the
+task on the spot instead, once, with no worker needed.
+
+A running job holds a lease: its ``locked_at``. The worker renews it every
+``TASK_QUEUE_HEARTBEAT_INTERVAL`` seconds from a side thread while the task
+runs, so a long transcode is never mistaken for one whose worker died.
+Only a lease older than ``TASK_QUEUE_VISIBILITY_TIMEOUT`` is requeued.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+class Task:
+    """A registered task function; call it directly or queue it with enqueue()."""
+
+    def __init__(self, func, name, priority=0, max_attempts=3):
+        self.func = func
+        self.name = name
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, idempotency_key=None, priority=None, delay=0, **kwargs):
+        return enqueue(
+            self.name, args, kwargs,
+            idempotency_key=idempotency_key,
+            priority=self.priority if priority is None else priority,
+            max_attempts=self.max_attempts,
+            delay=delay,
+        )
+
+
+def task(func=None, *, name=None, priority=0, max_attempts=3):
+    """Register a function as a background task."""
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__qualname__}'
+        registered = Task(func, task_name, priority=priority, max_attempts=max_attempts)
+        registry[task_name] = registered
+        return registered
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def enqueue(name, args=(), kwargs=None, idempotency_key=None, priority=0, max_attempts=3, delay=0):
+    """Queue a job and return it.
+
+    If a job with the same ``idempotency_key`` is already queued or running,
+    that job is returned instead of creating a duplicate.
+    """
+    from .models import Job
+
+    if getattr(settings, 'TASK_QUEUE_EAGER', False):
+        # Stands in for a worker, so a failure is logged rather than raised
+        # into the request that queued the job
+        try:
+            registry[name](*args, **(kwargs or {}))
+        except Exception:
+            logger.exception('Eager job %s failed', name)
+        return None
+
+    job = Job(
+        name=name,
+        args=list(args),
+        kwargs=kwargs or {},
+        priority=priority,
+        max_attempts=max_attempts,
+        idempotency_key=idempotency_key,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    if idempotency_key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+        return job
+    except IntegrityError:
+        existing = Job.objects.filter(
+            idempotency_key=idempotency_key, status__in=[Job.QUEUED, Job.RUNNING]
+        ).first()
+        if existing is None:
+            # The active job finished between our insert and lookup
+            return enqueue(name, args, kwargs, idempotency_key, priority, max_attempts, delay)
+        return existing
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'TASK_QUEUE_RETRY_BACKOFF', 5)
+    return min(base * 2 ** (attempts - 1), 3600)
+
+
+def requeue_stale_jobs():
+    """Return jobs held by workers that died mid-run to the queue."""
+    from .models import Job
+
+    timeout = getattr(settings, 'TASK_QUEUE_VISIBILITY_TIMEOUT', 600)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff).update(
+        status=Job.QUEUED, locked_by='', locked_at=None
+    )
+
+
+def renew_lease(job):
+    """Push back a running job's ``locked_at``; False if another worker has it now."""
+    from .models import Job
+
+    return bool(Job.objects.filter(id=job.id, status=Job.RUNNING, locked_by=job.locked_by).update(
+        locked_at=timezone.now()
+    ))
+
+
+class Heartbeat(threading.Thread):
+    """Renews a job's lease until stopped."""
+
+    def __init__(self, job, interval):
+        super().__init__(name=f'heartbeat-{job.id}', daemon=True)
+        self.job = job
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    if not renew_lease(self.job):
+                        logger.warning('Job %s lost its lease', self.job)
+                        return
+                except Exception:
+                    logger.exception('Could not renew the lease of job %s', self.job)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def claim_next_job(worker_id, batch=10):
+    """Atomically take the highest-priority due job, or return None."""
+    from .models import Job
+
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+        .order_by('-priority', 'run_at', 'id')
+        .values_list('id', flat=True)[:batch]
+    )
+    for job_id in candidates:
+        claimed = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def finish(job, **changes):
+    """Record a job's outcome, unless its lease expired and it was requeued meanwhile."""
+    from .models import Job
+
+    if Job.objects.filter(id=job.id, status=Job.RUNNING, locked_by=job.locked_by).update(
+        locked_by='', locked_at=None, **changes
+    ):
+        return True
+    logger.warning('Job %s lost its lease while running; dropping its result', job)
+    return False
+
+
+def execute_job(job):
+    """Run a claimed job and record success, retry or failure."""
+    from .models import Job
+
+    registered = registry.get(job.name)
+    heartbeat = Heartbeat(job, getattr(settings, 'TASK_QUEUE_HEARTBEAT_INTERVAL', 60))
+    heartbeat.start()
+    try:
+        if registered is None:
+            raise LookupError(f'Unknown task {job.name!r}')
+        registered.func(*job.args, **job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            logger.warning('Job %s failed (attempt %s/%s), retrying', job, job.attempts, job.max_attempts)
+            finish(
+                job, status=Job.QUEUED, last_error=error,
+                run_at=timezone.now() + timedelta(seconds=retry_delay(job.attempts)),
+            )
+        else:
+            logger.error('Job %s failed permanently', job)
+            finish(job, status=Job.FAILED, last_error=error, finished_at=timezone.now())
+        return False
+    finally:
+        heartbeat.stop()
+    return finish(job, status=Job.DONE, finished_at=timezone.now())
+
+
+def run_worker(worker_id=None, poll_interval=1.0, burst=False, should_stop=lambda: False):
+    """Claim and run jobs until ``should_stop()`` or, in burst mode, the queue drains.
+
+    Returns the number of jobs processed.
+    """
+    worker_id = worker_id or default_worker_id()
+    processed = 0
+    last_recovery = 0.0
+    while not should_stop():
+        if time.monotonic() - last_recovery > 60:
+            requeue_stale_jobs()
+            last_recovery = time.monotonic()
+        close_old_connections()
+        job = claim_next_job(worker_id)
+        if job is None:
+            if burst:
+                break
+            time.sleep(poll_interval)
+            continue
+        execute_job(job)
+        processed += 1
+    return processed
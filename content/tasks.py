@@ -0,0 +1,43 @@
+"""Background tasks run by `manage.py run_workers`."""
+from django.apps import apps
+from django.core.cache import cache
+
+from . import images, packaging, tmdb, trending
+from .models import Movie
+from .taskqueue import task
+
+
+@task(priority=-10)
+def build_image_renditions(model_label, pk, field_name, source_name):
+    """Generate poster/avatar derivatives for an uploaded image."""
+    images.process_image_field(apps.get_model(model_label), pk, field_name, source_name)
+
+
+@task(priority=-20, max_attempts=2)
+def package_episode_video(episode_id, source_name):
+    """Transcode an uploaded episode into multi-bitrate HLS."""
+    packaging.package_episode(episode_id, source_name)
+
+
+@task(max_attempts=5)
+def refresh_tmdb_movie(movie_id):
+    """Fetch TMDB details for a movie into the cache."""
+    from urllib.error import URLError
+
+    movie = Movie.objects.filter(id=movie_id).only('title', 'release_date').first()
+    if movie is None:
+        return
+    year = movie.release_date.year if movie.release_date else None
+    try:
+        context = tmdb.fetch_movie(movie.title, year)
+    except (URLError, TimeoutError, ValueError):
+        # Cache the miss briefly so pages stop re-queueing, then let the job retry
+        cache.set(tmdb.movie_cache_key(movie_id), dict(tmdb.EMPTY), 60 * 5)
+        raise
+    cache.set(tmdb.movie_cache_key(movie_id), context, tmdb.CACHE_TIMEOUT)
+
+
+@task
+def rollup_trending():
+    """Recompute time-decayed trending scores from the hourly buckets."""
+    trending.rollup()
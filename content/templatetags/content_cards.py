@@ -0,0 +1,127 @@
+"""Movie/TV show cards, rendered once per title version and reused.
+
+``{% title_card obj %}`` renders the poster card used in the home rows;
+``style='grid'`` renders the overlay card of the genre, search and watchlist
+grids. The title-dependent HTML is memoized per process, keyed by
+(style, kind, id, ``updated_at``). Saving a title, or building its poster
+renditions, bumps ``updated_at`` and so retires its cached cards. Every
+process also drops a title's cards when ``content.invalidation`` reports it
+changed, which covers writes that leave ``updated_at`` alone.
+
+Per-request parts (watchlist forms with their CSRF token, added dates) aren't
+memoized; they're spliced into the cached HTML at placeholder comments.
+"""
+import threading
+from collections import OrderedDict
+
+from django import template
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.dateformat import format as format_date
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from ..catalog import MovieRecord
+from ..models import Movie
+
+register = template.Library()
+
+ACTIONS_MARKER = '<!--card:actions-->'
+NOTE_MARKER = '<!--card:note-->'
+
+_cards = OrderedDict()
+_lock = threading.Lock()
+# Bumped by every invalidation, so a card rendered from data read before it
+# isn't stored after it
+_generation = 0
+
+
+def memo_size():
+    return getattr(settings, 'CARD_MEMO_SIZE', 2000)
+
+
+def clear_cards():
+    global _generation
+    with _lock:
+        _cards.clear()
+        _generation += 1
+
+
+def forget_cards(changes):
+    """Invalidation subscriber: drop the cards of changed titles (all of them for ``None``)."""
+    global _generation
+    if changes is None:
+        clear_cards()
+        return
+    titles = {(kind, pk) for kind, ids in changes.items() for pk in ids}
+    with _lock:
+        for key in [key for key in _cards if (key[1], key[2]) in titles]:
+            del _cards[key]
+        _generation += 1
+
+
+def card_html(obj, style, show_kind):
+    kind = 'movie' if isinstance(obj, (Movie, MovieRecord)) else 'tvshow'
+    key = (style, kind, obj.pk, obj.updated_at, show_kind)
+    size = memo_size()
+    if size:
+        with _lock:
+            html = _cards.get(key)
+            if html is not None:
+                _cards.move_to_end(key)
+                return kind, html
+            generation = _generation
+    html = render_to_string(f'content/includes/title_card_{style}.html', {
+        'obj': obj,
+        'kind': kind,
+        'url': reverse('movie_detail' if kind == 'movie' else 'tvshow_detail', args=[obj.pk]),
+        'icon': 'fa-film' if kind == 'movie' else 'fa-tv',
+        'show_kind': show_kind,
+    })
+    if size:
+        with _lock:
+            if generation != _generation:
+                return kind, html
+            _cards[key] = html
+            while len(_cards) > size:
+                _cards.popitem(last=False)
+    return kind, html
+
+
+def watchlist_form(context, action, kind, obj):
+    csrf_token = context.get('csrf_token', '')
+    if action == 'remove':
+        url, icon, confirm = reverse('remove_from_watchlist'), 'fa-trash', " onclick=\"return confirm('Remove from your list?')\""
+    else:
+        url, icon, confirm = reverse('add_to_watchlist'), 'fa-plus', ''
+    return format_html(
+        '<form method="post" action="{}" class="d-inline">'
+        '<input type="hidden" name="csrfmiddlewaretoken" value="{}">'
+        '<input type="hidden" name="content_type" value="{}">'
+        '<input type="hidden" name="content_id" value="{}">'
+        '<button type="submit" class="btn btn-sm btn-outline-light"{}><i class="fas {}"></i></button>'
+        '</form>',
+        url, csrf_token, kind, obj.pk, mark_safe(confirm), icon,
+    )
+
+
+@register.simple_tag(takes_context=True)
+def title_card(context, obj, style='row', action=None, added_at=None, show_kind=False):
+    """A poster card for a Movie or TVShow, or their catalog snapshot records.
+
+    Grid cards take an ``action`` ('add' or 'remove') for the watchlist form
+    shown to signed-in users, and optionally the date it was added to a list.
+    """
+    kind, html = card_html(obj, style, show_kind)
+    if style == 'grid':
+        user = context.get('user')
+        form = ''
+        if action and user is not None and user.is_authenticated:
+            form = watchlist_form(context, action, kind, obj)
+        html = html.replace(ACTIONS_MARKER, form, 1)
+        note = ''
+        if added_at:
+            note = format_html('<small class="text-muted">Added {}</small>', format_date(added_at, 'M d, Y'))
+        html = html.replace(NOTE_MARKER, note, 1)
+    return mark_safe(html)
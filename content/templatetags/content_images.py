@@ -0,0 +1,36 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..images import MIME_TYPES, renditions_field, rendition_formats, srcset
+
+register = template.Library()
+
+CARD_SIZES = '(min-width: 1024px) 13rem, (min-width: 768px) 12rem, 48vw'
+
+
+@register.simple_tag
+def responsive_img(obj, field_name, alt='', css_class='', sizes=CARD_SIZES, loading='lazy'):
+    """Render an image field as a <picture> with AVIF/WebP srcsets.
+
+    Falls back to the original upload until its renditions have been built.
+    """
+    image = getattr(obj, field_name)
+    if not image:
+        return ''
+    manifest = getattr(obj, renditions_field(field_name), None) or {}
+    sources = [
+        (MIME_TYPES[fmt], srcset(manifest, fmt), sizes)
+        for fmt in rendition_formats()
+        if manifest.get('formats', {}).get(fmt)
+    ]
+    img = format_html(
+        '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+        image.url, alt, css_class, loading,
+    )
+    if not sources:
+        return img
+    return format_html(
+        '<picture>{}{}</picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', sources),
+        img,
+    )
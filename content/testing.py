@@ -0,0 +1,83 @@
+"""Query and wall-time budgets for tests.
+
+``query_budget`` works as a context manager or a decorator. It counts the
+queries a block runs and times it, then fails the test if either goes over
+budget::
+
+    with query_budget(6, max_ms=300, label='home'):
+        self.client.get('/')
+
+    @query_budget(4)
+    def test_search(self): ...
+
+Every measurement is kept in ``measurements``. ``write_report`` dumps them
+as JSON; the route budget tests in ``content/tests.py`` do that when
+``QUERY_BUDGET_REPORT`` names a file. Wall times vary with the machine, so
+``QUERY_BUDGET_TIME_FACTOR`` scales every time budget; set it to ``0`` to
+skip the timing assertions.
+"""
+import contextlib
+import json
+import os
+import time
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+measurements = []
+
+
+def time_factor():
+    return float(os.environ.get('QUERY_BUDGET_TIME_FACTOR', 1))
+
+
+class BudgetExceeded(AssertionError):
+    pass
+
+
+class query_budget(contextlib.ContextDecorator):
+    def __init__(self, max_queries, max_ms=None, label=None, using='default'):
+        self.max_queries = max_queries
+        self.max_ms = max_ms
+        self.label = label
+        self.using = using
+        self.queries = []
+        self.elapsed_ms = None
+
+    def __enter__(self):
+        self.capture = CaptureQueriesContext(connections[self.using])
+        self.capture.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed_ms = (time.perf_counter() - self.started) * 1000
+        self.capture.__exit__(exc_type, exc, tb)
+        self.queries = [query['sql'] for query in self.capture.captured_queries]
+        if exc_type is not None:
+            return False
+        measurements.append({
+            'label': self.label,
+            'queries': len(self.queries),
+            'max_queries': self.max_queries,
+            'ms': round(self.elapsed_ms, 2),
+            'max_ms': self.max_ms,
+        })
+        if len(self.queries) > self.max_queries:
+            listing = '\n'.join(f'{i}. {sql}' for i, sql in enumerate(self.queries, 1))
+            raise BudgetExceeded(
+                f'{self.label or "block"} ran {len(self.queries)} queries, budget is {self.max_queries}:\n{listing}'
+            )
+        factor = time_factor()
+        if self.max_ms is not None and factor and self.elapsed_ms > self.max_ms * factor:
+            raise BudgetExceeded(
+                f'{self.label or "block"} took {self.elapsed_ms:.1f} ms, budget is {self.max_ms * factor:.0f} ms'
+            )
+        return False
+
+
+def write_report(path, extra=None):
+    """Write every measurement so far (plus ``extra``) to ``path`` as JSON."""
+    report = {'measurements': measurements, **(extra or {})}
+    with open(path, 'w') as fh:
+        json.dump(report, fh, indent=2, sort_keys=True)
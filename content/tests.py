@@ -1,3 +1,2018 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import os
+import random
+import re
+import runpy
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, transaction
+from django.template import Context, Template
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.http import HttpResponse, QueryDict
+from django.test import (
+    LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from unittest import mock
+from urllib.error import URLError
+
+from netflix_clone.database import database_profile
+
+from . import (
+    catalog, checks, facets, feeds, fileserving, health, images, invalidation, loadtest, packaging, progress, ratelimit,
+    reviews, routers, sampling, sqlprofile, taskqueue, tasks, titlesearch, tmdb, trending,
+)
+from .admin import EstimatedCountPaginator
+from .testing import query_budget, write_report
+from .templatetags import content_cards
+from .middleware import ReplicaPinningMiddleware
+from .models import (
+    Genre, Movie, TVShow, Episode, Review, ReviewSummary, Job, InvalidationEvent, Profile, ProfileWatchlist, WatchProgress,
+    TrendingBucket, TrendingScore, VideoRendition, Watchlist,
+)
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'counters': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'counters'},
+}
+
+# Keep the developer's file cache out of the tests, background flush timers
+# and invalidation polls from firing against the test database, and rate
+# limits out of the way.
+# TestCase never runs on_commit hooks, so the catalog snapshot would go stale
+# between a test's writes and its requests; tests that want it enable it.
+# Jobs are queued as in production, not run inline as under runserver.
+_module_settings = override_settings(
+    PROGRESS_FLUSH_INTERVAL=3600, TRENDING_FLUSH_INTERVAL=3600, RATELIMIT_ENABLED=False,
+    CATALOG_SNAPSHOT_ENABLED=False, INVALIDATION_POLL_INTERVAL=3600, TASK_QUEUE_EAGER=False,
+    CACHES=LOCMEM_CACHES,
+)
+
+
+def setUpModule():
+    _module_settings.enable()
+
+
+def tearDownModule():
+    _module_settings.disable()
+    trending.drain()
+
+
+def make_movie(title, genres=(), **kwargs):
+    defaults = {
+        'description': f'{title} description',
+        'release_date': date(2020, 1, 1),
+        'duration': 120,
+        'rating': 7.5,
+    }
+    defaults.update(kwargs)
+    movie = Movie.objects.create(title=title, **defaults)
+    if genres:
+        movie.genres.set(genres)
+    return movie
+
+
+def make_tvshow(title, genres=(), **kwargs):
+    defaults = {
+        'description': f'{title} description',
+        'release_date': date(2020, 1, 1),
+        'rating': 8.0,
+    }
+    defaults.update(kwargs)
+    tvshow = TVShow.objects.create(title=title, **defaults)
+    if genres:
+        tvshow.genres.set(genres)
+    return tvshow
+
+
+def make_episode(tvshow, season, number, **kwargs):
+    defaults = {
+        'title': f'Episode {number}',
+        'description': 'An episode',
+        'duration': 45,
+        'video_url': 'https://example.com/video.mp4',
+        'release_date': date(2020, 1, 1),
+    }
+    defaults.update(kwargs)
+    return Episode.objects.create(tv_show=tvshow, season_number=season, episode_number=number, **defaults)
+
+
+class AdminChangelistQueryTests(TestCase):
+    changelists = ['genre', 'movie', 'tvshow', 'episode', 'review', 'watchlist']
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.admin)
+        self.genres = [Genre.objects.create(name=f'Genre {i}') for i in range(3)]
+
+    def add_catalog(self, start, count):
+        for i in range(start, start + count):
+            movie = make_movie(f'Movie {i}', self.genres)
+            tvshow = make_tvshow(f'Show {i}', self.genres)
+            make_episode(tvshow, 1, 1)
+            make_episode(tvshow, 1, 2)
+            user = User.objects.create_user(f'viewer{i}')
+            Review.objects.create(user=user, movie=movie, rating=4, comment='Good')
+            Review.objects.create(user=user, tv_show=tvshow, rating=5, comment='Great')
+
+    def changelist_queries(self, model_name):
+        url = reverse(f'admin:content_{model_name}_changelist')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_changelist_query_count_is_independent_of_rows(self):
+        self.add_catalog(0, 2)
+        small = {name: self.changelist_queries(name) for name in self.changelists}
+        self.add_catalog(100, 6)
+        for name in self.changelists:
+            with self.subTest(changelist=name):
+                self.assertEqual(self.changelist_queries(name), small[name])
+
+    def test_genre_counts_are_annotated(self):
+        make_movie('Solo', [self.genres[0]])
+        tvshow = make_tvshow('Series', [self.genres[0], self.genres[1]])
+        response = self.client.get(reverse('admin:content_genre_changelist'))
+        genre = response.context['cl'].result_list.get(pk=self.genres[0].pk)
+        self.assertEqual(genre._movie_count, 1)
+        self.assertEqual(genre._tvshow_count, 1)
+        self.assertEqual(tvshow.genres.count(), 2)
+
+    def test_autocomplete_filter_only_loads_selected_object(self):
+        tvshow = make_tvshow('Picked')
+        make_episode(tvshow, 1, 1)
+        make_tvshow('Not picked')
+        url = reverse('admin:content_episode_changelist')
+        response = self.client.get(url, {'tv_show__id__exact': tvshow.pk})
+        self.assertContains(response, 'Picked')
+        self.assertNotContains(response, 'Not picked')
+
+    def test_estimated_paginator_counts_filtered_querysets_exactly(self):
+        make_movie('One')
+        make_movie('Two')
+        paginator = EstimatedCountPaginator(Movie.objects.filter(title='One'), 10)
+        self.assertEqual(paginator.count, 1)
+
+    def test_estimated_paginator_uses_estimate_for_large_tables(self):
+        make_movie('One')
+        paginator = EstimatedCountPaginator(Movie.objects.all(), 10)
+        paginator.exact_count_threshold = 0
+        with self.assertNumQueries(1):
+            self.assertGreaterEqual(paginator.count, 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir(), CATALOG_SNAPSHOT_ENABLED=True)
+class RouteQueryBudgetTests(TestCase):
+    """Every route in content/urls.py runs a fixed number of queries.
+
+    Each route is measured on a small catalog and again after the catalog,
+    the reviews and the viewer's lists have grown, and must stay within its
+    query (and wall-time) budget at both sizes. Requests are measured warm,
+    after one unmeasured request has filled the per-process caches,
+    including the catalog snapshot.
+    """
+    # route name -> (max queries, max ms)
+    budgets = {
+        'home': (4, 300),
+        'profile_select': (4, 200),
+        'profile_use': (6, 200),
+        'movie_detail': (5, 200),
+        'movie_reviews': (4, 200),
+        'tvshow_detail': (5, 200),
+        'tvshow_reviews': (4, 200),
+        'episode_detail': (2, 200),
+        'episode_manifest': (2, 100),
+        'search': (2, 300),
+        'genre_view': (2, 300),
+        'browse': (2, 300),
+        'watchlist': (3, 300),
+        'add_to_watchlist': (7, 200),
+        'remove_from_watchlist': (6, 200),
+        'add_review': (11, 200),
+        'update_progress': (5, 100),
+        'media': (1, 100),
+    }
+    sizes = (3, 25)
+    label = ''
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        path = os.environ.get('QUERY_BUDGET_REPORT')
+        if path:
+            write_report(path, {'sizes': cls.sizes, 'budgets': cls.budgets})
+
+    def setUp(self):
+        cache.clear()
+        catalog.reset()
+        self.addCleanup(catalog.reset)
+        self.genres = [Genre.objects.create(name=f'Genre {i}') for i in range(4)]
+        self.viewer = User.objects.create_user('viewer', password='password')
+        self.profile = Profile.objects.create(user=self.viewer, name='Viewer')
+        self.client.force_login(self.viewer)
+        session = self.client.session
+        session['active_profile_id'] = self.profile.pk
+        session.save()
+        self.catalog_size = 0
+        self.media_name = f'budget-{os.getpid()}.bin'
+        with open(os.path.join(tempfile.gettempdir(), self.media_name), 'wb') as fh:
+            fh.write(b'x' * 4096)
+        self.addCleanup(os.remove, os.path.join(tempfile.gettempdir(), self.media_name))
+        self.addCleanup(progress.flush)
+
+    def grow_catalog(self, size):
+        """Add titles, and reviews/list entries on the first titles, up to ``size``."""
+        for i in range(self.catalog_size, size):
+            genres = self.genres[:i % len(self.genres) + 1]
+            movie = make_movie(f'Movie {i}', genres, featured=i % 2 == 0)
+            tvshow = make_tvshow(f'Show {i}', genres, featured=i % 2 == 0)
+            for number in (1, 2, 3):
+                make_episode(tvshow, 1 + number // 3, number)
+            user = User.objects.create_user(f'reviewer{i}')
+            Review.objects.create(user=user, movie=self.first_movie if i else movie, rating=4, comment='Good')
+            Review.objects.create(user=user, tv_show=self.first_tvshow if i else tvshow, rating=5, comment='Great')
+            ProfileWatchlist.objects.create(profile=self.profile, movie=movie)
+            Watchlist.objects.create(user=self.viewer, tv_show=tvshow)
+            if not i:
+                self.first_movie, self.first_tvshow = movie, tvshow
+                self.first_episode = tvshow.episodes.order_by('season_number', 'episode_number').first()
+                for height in (360, 720):
+                    VideoRendition.objects.create(
+                        episode=self.first_episode, source='episodes/a.mp4', name=f'{height}p', width=height * 16 // 9,
+                        height=height, bandwidth=height * 3000, average_bandwidth=height * 2500,
+                        codecs='avc1.64001f,mp4a.40.2', playlist=f'hls/x/{height}p/index.m3u8', segment_count=10,
+                    )
+        self.catalog_size = size
+        # What the on_commit hooks would do outside a TestCase
+        catalog.bump_version()
+
+    def request(self, name):
+        movie, tvshow, episode = self.first_movie, self.first_tvshow, self.first_episode
+        item = {'content_type': 'movie', 'content_id': movie.pk}
+        requests = {
+            'home': lambda: self.client.get(reverse('home')),
+            'profile_select': lambda: self.client.get(reverse('profile_select')),
+            'profile_use': lambda: self.client.get(reverse('profile_use', args=[self.profile.pk])),
+            'movie_detail': lambda: self.client.get(reverse('movie_detail', args=[movie.pk])),
+            'movie_reviews': lambda: self.client.get(reverse('movie_reviews', args=[movie.pk])),
+            'tvshow_detail': lambda: self.client.get(reverse('tvshow_detail', args=[tvshow.pk])),
+            'tvshow_reviews': lambda: self.client.get(reverse('tvshow_reviews', args=[tvshow.pk])),
+            'episode_detail': lambda: self.client.get(reverse('episode_detail', args=[episode.pk])),
+            'episode_manifest': lambda: self.client.get(reverse('episode_manifest', args=[episode.pk])),
+            'search': lambda: self.client.get(reverse('search'), {'q': 'o'}),
+            'genre_view': lambda: self.client.get(reverse('genre_view', args=[self.genres[0].pk])),
+            'browse': lambda: self.client.get(
+                reverse('browse'), {'genre': [self.genres[0].pk, self.genres[1].pk], 'match': 'any', 'rating_min': 5},
+            ),
+            'watchlist': lambda: self.client.get(reverse('watchlist')),
+            'add_to_watchlist': lambda: self.client.post(reverse('add_to_watchlist'), item),
+            'remove_from_watchlist': lambda: self.client.post(reverse('remove_from_watchlist'), item),
+            'add_review': lambda: self.client.post(reverse('add_review'), {**item, 'rating': 3, 'comment': 'Fine'}),
+            'update_progress': lambda: self.client.post(
+                reverse('update_progress'), {**item, 'position': 30, 'duration': 6000},
+            ),
+            'media': lambda: self.client.get(reverse('media', args=[self.media_name])),
+        }
+        return requests[name]()
+
+    def measure(self, name):
+        max_queries, max_ms = self.budgets[name]
+        self.request(name)
+        with query_budget(max_queries, max_ms, label=f'{name}@{self.catalog_size}{self.label}') as budget:
+            response = self.request(name)
+        self.assertLess(response.status_code, 400, name)
+        return len(budget.queries)
+
+    def test_every_route_has_a_budget(self):
+        from . import urls
+
+        names = {pattern.name for pattern in urls.urlpatterns} | {'media'}
+        self.assertEqual(names, set(self.budgets))
+
+    def test_query_counts_do_not_grow_with_catalog(self):
+        self.grow_catalog(self.sizes[0])
+        small = {name: self.measure(name) for name in self.budgets}
+        self.grow_catalog(self.sizes[1])
+        for name in self.budgets:
+            with self.subTest(route=name):
+                self.assertEqual(self.measure(name), small[name])
+
+    def test_budget_failure_lists_the_queries(self):
+        from .testing import BudgetExceeded
+
+        with self.assertRaisesRegex(BudgetExceeded, r'ran 2 queries, budget is 1:\n1\. SELECT'):
+            with query_budget(1, label='two counts'):
+                Genre.objects.count()
+                Movie.objects.count()
+
+
+@override_settings(CATALOG_SNAPSHOT_ENABLED=False)
+class RouteQueryBudgetWithoutSnapshotTests(RouteQueryBudgetTests):
+    """The same routes served from the ORM, as when the snapshot is over budget."""
+    budgets = {
+        **RouteQueryBudgetTests.budgets,
+        'home': (9, 300),
+        'movie_detail': (7, 200),
+        'movie_reviews': (5, 200),
+        'tvshow_detail': (9, 200),
+        'tvshow_reviews': (5, 200),
+        'episode_detail': (8, 200),
+        'search': (4, 300),
+        'genre_view': (5, 300),
+        'browse': (7, 300),
+    }
+    label = '/orm'
+
+
+class SqlProfilerTests(TestCase):
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir, True)
+        self.log_path = os.path.join(self.log_dir, 'slow.log')
+
+    def test_duplicate_and_repeated_queries(self):
+        genres = [Genre.objects.create(name=f'Genre {i}') for i in range(5)]
+        with sqlprofile.profile() as profiler:
+            Genre.objects.get(pk=genres[0].pk)
+            for genre in genres:
+                Genre.objects.get(pk=genre.pk)
+        self.assertEqual(len(profiler.queries), 6)
+        [(duplicate, count)] = profiler.duplicates()
+        self.assertEqual(count, 2)
+        self.assertTrue(duplicate.origin[0].startswith('content/tests.py:'))
+        self.assertIn('in test_duplicate_and_repeated_queries', duplicate.origin[0])
+        [(_query, count)] = profiler.repeated(5)
+        self.assertEqual(count, 6)
+
+    def test_params_are_only_logged_on_request(self):
+        user = User.objects.create_user('secretive', password='hunter2')
+        self.client.force_login(user)
+        profiling = {'SQL_PROFILER_ENABLED': True, 'SQL_SLOW_QUERY_MS': 0, 'SQL_SLOW_QUERY_LOG': self.log_path}
+        with override_settings(**profiling):
+            self.client.get(reverse('home'))
+        with open(self.log_path) as fh:
+            logged = fh.read()
+        self.assertNotIn(user.password, logged)
+        self.assertNotIn(self.client.session.session_key, logged)
+        with override_settings(SQL_SLOW_QUERY_LOG_PARAMS=True, **profiling):
+            self.client.get(reverse('home'))
+        with open(self.log_path) as fh:
+            self.assertIn(self.client.session.session_key, fh.read())
+
+    def test_fingerprint_collapses_in_lists(self):
+        self.assertEqual(
+            sqlprofile.fingerprint('SELECT 1 WHERE id IN (%s, %s, %s)'),
+            sqlprofile.fingerprint('SELECT 1 WHERE id IN (%s)'),
+        )
+
+    def test_slow_queries_are_attributed_to_the_view_and_summarized(self):
+        movie = make_movie('Profiled')
+        with override_settings(SQL_PROFILER_ENABLED=True, SQL_SLOW_QUERY_MS=0, SQL_SLOW_QUERY_LOG=self.log_path):
+            response = self.client.get(reverse('movie_detail', args=[movie.pk]))
+            self.assertIn('db;dur=', response['Server-Timing'])
+            records = list(sqlprofile.read_log(self.log_path))
+            self.assertTrue(records)
+            self.assertTrue(all(record['kind'] == 'slow' and record['path'] == f'/movie/{movie.pk}/' for record in records))
+            self.assertTrue(any('content/views.py' in record['origin'][0] and 'movie_detail' in record['origin'][0]
+                                for record in records))
+            self.assertTrue(all(record['params'] is None for record in records))
+            self.assertTrue(any(record['param_count'] for record in records))
+
+            out = io.StringIO()
+            call_command('sql_report', '--sort', 'count', '--top', '50', stdout=out)
+        self.assertIn('content/views.py:', out.getvalue())
+        self.assertIn('/movie/', out.getvalue())
+
+
+def spin_until(deadline):
+    while time.monotonic() < deadline:
+        sum(range(100))
+
+
+@override_settings(SAMPLING_PROFILER_ENABLED=True, SAMPLING_PROFILER_RATE=0, SAMPLING_PROFILER_ROUTES=['home'],
+                   SAMPLING_PROFILER_TOKEN='let-me-in')
+class SamplingProfilerTests(TestCase):
+    def setUp(self):
+        self.sampler = mock.Mock()
+        patcher = mock.patch.object(sampling, '_sampler', self.sampler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sampler_collapses_registered_thread_stacks(self):
+        sampler = sampling.Sampler(interval=0.001)
+
+        def worker():
+            sampler.register('GET test', None)
+            spin_until(time.monotonic() + 0.2)
+            sampler.unregister()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertGreater(sampler.samples, 10)
+        self.assertTrue(all(stack.startswith('GET test;') for stack in sampler.stacks))
+        self.assertTrue(any(';content.tests:spin_until' in stack for stack in sampler.stacks))
+        self.assertEqual(sampler.active, {})
+
+    def test_listed_routes_and_token_requests_are_sampled(self):
+        self.client.get(reverse('home'))
+        label, stop_frame = self.sampler.register.call_args.args
+        self.assertEqual(label, 'GET home')
+        self.assertEqual(stop_frame.f_code.co_name, '__call__')
+        self.sampler.unregister.assert_called_once()
+
+        self.sampler.reset_mock()
+        self.client.get(reverse('search'))
+        self.sampler.register.assert_not_called()
+        self.client.get(reverse('search'), HTTP_X_PROFILE='let-me-in')
+        self.assertEqual(self.sampler.register.call_args.args[0], 'GET search')
+
+    def test_flamegraph_merges_process_files(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for pid, count in ((1, 3), (2, 4)):
+            with open(os.path.join(directory, f'stacks-{pid}.txt'), 'w') as fh:
+                fh.write(f'GET home;content.views:home;django.shortcuts:render {count}\n')
+                fh.write(f'GET search;content.views:search {count}\n')
+        out = io.StringIO()
+        call_command('flamegraph', '--dir', directory, '--route', 'GET home', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'GET home;content.views:home;django.shortcuts:render 7')
+        out = io.StringIO()
+        call_command('flamegraph', '--dir', directory, '--top', '2', stdout=out)
+        self.assertIn('django.shortcuts:render', out.getvalue())
+
+
+@override_settings(CATALOG_SNAPSHOT_ENABLED=True)
+class CatalogSnapshotTests(TestCase):
+    CATALOG_TABLES = re.compile(r'FROM "content_(genre|movie|tvshow|episode)"')
+
+    def setUp(self):
+        cache.clear()
+        catalog.reset()
+        self.addCleanup(catalog.reset)
+        self.drama, self.comedy = Genre.objects.create(name='Drama'), Genre.objects.create(name='Comedy')
+        self.movies = [make_movie(f'Movie {i}', [self.drama] if i % 2 else [self.comedy], featured=i == 0)
+                       for i in range(4)]
+        self.tvshow = make_tvshow('Series', [self.drama, self.comedy])
+        self.episodes = [make_episode(self.tvshow, 1, number) for number in (1, 2, 3)]
+
+    def catalog_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in ctx.captured_queries if self.CATALOG_TABLES.search(query['sql'])]
+
+    def test_pages_render_from_memory(self):
+        catalog.get()
+        pages = [
+            (reverse('home'), 'Movie 3'),
+            (reverse('genre_view', args=[self.drama.pk]), 'Series'),
+            (reverse('movie_detail', args=[self.movies[1].pk]), 'Drama'),
+            (reverse('tvshow_detail', args=[self.tvshow.pk]), 'Episode 3'),
+            (reverse('episode_detail', args=[self.episodes[1].pk]), reverse('episode_detail', args=[self.episodes[2].pk])),
+        ]
+        for url, expected in pages:
+            with self.subTest(url=url):
+                response, queries = self.catalog_queries(url)
+                self.assertEqual(queries, [])
+                self.assertContains(response, expected)
+        self.assertEqual(self.client.get(reverse('movie_detail', args=[9999])).status_code, 404)
+
+    def test_genre_bitsets_and_records(self):
+        snapshot = catalog.get()
+        movies, tvshows = snapshot.in_genre(snapshot.genre(self.drama.pk))
+        # Newest first, like Movie.Meta.ordering
+        self.assertEqual([movie.title for movie in movies], ['Movie 3', 'Movie 1'])
+        self.assertEqual([tvshow.title for tvshow in tvshows], ['Series'])
+        self.assertEqual([genre.name for genre in snapshot.tvshow(self.tvshow.pk).genres.all()], ['Comedy', 'Drama'])
+        episode = snapshot.episode(self.episodes[0].pk)
+        self.assertIs(episode.tv_show, snapshot.tvshow(self.tvshow.pk))
+        self.assertEqual(snapshot.featured_movies.count(), 1)
+
+    def test_committed_changes_swap_in_a_new_snapshot(self):
+        old = catalog.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movies[0].title = 'Renamed'
+            self.movies[0].save()
+            self.movies[0].genres.add(self.drama)
+        new = catalog.get()
+        self.assertIsNot(new, old)
+        self.assertEqual(old.movie(self.movies[0].pk).title, 'Movie 0')
+        self.assertEqual(new.movie(self.movies[0].pk).title, 'Renamed')
+        self.assertEqual(len(new.in_genre(new.genre(self.drama.pk))[0]), 3)
+
+    def test_other_processes_notice_the_version_bump(self):
+        old = catalog.get()
+        Movie.objects.filter(pk=self.movies[0].pk).update(title='Elsewhere')
+        cache.incr(catalog.VERSION_KEY)
+        with override_settings(CATALOG_VERSION_CHECK_INTERVAL=3600):
+            catalog._state.next_check = time.monotonic() + 3600
+            self.assertIs(catalog.get(), old)
+            catalog._state.next_check = 0
+            self.assertEqual(catalog.get().movie(self.movies[0].pk).title, 'Elsewhere')
+
+    def test_memory_per_title_is_bounded(self):
+        for i in range(200):
+            make_movie(f'Bulk {i}', [self.drama], description='A long enough description. ' * 8)
+        snapshot = catalog.get()
+        self.assertLess(snapshot.nbytes / snapshot.title_count, 1500)
+
+        catalog.reset()
+        with override_settings(CATALOG_SNAPSHOT_MAX_BYTES=1024), self.assertLogs('content.catalog', 'ERROR'):
+            self.assertIsNone(catalog.get())
+            response = self.client.get(reverse('genre_view', args=[self.drama.pk]))
+        self.assertContains(response, 'Bulk 199')
+
+
+@override_settings(CATALOG_SNAPSHOT_ENABLED=True)
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog.reset()
+        self.addCleanup(catalog.reset)
+        self.drama, self.comedy, self.horror = (Genre.objects.create(name=name) for name in ('Drama', 'Comedy', 'Horror'))
+        make_movie('Old Drama', [self.drama], rating=6.5, release_date=date(1994, 5, 1), duration=85)
+        make_movie('Dramedy', [self.drama, self.comedy], rating=8.2, release_date=date(2015, 1, 1), duration=100)
+        make_movie('Epic Comedy', [self.comedy], rating=9.1, release_date=date(2019, 1, 1), duration=150)
+        make_tvshow('Drama Series', [self.drama], rating=7.4, release_date=date(2012, 1, 1))
+
+    def search(self, **params):
+        query = QueryDict(mutable=True)
+        for name, value in params.items():
+            query.setlist(name, value if isinstance(value, list) else [value])
+        index = catalog.get().facets
+        matches, counts = index.search(facets.Filters.from_query(query))
+        titles = [record.title for kind in facets.KINDS for record in index.page(kind, matches[kind], 0, 100)]
+        return sorted(titles), counts
+
+    def test_genres_match_all_or_any(self):
+        genres = [str(self.drama.pk), str(self.comedy.pk)]
+        self.assertEqual(self.search(genre=genres)[0], ['Dramedy'])
+        self.assertEqual(self.search(genre=genres, match='any')[0], ['Drama Series', 'Dramedy', 'Epic Comedy', 'Old Drama'])
+        self.assertEqual(self.search(genre=str(self.horror.pk))[0], [])
+
+    def test_rating_year_duration_and_kind(self):
+        self.assertEqual(self.search(rating_min='7.4', rating_max='8.2')[0], ['Drama Series', 'Dramedy'])
+        self.assertEqual(self.search(year_from='2010', year_to='2015')[0], ['Drama Series', 'Dramedy'])
+        self.assertEqual(self.search(duration='short')[0], ['Old Drama'])
+        self.assertEqual(self.search(kind='tvshow')[0], ['Drama Series'])
+        self.assertEqual(self.search(rating_min='nine', kind='anime')[0], self.search()[0])
+
+    def test_out_of_range_numbers_are_ignored_or_clamped(self):
+        everything = self.search()[0]
+        for value in ('nan', 'inf', '-inf', '1e400'):
+            self.assertEqual(self.search(rating_min=value, rating_max=value)[0], everything)
+        self.assertEqual(self.search(rating_min='-5', rating_max='99')[0], everything)
+        self.assertEqual(self.search(year_from='-40000', year_to='99999999')[0], everything)
+        filters = facets.Filters.from_query(QueryDict('rating_max=12&year_to=123456&rating_min=nan'))
+        self.assertEqual((filters.rating_min, filters.rating_max, filters.year_to), (None, 10.0, 9999))
+        for snapshot in (True, False):
+            with self.subTest(snapshot=snapshot), self.settings(CATALOG_SNAPSHOT_ENABLED=snapshot):
+                response = self.client.get(reverse('browse'), {'rating_min': 'nan', 'year_to': '99999999'})
+                self.assertEqual(response.status_code, 200)
+
+    def test_counts_apply_the_other_filters(self):
+        _titles, counts = self.search(genre=str(self.drama.pk), rating_min='7.0', rating_max='7.9')
+        genres = {genre.name: count for genre, count in counts['genres']}
+        # Genres drill down within the current results: only Drama Series
+        self.assertEqual(genres, {'Drama': 1, 'Comedy': 0, 'Horror': 0})
+        # Ratings ignore the rating filter itself but keep the genre
+        ratings = {label: count for label, _low, _high, count in counts['ratings']}
+        self.assertEqual(ratings, {'9+': 0, '8 to 9': 1, '7 to 8': 1, '6 to 7': 1, 'Under 6': 0})
+        self.assertEqual(dict(counts['kinds']), {'movie': 0, 'tvshow': 1})
+        self.assertEqual(counts['decades'], [(2010, 1), (1990, 0)])
+        self.assertEqual([count for _key, _label, count in counts['durations']], [0, 0, 0])
+
+    def test_genre_changes_reach_the_index(self):
+        old = catalog.get().facets
+        with self.captureOnCommitCallbacks(execute=True):
+            Movie.objects.get(title='Epic Comedy').genres.add(self.horror)
+        self.assertIsNot(catalog.get().facets, old)
+        self.assertEqual(self.search(genre=str(self.horror.pk))[0], ['Epic Comedy'])
+
+    def test_browse_page_with_and_without_snapshot(self):
+        params = {'genre': [self.drama.pk], 'rating_min': 7}
+        response = self.client.get(reverse('browse'), params)
+        self.assertContains(response, 'Dramedy')
+        self.assertContains(response, 'Drama Series')
+        self.assertNotContains(response, 'Old Drama')
+        self.assertContains(response, '?genre=%d&amp;rating_min=7.0&amp;kind=movie' % self.drama.pk)
+        with override_settings(CATALOG_SNAPSHOT_ENABLED=False):
+            fallback = self.client.get(reverse('browse'), params)
+        self.assertEqual(
+            [record.title for record in response.context['movies']], [movie.title for movie in fallback.context['movies']],
+        )
+        self.assertEqual(response.context['totals'], fallback.context['totals'])
+
+
+@override_settings(CATALOG_SNAPSHOT_ENABLED=True)
+class TitleSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog.reset()
+        titlesearch.reset()
+        self.addCleanup(catalog.reset)
+        self.addCleanup(titlesearch.reset)
+        for title in ('Inception', 'The Matrix', 'Spider-Man: No Way Home', 'Amélie', 'Interstellar'):
+            make_movie(title)
+        for title in ('Stranger Things', 'The Crown', 'Dark'):
+            make_tvshow(title)
+
+    def titles(self, query):
+        movies, tvshows = titlesearch.search(catalog.get(), query)
+        return [record.title for record in movies] + [record.title for record in tvshows]
+
+    def test_typos_prefixes_and_run_together_words(self):
+        cases = [
+            ('incepton', 'Inception'),
+            ('stranger thngs', 'Stranger Things'),
+            ('teh matrix', 'The Matrix'),
+            ('strangerthings', 'Stranger Things'),
+            ('amelie', 'Amélie'),
+            ('spiderman no way', 'Spider-Man: No Way Home'),
+            ('interst', 'Interstellar'),
+        ]
+        for query, expected in cases:
+            with self.subTest(query=query):
+                self.assertEqual(self.titles(query)[:1], [expected])
+        self.assertEqual(self.titles('zzzzzz'), [])
+        # Short words typed correctly don't fan out to their neighbours
+        self.assertEqual(self.titles('dark'), ['Dark'])
+
+    def test_recall_on_generated_typos(self):
+        rng = random.Random(46)
+        syllables = ['bra', 'cor', 'dun', 'el', 'fen', 'gal', 'hor', 'ish', 'jun', 'kel', 'lor', 'mar', 'nor', 'ost',
+                     'pra', 'quin', 'ros', 'sta', 'tul', 'vex', 'wyn', 'zor']
+        words = list({''.join(rng.sample(syllables, rng.randint(2, 3))) for _ in range(400)})
+        index = titlesearch.TrigramIndex()
+        titles = {}
+        for key in range(500):
+            titles[key] = ' '.join(rng.sample(words, rng.randint(1, 3))).title()
+            index.add(key, titles[key])
+
+        def typo(title):
+            position = rng.choice([i for i, char in enumerate(title) if char != ' '][1:])
+            edit = rng.randrange(3)
+            if edit == 0:
+                return title[:position] + title[position + 1:]
+            if edit == 1:
+                return title[:position] + 'x' + title[position + 1:]
+            return title[:position - 1] + title[position] + title[position - 1] + title[position + 1:]
+
+        queries = rng.sample(sorted(titles), 200)
+        found = sum(key in index.search(typo(titles[key]), limit=10) for key in queries)
+        self.assertGreaterEqual(found / len(queries), 0.95)
+
+    def test_index_follows_catalog_changes_incrementally(self):
+        self.assertEqual(titlesearch.sync(catalog.get()), (8, 0))
+        movie = Movie.objects.get(title='Inception')
+        with self.captureOnCommitCallbacks(execute=True):
+            movie.title = 'Tenet'
+            movie.save()
+            TVShow.objects.get(title='Dark').delete()
+        self.assertEqual(titlesearch.sync(catalog.get()), (1, 1))
+        self.assertEqual(self.titles('tenet'), ['Tenet'])
+        self.assertEqual(self.titles('incepton'), [])
+        self.assertEqual(self.titles('dark'), [])
+
+    def test_search_page_with_and_without_snapshot(self):
+        response = self.client.get(reverse('search'), {'q': 'stranger thngs'})
+        self.assertContains(response, reverse('tvshow_detail', args=[TVShow.objects.get(title='Stranger Things').pk]))
+        with override_settings(CATALOG_SNAPSHOT_ENABLED=False):
+            self.assertNotContains(self.client.get(reverse('search'), {'q': 'stranger thngs'}), 'Stranger Things')
+            self.assertContains(self.client.get(reverse('search'), {'q': 'Strange'}), 'Stranger Things')
+
+    def test_descriptions_match_after_titles_on_both_paths(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Movie.objects.filter(title='Interstellar').update(description='A crew travels through a wormhole.')
+            catalog.bump_version()
+            make_movie('Wormhole')
+        self.assertEqual(self.titles('wormhole'), ['Wormhole', 'Interstellar'])
+        self.assertEqual(self.titles('TRAVELS THROUGH'), ['Interstellar'])
+        # Substrings in the middle of a title word, as icontains finds them
+        self.assertEqual(self.titles('atri'), ['The Matrix'])
+        movies, _tvshows = titlesearch.search_database('wormhole')
+        self.assertEqual([movie.title for movie in movies], ['Wormhole', 'Interstellar'])
+
+    def test_both_paths_share_the_cap(self):
+        for i in range(8):
+            make_movie(f'Capped {i}')
+            make_tvshow(f'Capped Show {i}')
+        catalog.reset()
+        for results in (titlesearch.search(catalog.get(), 'capped', limit=10), titlesearch.search_database('capped', 10)):
+            movies, tvshows = results
+            self.assertEqual(len(movies) + len(tvshows), 10)
+
+
+def make_image(width=800, height=1200, name='poster.png'):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(TASK_QUEUE_EAGER=True, IMAGE_RENDITION_WIDTHS=[160, 320], IMAGE_RENDITION_FORMATS=['webp'])
+class ImageRenditionTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def test_upload_builds_hashed_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            movie = make_movie('Poster', poster=make_image())
+        movie.refresh_from_db()
+        manifest = movie.poster_renditions
+        self.assertEqual(manifest['source'], movie.poster.name)
+        self.assertEqual(set(manifest['formats']['webp']), {'160', '320'})
+        for name in manifest['formats']['webp'].values():
+            self.assertIn(manifest['hash'], name)
+            self.assertTrue(name.endswith('.webp'))
+
+    def test_finished_renditions_reach_the_catalog_snapshot(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            movie = make_movie('Snapshotted', poster=make_image())
+        Movie.objects.filter(pk=movie.pk).update(poster_renditions={})
+        version = catalog.current_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            images.process_image_field(Movie, movie.pk, 'poster', movie.poster.name)
+        self.assertNotEqual(catalog.current_version(), version)
+
+        # A poster replaced mid-build leaves the catalog alone
+        Movie.objects.filter(pk=movie.pk).update(poster='posters/replaced.jpg')
+        version = catalog.current_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            images.process_image_field(Movie, movie.pk, 'poster', movie.poster.name)
+        self.assertEqual(catalog.current_version(), version)
+
+    def test_small_images_are_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            movie = make_movie('Tiny', poster=make_image(100, 150))
+        movie.refresh_from_db()
+        self.assertEqual(list(movie.poster_renditions['formats']['webp']), ['160'])
+
+    def test_responsive_img_renders_srcset(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            movie = make_movie('Picture', poster=make_image())
+        movie.refresh_from_db()
+        html = Template("{% load content_images %}{% responsive_img movie 'poster' alt=movie.title %}").render(
+            Context({'movie': movie})
+        )
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('160w', html)
+        self.assertIn('320w', html)
+        self.assertIn(movie.poster.url, html)
+
+    def test_responsive_img_falls_back_to_original(self):
+        movie = make_movie('Pending', poster=make_image())
+        html = Template("{% load content_images %}{% responsive_img movie 'poster' %}").render(
+            Context({'movie': movie})
+        )
+        self.assertNotIn('<picture>', html)
+        self.assertIn(movie.poster.url, html)
+
+
+calls = []
+
+
+@taskqueue.task(name='tests.record')
+def record_task(value):
+    calls.append(value)
+
+
+@taskqueue.task(name='tests.flaky', max_attempts=2)
+def flaky_task():
+    calls.append('flaky')
+    raise RuntimeError('boom')
+
+
+@taskqueue.task(name='tests.sleep')
+def sleep_task(seconds):
+    time.sleep(seconds)
+
+
+@taskqueue.task(name='tests.overrun')
+def overrun_task():
+    # Runs past its lease: the job is requeued and another worker takes it
+    with override_settings(TASK_QUEUE_VISIBILITY_TIMEOUT=0):
+        taskqueue.requeue_stale_jobs()
+    taskqueue.claim_next_job('second-worker')
+    calls.append('overrun')
+
+
+class TaskQueueTests(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_worker_runs_jobs_by_priority(self):
+        record_task.enqueue('low', priority=0)
+        record_task.enqueue('high', priority=10)
+        processed = taskqueue.run_worker(worker_id='test', burst=True)
+        self.assertEqual(processed, 2)
+        self.assertEqual(calls, ['high', 'low'])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 2)
+
+    def test_idempotency_key_deduplicates_pending_jobs(self):
+        first = record_task.enqueue('a', idempotency_key='same')
+        second = record_task.enqueue('b', idempotency_key='same')
+        self.assertEqual(first.pk, second.pk)
+        taskqueue.run_worker(worker_id='test', burst=True)
+        third = record_task.enqueue('c', idempotency_key='same')
+        self.assertNotEqual(third.pk, first.pk)
+
+    @override_settings(TASK_QUEUE_RETRY_BACKOFF=0)
+    def test_failed_jobs_retry_then_fail(self):
+        job = flaky_task.enqueue()
+        taskqueue.run_worker(worker_id='test', burst=True)
+        job.refresh_from_db()
+        self.assertEqual(calls, ['flaky', 'flaky'])
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIn('boom', job.last_error)
+
+    def test_delayed_jobs_wait_until_due(self):
+        record_task.enqueue('later', delay=3600)
+        self.assertEqual(taskqueue.run_worker(worker_id='test', burst=True), 0)
+
+    def test_claim_is_exclusive(self):
+        record_task.enqueue('once')
+        first = taskqueue.claim_next_job('a')
+        self.assertIsNotNone(first)
+        self.assertIsNone(taskqueue.claim_next_job('b'))
+
+    @override_settings(TASK_QUEUE_VISIBILITY_TIMEOUT=0)
+    def test_stale_jobs_are_requeued(self):
+        record_task.enqueue('orphan')
+        taskqueue.claim_next_job('dead-worker')
+        self.assertEqual(taskqueue.requeue_stale_jobs(), 1)
+        self.assertEqual(Job.objects.get().status, Job.QUEUED)
+
+    def test_running_jobs_renew_their_lease(self):
+        record_task.enqueue('long')
+        job = taskqueue.claim_next_job('busy-worker')
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertTrue(taskqueue.renew_lease(job))
+        self.assertEqual(taskqueue.requeue_stale_jobs(), 0)
+
+        job.locked_by = 'previous-owner'
+        self.assertFalse(taskqueue.renew_lease(job))
+
+    def test_worker_that_lost_its_lease_leaves_the_new_owner_alone(self):
+        overrun_task.enqueue()
+        job = taskqueue.claim_next_job('first-worker')
+        with self.assertLogs('content.taskqueue', 'WARNING') as logs:
+            self.assertFalse(taskqueue.execute_job(job))
+        self.assertIn('lost its lease', logs.output[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.attempts), (Job.RUNNING, 'second-worker', 2))
+        self.assertIsNone(job.finished_at)
+
+    @override_settings(TASK_QUEUE_HEARTBEAT_INTERVAL=0.01)
+    def test_worker_heartbeats_while_a_job_runs(self):
+        sleep_task.enqueue(0.2)
+        with mock.patch.object(taskqueue, 'renew_lease', return_value=True) as renew:
+            taskqueue.run_worker(worker_id='test', burst=True)
+        self.assertGreater(renew.call_count, 2)
+        calls_after = renew.call_count
+        time.sleep(0.05)
+        self.assertEqual(renew.call_count, calls_after)
+
+
+@override_settings(TMDB_API_KEY='key')
+class TmdbJobTests(TestCase):
+    def test_movie_detail_queues_tmdb_refresh_once(self):
+        movie = make_movie('Queued')
+        self.client.get(reverse('movie_detail', args=[movie.id]))
+        self.client.get(reverse('movie_detail', args=[movie.id]))
+        jobs = Job.objects.filter(name='content.tasks.refresh_tmdb_movie')
+        self.assertEqual(jobs.count(), 1)
+        self.assertEqual(jobs.get().args, [movie.id])
+
+    @override_settings(TASK_QUEUE_EAGER=True)
+    def test_eager_refresh_fills_the_page_and_logs_failures(self):
+        movie = make_movie('Inline')
+        self.addCleanup(cache.clear)
+        stub = loadtest.TmdbStub(latency=0, jitter=0, seed=1)
+        with self.settings(TMDB_API_URL=stub.start()):
+            self.addCleanup(stub.stop)
+            self.client.get(reverse('movie_detail', args=[movie.id]))
+            response = self.client.get(reverse('movie_detail', args=[movie.id]))
+        self.assertIn('stub', response.context['tmdb_trailer_url'])
+        self.assertFalse(Job.objects.exists())
+
+        cache.clear()
+        with mock.patch.object(tmdb, 'get_json', side_effect=URLError('offline')), \
+                self.assertLogs('content.taskqueue', 'ERROR'):
+            response = self.client.get(reverse('movie_detail', args=[movie.id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_movie_detail_renders_cached_tmdb_data(self):
+        movie = make_movie('Cached')
+        context = dict(tmdb.EMPTY, tmdb_trailer_url='https://www.youtube.com/watch?v=abc')
+        cache.set(tmdb.movie_cache_key(movie.id), context)
+        response = self.client.get(reverse('movie_detail', args=[movie.id]))
+        self.assertEqual(response.context['tmdb_trailer_url'], context['tmdb_trailer_url'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_refresh_job_reads_from_the_stub_api(self):
+        movie = make_movie('Stubbed')
+        stub = loadtest.TmdbStub(latency=0.01, jitter=0, seed=1)
+        with self.settings(TMDB_API_URL=stub.start()):
+            self.addCleanup(stub.stop)
+            tasks.refresh_tmdb_movie(movie.id)
+            self.assertTrue(cache.get(tmdb.movie_cache_key(movie.id))['tmdb_poster_url'].endswith('.jpg'))
+
+            stub.error_rate = 1.0
+            with self.assertRaises(URLError):
+                tasks.refresh_tmdb_movie(movie.id)
+        self.assertEqual(stub.calls, {'search/movie': 2, 'movie': 1, 'failed': 1})
+
+
+class LoadTestTests(LiveServerTestCase):
+    def test_stats_split_outcomes_and_skip_warmup(self):
+        stats = loadtest.Stats(started=10.0)
+        stats.record('home', 200, (200,), 9.0, 5.0)
+        for ms in range(1, 101):
+            stats.record('home', 200, (200,), 10.0, ms / 1000)
+        stats.record('review', 429, (302,), 11.0, 0.001)
+        stats.record('review', 403, (302,), 11.0, 0.001)
+        stats.record('review', None, (302,), 11.0, 0.001)
+        summary = stats.summary(window=10)
+        self.assertEqual((summary['requests'], summary['errors'], summary['throttled']), (103, 2, 1))
+        self.assertAlmostEqual(summary['throughput'], 10.3)
+        self.assertEqual(summary['statuses'], {'403': 1, 'None': 1})
+        self.assertAlmostEqual(summary['steps']['home']['p50_ms'], 50)
+        self.assertAlmostEqual(summary['steps']['home']['p99_ms'], 99)
+
+    def test_journeys_run_cleanly_against_a_live_server(self):
+        drama = Genre.objects.create(name='Drama')
+        for n in range(3):
+            make_movie(f'Journey {n}', [drama])
+        make_tvshow('Journey Show', [drama])
+        workload = loadtest.Workload.from_database()
+        usernames = loadtest.ensure_users(2, 'run-password')
+        summary = loadtest.run(
+            self.live_server_url, workload, usernames, 'run-password', concurrency=2, duration=2, seed=1,
+        )
+        self.assertGreater(summary['requests'], 10)
+        self.assertEqual(summary['errors'], 0, summary['statuses'])
+        self.assertLessEqual({'login', 'profile_use', 'movie_detail'}, set(summary['steps']))
+        self.assertTrue(ProfileWatchlist.objects.exists() or Review.objects.exists())
+
+        loadtest.clean_up(workload, loadtest.TmdbStub())
+        self.assertFalse(User.objects.filter(username__startswith=loadtest.USER_PREFIX).exists())
+
+    def test_each_run_replaces_the_password_of_leftover_users(self):
+        loadtest.ensure_users(1, 'first-run')
+        loadtest.ensure_users(2, 'second-run')
+        users = User.objects.filter(username__startswith=loadtest.USER_PREFIX)
+        self.assertEqual(len(users), 2)
+        for user in users:
+            self.assertTrue(user.check_password('second-run'))
+            self.assertFalse(user.check_password('first-run'))
+
+    def test_clean_up_only_drops_tmdb_details_the_stub_served(self):
+        stubbed, real = make_movie('Stubbed'), make_movie('Real')
+        cache.set(tmdb.movie_cache_key(stubbed.pk), {'tmdb': {'id': 7}})
+        cache.set(tmdb.movie_cache_key(real.pk), {'tmdb': {'id': 8}})
+        stub = loadtest.TmdbStub()
+        workload = loadtest.Workload([stubbed.pk, real.pk], [], ['the'])
+        loadtest.clean_up(workload, stub)
+        self.assertIsNotNone(cache.get(tmdb.movie_cache_key(stubbed.pk)))
+
+        stub.served.add(7)
+        loadtest.clean_up(workload, stub)
+        self.assertIsNone(cache.get(tmdb.movie_cache_key(stubbed.pk)))
+        self.assertEqual(cache.get(tmdb.movie_cache_key(real.pk)), {'tmdb': {'id': 8}})
+
+    def test_command_refuses_to_run_without_debug(self):
+        with self.assertRaisesMessage(CommandError, '--allow-non-debug'):
+            call_command('load_test', stdout=io.StringIO())
+        self.assertFalse(User.objects.filter(username__startswith=loadtest.USER_PREFIX).exists())
+
+
+class StaticPipelineTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        static = override_settings(
+            STATIC_ROOT=root,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'content.storage.CompressedManifestStaticFilesStorage'},
+            },
+        )
+        static.enable()
+        self.addCleanup(static.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        from django.contrib.staticfiles.storage import staticfiles_storage
+
+        self.url = '/static/' + staticfiles_storage.stored_name('css/style.css')
+
+    def test_hashed_files_are_immutable_and_compressed(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_unhashed_names_get_a_short_max_age(self):
+        response = self.client.get('/static/css/style.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_etag_revalidation(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_each_encoding_has_its_own_etag(self):
+        etags = {
+            encoding: self.client.get(self.url, HTTP_ACCEPT_ENCODING=encoding)['ETag']
+            for encoding in ('gzip', 'identity')
+        }
+        self.assertNotEqual(etags['gzip'], etags['identity'])
+        # The identity copy's ETag doesn't validate a cached gzip copy
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etags['identity'])
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etags['gzip'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_accept_encoding_q_values(self):
+        for header, expected in [
+            ('gzip;q=0', None), ('GZIP; Q=0.5', 'gzip'), ('deflate, gzip;q=0.001', 'gzip'),
+            ('*', 'gzip'), ('*;q=0.1, gzip;q=0', None), ('identity', None), ('gzip;q=bogus', None),
+        ]:
+            with self.subTest(header):
+                response = self.client.get(self.url, HTTP_ACCEPT_ENCODING=header)
+                self.assertEqual(response.get('Content-Encoding'), expected)
+        self.assertEqual(fileserving.negotiate_encoding('gzip, br;q=0.9', ['br', 'gzip']), 'gzip')
+        self.assertEqual(fileserving.negotiate_encoding('gzip, br', ['br', 'gzip']), 'br')
+
+    def test_range_requests(self):
+        full = b''.join(self.client.get(self.url).streaming_content)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), full[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(full)}')
+        suffix = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(suffix.streaming_content), full[-5:])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE=f'bytes={len(full)}-').status_code, 416)
+
+
+class MediaStreamingTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=root, MEDIA_ACCEL_REDIRECT=None)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.data = os.urandom(300 * 1024)
+        with open(os.path.join(root, 'episode.mp4'), 'wb') as fh:
+            fh.write(self.data)
+        self.url = '/media/episode.mp4'
+
+    def test_full_and_ranged_responses(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1000-263143')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 1000-263143/{len(self.data)}')
+        self.assertEqual(response['Content-Length'], str(262144))
+        self.assertEqual(b''.join(response.streaming_content), self.data[1000:263144])
+
+        head = self.client.head(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(head.status_code, 206)
+        self.assertEqual(head['Content-Length'], '10')
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=999999-').status_code, 416)
+
+    def test_conditional_requests(self):
+        response = self.client.get(self.url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # A stale If-Range validator gets the whole file instead of a range
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, 200)
+        fresh = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(fresh.status_code, 206)
+
+    def test_paths_outside_media_root_are_rejected(self):
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/missing.mp4').status_code, 404)
+
+    def test_accel_redirect_hands_off_to_proxy(self):
+        with self.settings(MEDIA_ACCEL_REDIRECT='/protected-media/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/episode.mp4')
+        self.assertEqual(response.content, b'')
+
+    def test_concurrent_clients_get_their_own_ranges(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.test import Client
+
+        def fetch(start):
+            response = Client().get(self.url, HTTP_RANGE=f'bytes={start}-{start + 4095}')
+            return start, response.status_code, b''.join(response.streaming_content)
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(fetch, range(0, len(self.data) - 4096, 5000)))
+        for start, status, body in results:
+            self.assertEqual(status, 206)
+            self.assertEqual(body, self.data[start:start + 4096])
+
+
+def fake_transcode(ffmpeg, source, out_dir, rung, width, threads):
+    """Stand-in for ffmpeg: two 6s segments whose size tracks the bitrate."""
+    os.makedirs(out_dir, exist_ok=True)
+    lines = ['#EXTM3U', '#EXT-X-TARGETDURATION:6']
+    for index in range(2):
+        name = f'seg_{index:05d}.ts'
+        with open(os.path.join(out_dir, name), 'wb') as fh:
+            fh.write(b'\0' * (rung['video_bitrate'] * 6 * 1000 // 8 * (index + 1)))
+        lines += ['#EXTINF:6.000000,', name]
+    with open(os.path.join(out_dir, packaging.PLAYLIST_NAME), 'w') as fh:
+        fh.write('\n'.join(lines + ['#EXT-X-ENDLIST']))
+    peak, average, count = packaging.measure_playlist(os.path.join(out_dir, packaging.PLAYLIST_NAME))
+    return {
+        'name': rung['name'], 'width': width, 'height': rung['height'], 'bandwidth': peak,
+        'average_bandwidth': average, 'codecs': packaging.codecs(rung), 'segment_count': count,
+    }
+
+
+@override_settings(VIDEO_PACKAGING_PROCESSES=1)
+class VideoPackagingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.episode = make_episode(make_tvshow('Packaged'), 1, 1)
+
+    def upload(self):
+        self.episode.video_file = SimpleUploadedFile('pilot.mp4', b'not really a video')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.episode.save()
+
+    def test_ladder_never_upscales(self):
+        self.assertEqual([rung['name'] for rung in packaging.rungs_for(720)], ['720p', '480p', '360p'])
+        self.assertEqual([rung['height'] for rung in packaging.rungs_for(241)], [240])
+        self.assertEqual(packaging.scaled_width(1920, 1080, 360), 640)
+
+    def test_ffmpeg_command_aligns_segments(self):
+        rung = packaging.DEFAULT_LADDER[1]
+        command = packaging.ffmpeg_command('ffmpeg', 'in.mp4', '/out', rung, 1280, threads=2)
+        self.assertIn('expr:gte(t,n_forced*6)', command)
+        self.assertEqual(command[command.index('-hls_time') + 1], '6')
+        self.assertEqual(command[command.index('-b:v') + 1], '2800k')
+        self.assertEqual(command[-1], os.path.join('/out', 'index.m3u8'))
+
+    def test_upload_queues_packaging_job(self):
+        self.upload()
+        job = Job.objects.get()
+        self.assertEqual(job.name, 'content.tasks.package_episode_video')
+        self.assertEqual(job.args, [self.episode.id, self.episode.video_file.name])
+
+    def test_packaging_records_renditions_and_serves_manifest(self):
+        self.upload()
+        with mock.patch.object(packaging, 'probe', return_value=(1280, 720)), \
+                mock.patch.object(packaging, 'ffmpeg_binary', return_value='ffmpeg'), \
+                mock.patch.object(packaging, 'transcode_rung', fake_transcode):
+            packaging.package_episode(self.episode.id, self.episode.video_file.name)
+
+        renditions = list(VideoRendition.objects.filter(episode=self.episode))
+        self.assertEqual([rendition.name for rendition in renditions], ['720p', '480p', '360p'])
+        top = renditions[0]
+        self.assertEqual((top.width, top.height, top.segment_count), (1280, 720, 2))
+        self.assertEqual(top.bandwidth, 2800 * 1000 * 2)
+        self.assertEqual(top.average_bandwidth, 2800 * 1000 * 3 // 2)
+
+        response = self.client.get(reverse('episode_manifest', args=[self.episode.id]))
+        self.assertEqual(response['Content-Type'], 'application/vnd.apple.mpegurl')
+        manifest = response.content.decode()
+        self.assertEqual(manifest.count('#EXT-X-STREAM-INF'), 3)
+        self.assertIn('RESOLUTION=1280x720,CODECS="avc1.4d401f,mp4a.40.2"', manifest)
+        self.assertIn(f'/media/{top.playlist}', manifest)
+
+        segment = self.client.get(f'/media/{top.playlist}')
+        self.assertIn('immutable', segment['Cache-Control'])
+        detail = self.client.get(reverse('episode_detail', args=[self.episode.id]))
+        self.assertContains(detail, 'data-hls-src=')
+
+    def test_episode_without_renditions_has_no_manifest(self):
+        response = self.client.get(reverse('episode_manifest', args=[self.episode.id]))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotContains(self.client.get(reverse('episode_detail', args=[self.episode.id])), 'data-hls-src=')
+
+
+class ReviewListTests(TestCase):
+    def setUp(self):
+        self.movie, self.other = make_movie('Reviewed'), make_movie('Other')
+        self.users = [User.objects.create_user(f'critic{i}') for i in range(7)]
+
+    def review(self, user, rating, movie=None):
+        return Review.objects.create(user=user, movie=movie or self.movie, rating=rating, comment='Seen it')
+
+    def stars(self, movie=None):
+        summary = reviews.summary_for('movie', (movie or self.movie).id)
+        return [count for _stars, count, _percent in summary.histogram()]
+
+    def test_histogram_follows_creates_updates_and_deletes(self):
+        self.assertEqual(self.stars(), [0, 0, 0, 0, 0])
+        for user, rating in zip(self.users, (5, 5, 4, 3, 1)):
+            self.review(user, rating)
+        self.assertEqual(self.stars(), [2, 1, 1, 0, 1])
+
+        # As add_review does it: load, change, save
+        Review.objects.update_or_create(user=self.users[4], movie=self.movie, defaults={'rating': 4, 'comment': ''})
+        self.assertEqual(self.stars(), [2, 2, 1, 0, 0])
+        moved = Review.objects.get(user=self.users[0], movie=self.movie)
+        moved.movie = self.other
+        moved.save()
+        Review.objects.filter(user=self.users[1]).delete()
+        self.assertEqual(self.stars(), [0, 2, 1, 0, 0])
+        self.assertEqual(self.stars(self.other), [1, 0, 0, 0, 0])
+
+        summary = reviews.summary_for('movie', self.movie.id)
+        self.assertEqual((summary.count, summary.average), (3, 11 / 3))
+        fresh = reviews.rebuild_summary(movie_id=self.movie.id)
+        self.assertEqual([count for _s, count, _p in fresh.histogram()], [0, 2, 1, 0, 0])
+        with self.assertNumQueries(1):
+            reviews.summary_for('movie', self.movie.id)
+
+    def test_first_review_write_builds_a_missing_summary(self):
+        # Reviews from before summaries existed, as bulk_create leaves them
+        Review.objects.bulk_create(Review(user=user, movie=self.movie, rating=2) for user in self.users[:3])
+        self.review(self.users[3], 5)
+        self.assertEqual(ReviewSummary.objects.get(movie=self.movie).count, 4)
+        self.assertEqual(self.stars(), [1, 0, 0, 3, 0])
+
+        # A delete leaves a missing summary to its first read
+        Review.objects.bulk_create([Review(user=self.users[0], movie=self.other, rating=4)])
+        Review.objects.get(movie=self.other).delete()
+        self.assertFalse(ReviewSummary.objects.filter(movie=self.other).exists())
+        self.movie.delete()
+        self.assertFalse(ReviewSummary.objects.exists())
+
+    def test_keyset_pages_walk_ties_both_ways(self):
+        for i, user in enumerate(self.users):
+            self.review(user, i % 5 + 1)
+        # Three share a timestamp, so order falls back to id
+        tied = timezone.now()
+        Review.objects.filter(user__in=self.users[2:5]).update(created_at=tied)
+        expected = list(Review.objects.filter(movie=self.movie).order_by('-created_at', '-id'))
+
+        pages, cursor = [], ''
+        while True:
+            page = reviews.review_page('movie', self.movie.id, after=cursor, size=3)
+            pages.append(page)
+            if page.next_cursor is None:
+                break
+            cursor = page.next_cursor
+        self.assertEqual([review for page in pages for review in page.reviews], expected)
+        self.assertEqual([len(page.reviews) for page in pages], [3, 3, 1])
+        self.assertIsNone(pages[0].previous_cursor)
+
+        back = reviews.review_page('movie', self.movie.id, before=pages[2].previous_cursor, size=3)
+        self.assertEqual(back.reviews, pages[1].reviews)
+        self.assertEqual(back.next_cursor, pages[1].next_cursor)
+        first = reviews.review_page('movie', self.movie.id, before=back.previous_cursor, size=3)
+        self.assertEqual(first.reviews, pages[0].reviews)
+        self.assertIsNone(first.previous_cursor)
+        self.assertEqual(reviews.review_page('movie', self.movie.id, after='bogus', size=3).reviews, pages[0].reviews)
+
+    def test_pages_seek_through_the_recent_index(self):
+        self.review(self.users[0], 4)
+        cursor = reviews.encode(Review.objects.get())
+        plan = Review.objects.filter(movie=self.movie, created_at__lte=timezone.now()).order_by('-created_at', '-id')
+        self.assertIn('review_movie_recent_idx', plan.explain())
+        self.assertNotIn('TEMP B-TREE', plan.explain())
+        with self.assertNumQueries(1):
+            reviews.review_page('movie', self.movie.id, after=cursor)
+
+    def test_review_pages_and_detail_link(self):
+        for i, user in enumerate(self.users):
+            self.review(user, 5 if i else 1)
+        detail = self.client.get(reverse('movie_detail', args=[self.movie.id]))
+        self.assertEqual(len(detail.context['reviews']), 5)
+        self.assertContains(detail, reverse('movie_reviews', args=[self.movie.id]))
+        self.assertContains(detail, '7 reviews')
+
+        with self.settings(CATALOG_SNAPSHOT_ENABLED=True):
+            response = self.client.get(reverse('movie_reviews', args=[self.movie.id]))
+        self.assertEqual(len(response.context['reviews']), 7)
+        self.assertContains(response, '4.4')
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertEqual(self.client.get(reverse('tvshow_reviews', args=[9999])).status_code, 404)
+
+
+@override_settings(CARD_MEMO_SIZE=100)
+class TitleCardTests(TestCase):
+    def setUp(self):
+        content_cards.clear_cards()
+        self.addCleanup(content_cards.clear_cards)
+        self.movie = make_movie('Carded')
+
+    def render(self, source, **context):
+        return Template('{% load content_cards %}' + source).render(Context(context))
+
+    def test_cards_are_memoized_per_title_version(self):
+        with mock.patch.object(content_cards, 'render_to_string', wraps=content_cards.render_to_string) as render:
+            first = self.render('{% title_card movie %}', movie=self.movie)
+            second = self.render('{% title_card movie %}', movie=self.movie)
+            self.assertEqual(render.call_count, 1)
+            self.assertEqual(first, second)
+
+            self.movie.title = 'Recarded'
+            self.movie.save()
+            self.assertIn('Recarded', self.render('{% title_card movie %}', movie=self.movie))
+            self.assertEqual(render.call_count, 2)
+
+    def test_grid_actions_are_rendered_per_request(self):
+        user = User.objects.create_user('carder', password='password')
+        source = "{% title_card movie style='grid' action='add' %}"
+        anonymous = self.render(source, movie=self.movie)
+        self.assertNotIn('<form', anonymous)
+        signed_in = self.render(source, movie=self.movie, user=user, csrf_token='token123')
+        self.assertIn('value="token123"', signed_in)
+        self.assertIn(reverse('add_to_watchlist'), signed_in)
+        self.assertNotIn('<!--card:', signed_in)
+
+    def test_search_page_renders_cards(self):
+        response = self.client.get(reverse('search'), {'q': 'Carded'})
+        self.assertContains(response, reverse('movie_detail', args=[self.movie.id]))
+        self.assertContains(response, 'movie-card')
+
+
+class DatabaseProfileTests(TestCase):
+    def test_sqlite_connections_get_tuned_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            # Persistent, so connecting never rewrites the file's header
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'delete')
+
+    def test_sqlite_profile_uses_immediate_transactions(self):
+        config = database_profile('/tmp', 'sqlite')
+        self.assertEqual(config['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+
+    def test_postgres_profile_persistent_connections(self):
+        with mock.patch.dict(os.environ, {'DB_CONN_MAX_AGE': '120'}):
+            config = database_profile('/tmp', 'postgres')
+        self.assertEqual(config['CONN_MAX_AGE'], 120)
+        self.assertNotIn('pool', config['OPTIONS'])
+
+    def test_postgres_profile_pool(self):
+        with mock.patch.dict(os.environ, {'DB_POOL': '1', 'DB_POOL_MAX_SIZE': '20'}):
+            config = database_profile('/tmp', 'postgres')
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertEqual(config['OPTIONS']['pool']['max_size'], 20)
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            database_profile('/tmp', 'oracle')
+
+
+class EnvironmentSettingsTests(SimpleTestCase):
+    def load_prod(self, **env):
+        import importlib
+        import sys
+
+        self.addCleanup(sys.modules.pop, 'netflix_clone.settings.prod', None)
+        sys.modules.pop('netflix_clone.settings.prod', None)
+        with mock.patch.dict(os.environ, env):
+            return importlib.import_module('netflix_clone.settings.prod')
+
+    def test_prod_reads_hosts_and_secret_from_environment(self):
+        prod = self.load_prod(DJANGO_SECRET_KEY='s3cret', DJANGO_ALLOWED_HOSTS='a.example, b.example')
+        self.assertFalse(prod.DEBUG)
+        self.assertEqual(prod.ALLOWED_HOSTS, ['a.example', 'b.example'])
+        self.assertTrue(prod.SESSION_COOKIE_SECURE)
+        self.assertEqual(prod.STORAGES['staticfiles']['BACKEND'], 'content.storage.CompressedManifestStaticFilesStorage')
+
+    def test_prod_requires_a_secret_key(self):
+        from django.core.exceptions import ImproperlyConfigured
+
+        with self.assertRaises(ImproperlyConfigured):
+            self.load_prod(DJANGO_SECRET_KEY='')
+
+
+@override_settings(ALLOWED_HOSTS=['example.com'])
+class HealthCheckTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(health, 'state', health.WarmupState())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_liveness_skips_host_validation(self):
+        response = self.client.get('/healthz', HTTP_HOST='10.0.0.7')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'ok'})
+        self.assertEqual(response['Cache-Control'], 'no-store')
+
+    def test_not_ready_until_warmed_up(self):
+        response = self.client.get('/readyz', HTTP_HOST='10.0.0.7')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['warmup'], 'pending')
+
+        make_movie('Warm', genres=[Genre.objects.create(name='Drama')])
+        health.warm_up()
+        self.assertEqual(health.state.errors, [])
+        report = self.client.get('/readyz').json()
+        self.assertEqual(report['status'], 'ok')
+        self.assertTrue(report['checks']['database:default']['ok'])
+        self.assertTrue(report['checks']['cache']['ok'])
+
+    @override_settings(WARMUP_ON_BOOT=True, WARMUP_GENRES=1)
+    def test_every_entry_point_warms_up_before_reporting_ready(self):
+        make_movie('Warm', genres=[Genre.objects.create(name='Drama')])
+        for module in ('netflix_clone.wsgi', 'netflix_clone.asgi'):
+            with self.subTest(module=module):
+                health.state.status = 'pending'
+                sys.modules.pop(module, None)
+                importlib.import_module(module)
+                self.assertEqual(health.state.status, 'done')
+                self.assertEqual(self.client.get('/readyz').status_code, 200)
+
+    @override_settings(WARMUP_ON_BOOT=True, WARMUP_GENRES=1)
+    def test_warm_up_inside_an_event_loop_runs_on_a_thread(self):
+        async def boot():
+            return health.warm_up_on_boot()
+
+        thread = asyncio.run(boot())
+        self.assertIsNotNone(thread)
+        thread.join(timeout=30)
+        self.assertEqual(health.state.errors, [])
+        self.assertEqual(self.client.get('/readyz').status_code, 200)
+
+    @override_settings(WARMUP_ON_BOOT=True, WARMUP_GENRES=1)
+    def test_preloading_gunicorn_master_leaves_warm_up_to_its_workers(self):
+        server = mock.Mock()
+        with mock.patch.dict(os.environ):
+            config = runpy.run_path(os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'))
+            self.assertIsNone(health.warm_up_on_boot())
+            self.assertEqual(health.state.status, 'pending')
+
+            server.cfg.preload_app = False
+            config['post_fork'](server, mock.Mock())
+            self.assertEqual(health.state.status, 'pending')
+            server.cfg.preload_app = True
+            config['post_fork'](server, mock.Mock())
+        self.assertEqual(health.state.status, 'done')
+
+    def test_failing_database_fails_readiness(self):
+        health.state.status = 'done'
+        with mock.patch.object(health, 'check_database', side_effect=OSError('connection refused')):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('connection refused', response.json()['checks']['database:default']['error'])
+
+    @override_settings(TMDB_API_KEY='key')
+    def test_tmdb_outage_is_reported_but_not_fatal(self):
+        health.state.status = 'done'
+        with mock.patch.object(health, '_tmdb_result', (None, None)), \
+                mock.patch.object(tmdb, 'get_json', side_effect=OSError('timed out')) as get_json:
+            first = self.client.get('/readyz')
+            self.client.get('/readyz')
+        self.assertEqual(first.status_code, 200)
+        self.assertFalse(first.json()['checks']['tmdb']['ok'])
+        get_json.assert_called_once()
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def make_router(self, lag=0.0):
+        router = routers.ReplicaRouter(replicas=['replica1', 'replica2'])
+        patcher = mock.patch.object(routers, 'replica_lag', side_effect=lambda alias: lag)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return router
+
+    def test_reads_go_to_replicas_and_writes_to_primary(self):
+        router = self.make_router()
+        self.assertIn(router.db_for_read(Movie), ['replica1', 'replica2'])
+        self.assertEqual(router.db_for_write(Movie), 'default')
+
+    def test_lagging_replicas_are_dropped(self):
+        router = self.make_router(lag=60)
+        self.assertEqual(router.db_for_read(Movie), 'default')
+
+    def test_unreachable_replicas_are_dropped(self):
+        router = routers.ReplicaRouter(replicas=['missing'])
+        self.assertEqual(router.db_for_read(Movie), 'default')
+
+    def test_sessions_always_read_from_primary(self):
+        from django.contrib.sessions.models import Session
+
+        router = self.make_router()
+        self.assertEqual(router.db_for_read(Session), 'default')
+
+    def test_pinned_requests_read_from_primary(self):
+        router = self.make_router()
+        seen = []
+
+        def view(request):
+            seen.append(router.db_for_read(Movie))
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(view)
+        factory = RequestFactory()
+        session = SessionStore()
+
+        post = factory.post('/review/add/')
+        post.session = session
+        middleware(post)
+        get = factory.get('/')
+        get.session = session
+        middleware(get)
+        self.assertEqual(seen, ['default', 'default'])
+
+        session[routers.PIN_SESSION_KEY] = 0
+        middleware(get)
+        self.assertIn(seen[-1], ['replica1', 'replica2'])
+
+    def test_a_request_reads_from_one_replica(self):
+        router = self.make_router()
+        seen = []
+
+        def view(request):
+            seen.append({router.db_for_read(Movie) for _ in range(20)})
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(view)
+        for _ in range(10):
+            middleware(RequestFactory().get('/'))
+        self.assertTrue(all(len(replicas) == 1 for replicas in seen))
+        self.assertIsNone(routers.current_replica())
+
+        # Outside a request the thread keeps its replica while it's healthy
+        def worker():
+            seen.append({router.db_for_read(Movie) for _ in range(20)})
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(seen[-1]), 1)
+
+    def test_request_scope_restores_the_outer_routing(self):
+        router = self.make_router()
+        outer = router.db_for_read(Movie)
+        with routers.request_scope(pinned=True):
+            self.assertEqual(router.db_for_read(Movie), 'default')
+            with routers.request_scope():
+                self.assertIn(router.db_for_read(Movie), ['replica1', 'replica2'])
+            self.assertTrue(routers.is_pinned())
+        self.assertFalse(routers.is_pinned())
+        self.assertEqual(routers.current_replica(), outer)
+
+    def test_jobs_are_read_from_primary(self):
+        router = self.make_router()
+        self.assertEqual(router.db_for_read(Job), 'default')
+
+
+class InvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidation.reset()
+        self.addCleanup(invalidation.reset)
+        self.heard, self.delivered = [], []
+        self.register(invalidation._listeners, self.heard.append)
+        self.register(invalidation._subscribers, self.delivered.append)
+
+    def register(self, handlers, handler):
+        entry = (frozenset(['movie', 'genre']), handler)
+        handlers.append(entry)
+        self.addCleanup(handlers.remove, entry)
+
+    def publish_elsewhere(self, *keys):
+        """Publish as another process would: this one only sees it by polling."""
+        seqs = invalidation.publish(set(keys))
+        invalidation._state.own.clear()
+        self.delivered.clear()
+        return seqs
+
+    def test_transaction_publishes_once_on_commit(self):
+        version = catalog.current_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                drama = Genre.objects.create(name='Drama')
+                first, second = make_movie('First', [drama]), make_movie('Second')
+        self.assertEqual(self.heard, [{'movie': {first.id, second.id}, 'genre': {drama.id}}])
+        self.assertEqual(self.delivered, self.heard)
+        self.assertEqual(catalog.current_version(), version + 1)
+
+    def test_rollback_publishes_nothing_but_savepoint_keys_ride_along(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                kept = make_movie('Kept')
+                with self.assertRaises(RuntimeError), transaction.atomic():
+                    dropped = make_movie('Dropped')
+                    raise RuntimeError
+        self.assertEqual(self.heard, [{'movie': {kept.id, dropped.id}}])
+
+        invalidation.reset()
+        self.heard.clear()
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                make_movie('Never')
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.heard, [])
+
+    @override_settings(INVALIDATION_CHUNK_SIZE=2)
+    def test_other_processes_receive_chunked_events_on_poll(self):
+        invalidation.poll(force=True)
+        seqs = self.publish_elsewhere(*[('movie', pk) for pk in range(1, 6)], ('genre', 'x'))
+        self.assertEqual(len(seqs), 3)
+        invalidation.poll()  # throttled
+        self.assertEqual(self.delivered, [])
+        invalidation.poll(force=True)
+        self.assertEqual(self.delivered, [{'movie': {1, 2, 3, 4, 5}, 'genre': {'x'}}])
+
+        # A process's own events reach its subscribers once, at publish time
+        self.delivered.clear()
+        invalidation.publish({('movie', 6)})
+        invalidation.poll(force=True)
+        self.assertEqual(self.delivered, [{'movie': {6}}])
+
+    def test_uncommitted_event_holds_back_later_ones_until_gap_timeout(self):
+        invalidation.poll(force=True)
+        last = invalidation.latest_sequence()
+        # A publisher holding last + 1 hasn't committed yet
+        InvalidationEvent.objects.create(id=last + 2, keys=['movie:2'])
+        invalidation.poll(force=True)
+        self.assertEqual(self.delivered, [])
+        InvalidationEvent.objects.create(id=last + 1, keys=['movie:1'])
+        invalidation.poll(force=True)
+        self.assertEqual(self.delivered, [{'movie': {1, 2}}])
+
+        self.delivered.clear()
+        InvalidationEvent.objects.create(id=last + 4, keys=['movie:4'])
+        invalidation.poll(force=True)
+        self.assertEqual(self.delivered, [])
+        with self.settings(INVALIDATION_GAP_TIMEOUT=0):
+            invalidation.poll(force=True)
+        self.assertEqual(self.delivered, [None])
+        self.assertEqual(invalidation._state.last_seq, last + 4)
+
+    def test_pruned_events_and_long_backlog_drop_everything(self):
+        invalidation.poll(force=True)
+        self.publish_elsewhere(('movie', 1))
+        invalidation.poll(force=True)
+        self.assertEqual(self.delivered, [{'movie': {1}}])
+        with self.settings(INVALIDATION_EVENT_TIMEOUT=-1):
+            self.assertEqual(invalidation.prune(), 1)
+        self.publish_elsewhere(('movie', 2))
+        invalidation.poll(force=True)
+        self.assertEqual(self.delivered, [None])
+
+        self.delivered.clear()
+        with self.settings(INVALIDATION_MAX_BACKLOG=2):
+            for pk in range(3):
+                self.publish_elsewhere(('movie', pk))
+            invalidation.poll(force=True)
+        self.assertEqual(self.delivered, [None])
+
+    @override_settings(CARD_MEMO_SIZE=100)
+    def test_subscribed_card_memo_drops_changed_titles(self):
+        movie, other = make_movie('Memo'), make_movie('Other')
+        content_cards.clear_cards()
+        self.addCleanup(content_cards.clear_cards)
+        template = Template('{% load content_cards %}{% title_card movie %}')
+        for title in (movie, other):
+            template.render(Context({'movie': title}))
+        content_cards.forget_cards({'movie': {movie.id}})
+        self.assertEqual([key[2] for key in content_cards._cards], [other.id])
+
+
+class InvalidationChannelTests(TransactionTestCase):
+    """Publishers on their own connections, committing for real."""
+
+    def setUp(self):
+        invalidation.reset()
+        self.addCleanup(invalidation.reset)
+        self.delivered = []
+        entry = (frozenset(['movie']), self.delivered.append)
+        invalidation._subscribers.append(entry)
+        self.addCleanup(invalidation._subscribers.remove, entry)
+
+    def test_concurrent_publishers_lose_no_keys(self):
+        invalidation.poll(force=True)
+        barrier = threading.Barrier(4)
+
+        def publish(start):
+            barrier.wait()
+            try:
+                for pk in range(start, start + 25):
+                    invalidation.publish({('movie', pk)})
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=publish, args=(start,)) for start in range(0, 100, 25)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seqs = list(InvalidationEvent.objects.order_by('id').values_list('id', flat=True))
+        self.assertEqual(len(seqs), 100)
+        self.assertEqual(seqs, list(range(seqs[0], seqs[0] + 100)))
+        invalidation._state.own.clear()
+        self.delivered.clear()
+        invalidation.poll(force=True)
+        self.assertEqual(self.delivered, [{'movie': set(range(100))}])
+
+
+class HomeFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('feeder', password='password')
+        self.profile = Profile.objects.create(user=self.user, name='Main')
+        self.client.force_login(self.user)
+        self.client.get(reverse('profile_use', args=[self.profile.id]))
+        drama, comedy = Genre.objects.create(name='Drama'), Genre.objects.create(name='Comedy')
+        self.listed = make_movie('Listed', [drama])
+        self.similar = make_movie('Similar', [drama])
+        self.other = make_movie('Other', [comedy])
+
+    def post(self, name, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse(name), data)
+
+    def test_feed_is_rebuilt_on_watchlist_and_review_events(self):
+        self.post('add_to_watchlist', {'content_type': 'movie', 'content_id': self.listed.id})
+        self.assertEqual(cache_feed(self.profile), {'my_list': [self.listed.id], 'top_picks': [self.similar.id]})
+
+        self.post('add_review', {'content_type': 'movie', 'content_id': self.similar.id, 'rating': 5, 'comment': ''})
+        self.assertEqual(cache_feed(self.profile)['top_picks'], [])
+
+        # The liked review still drives picks once the list is empty
+        self.post('remove_from_watchlist', {'content_type': 'movie', 'content_id': self.listed.id})
+        self.assertEqual(cache_feed(self.profile), {'my_list': [], 'top_picks': [self.listed.id]})
+
+    def test_cached_feed_costs_one_query(self):
+        self.post('add_to_watchlist', {'content_type': 'movie', 'content_id': self.listed.id})
+        with self.assertNumQueries(1):
+            rows = feeds.home_feed(self.profile.id)
+        self.assertEqual(rows, {'my_list': [self.listed], 'top_picks': [self.similar]})
+        response = self.client.get(reverse('home'))
+        self.assertEqual(list(response.context['my_list_movies']), [self.listed])
+        self.assertEqual(list(response.context['top_picks']), [self.similar])
+
+    def test_missing_feed_is_built_on_read(self):
+        ProfileWatchlist.objects.create(profile=self.profile, movie=self.other)
+        self.assertEqual(feeds.home_feed(self.profile.id)['my_list'], [self.other])
+
+    def test_feed_outlived_by_its_version_is_rebuilt(self):
+        self.assertEqual(feeds.home_feed(self.profile.id)['my_list'], [])
+        ProfileWatchlist.objects.create(profile=self.profile, movie=self.other)
+        # The change's rebuild is lost, but its version bump went through
+        with mock.patch.object(feeds, 'rebuild'):
+            feeds.watchlists_changed({'watchlist': {self.profile.id}})
+        self.assertEqual(cache_feed(self.profile), {'my_list': [], 'top_picks': []})
+        self.assertEqual(feeds.home_feed(self.profile.id)['my_list'], [self.other])
+
+        # A version that was evicted never matches an existing feed either
+        ProfileWatchlist.objects.all().delete()
+        cache.delete(feeds.version_key(self.profile.id))
+        self.assertEqual(feeds.home_feed(self.profile.id)['my_list'], [])
+
+
+def cache_feed(profile):
+    return cache.get(feeds.feed_key(profile.id))[1]
+
+
+@override_settings(RATELIMIT_ENABLED=True, RATELIMITS={'search': '3/m', 'review': '2/m'})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.counters().clear()
+
+    def test_window_resets(self):
+        key = ratelimit.bucket_key('test', 'ip:1.2.3.4')
+        self.assertEqual(ratelimit.consume(key, 2, 60, now=1000), (True, 0.0))
+        self.assertEqual(ratelimit.consume(key, 2, 60, now=1010), (True, 0.0))
+        allowed, retry_after = ratelimit.consume(key, 2, 60, now=1010)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 10)
+        # Refused requests don't use up the next window's slots either
+        self.assertFalse(ratelimit.consume(key, 2, 60, now=1019)[0])
+        self.assertTrue(ratelimit.consume(key, 2, 60, now=1020)[0])
+        self.assertTrue(ratelimit.consume(key, 2, 60, now=1021)[0])
+
+    def test_parallel_requests_cannot_share_a_slot(self):
+        key = ratelimit.bucket_key('test', 'ip:1.2.3.4')
+        results = []
+        barrier = threading.Barrier(8)
+
+        def client():
+            barrier.wait()
+            results.extend(ratelimit.consume(key, 10, 3600, now=0)[0] for _ in range(10))
+
+        threads = [threading.Thread(target=client) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 10)
+
+    def test_counters_need_an_atomic_cache(self):
+        self.assertEqual(checks.check_ratelimit_cache(None), [])
+        self.assertEqual([error.id for error in checks.check_ratelimit_cache_is_shared(None)], ['content.E002'])
+        file_cache = {**LOCMEM_CACHES, 'counters': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.gettempdir(),
+        }}
+        with self.settings(CACHES=file_cache):
+            self.assertEqual([error.id for error in checks.check_ratelimit_cache(None)], ['content.E001'])
+        with self.settings(RATELIMIT_ENABLED=False, CACHES=file_cache):
+            self.assertEqual(checks.check_ratelimit_cache(None), [])
+
+    def test_parse_rate(self):
+        self.assertEqual(ratelimit.parse_rate('10/m'), (10, 60))
+        self.assertEqual(ratelimit.parse_rate('5/10s'), (5, 10))
+
+    @mock.patch.object(ratelimit, 'time', mock.Mock(time=mock.Mock(return_value=1000.0)))
+    def test_search_is_limited_per_ip(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get(reverse('search'), {'q': 'a'}).status_code, 200)
+        response = self.client.get(reverse('search'), {'q': 'a'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+        other = self.client.get(reverse('search'), {'q': 'a'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(other.status_code, 200)
+
+    def test_reviews_are_limited_per_user_and_validated(self):
+        user = User.objects.create_user('critic', password='password')
+        self.client.force_login(user)
+        movie = make_movie('Rated')
+        url = reverse('add_review')
+        # A missing rating is rejected instead of raising
+        self.assertEqual(self.client.post(url, {'content_type': 'movie', 'content_id': movie.id}).status_code, 302)
+        self.assertFalse(Review.objects.exists())
+        self.client.post(url, {'content_type': 'movie', 'content_id': movie.id, 'rating': 4})
+        self.assertEqual(Review.objects.get().rating, 4)
+        response = self.client.post(url, {'content_type': 'movie', 'content_id': movie.id, 'rating': 5})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(Review.objects.get().rating, 4)
+
+
+@override_settings(PROGRESS_FLUSH_INTERVAL=3600)
+class WatchProgressTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('viewer', password='password')
+        self.profile = Profile.objects.create(user=self.user, name='Main')
+        self.client.force_login(self.user)
+        self.client.get(reverse('profile_use', args=[self.profile.id]))
+        self.movie = make_movie('Halfway')
+        self.tvshow = make_tvshow('Series')
+        self.episode = make_episode(self.tvshow, 1, 1)
+        self.addCleanup(progress.flush)
+
+    def heartbeat(self, content_type, content_id, position, duration=1000):
+        return self.client.post(reverse('update_progress'), {
+            'content_type': content_type, 'content_id': content_id,
+            'position': position, 'duration': duration,
+        })
+
+    def test_heartbeats_are_coalesced_until_flush(self):
+        for position in (10, 20, 30):
+            self.assertEqual(self.heartbeat('movie', self.movie.id, position).status_code, 202)
+        self.assertFalse(WatchProgress.objects.exists())
+        self.assertEqual(progress.pending_count(), 1)
+        with self.assertNumQueries(3):
+            # existence check, one upsert, index rebuild
+            self.assertEqual(progress.flush(), 1)
+        row = WatchProgress.objects.get()
+        self.assertEqual((row.movie_id, row.position_seconds), (self.movie.id, 30))
+
+    def test_flush_upserts_existing_rows(self):
+        self.heartbeat('episode', self.episode.id, 100)
+        progress.flush()
+        self.heartbeat('episode', self.episode.id, 200)
+        progress.flush()
+        self.assertEqual(WatchProgress.objects.get().position_seconds, 200)
+
+    def test_unknown_titles_are_dropped(self):
+        self.heartbeat('movie', 99999, 10)
+        self.assertEqual(progress.flush(), 0)
+
+    def test_invalid_heartbeats_are_rejected(self):
+        self.assertEqual(self.heartbeat('song', 1, 10).status_code, 400)
+        self.assertEqual(self.heartbeat('movie', 'abc', 10).status_code, 400)
+        for value in ('inf', '-inf', 'nan'):
+            self.assertEqual(self.heartbeat('movie', self.movie.id, value).status_code, 400)
+            self.assertEqual(self.heartbeat('movie', self.movie.id, 10, duration=value).status_code, 400)
+        self.assertEqual(progress.pending_count(), 0)
+
+    def test_huge_positions_are_clamped(self):
+        self.assertEqual(self.heartbeat('movie', self.movie.id, '1e30', duration='1e30').status_code, 202)
+        self.heartbeat('episode', self.episode.id, -5)
+        self.assertEqual(progress.flush(), 2)
+        self.assertEqual(
+            sorted(WatchProgress.objects.values_list('position_seconds', 'duration_seconds')),
+            [(0, 1000), (progress.MAX_SECONDS, progress.MAX_SECONDS)],
+        )
+
+    def test_failed_flush_keeps_the_batch(self):
+        self.heartbeat('movie', self.movie.id, 10)
+        self.heartbeat('episode', self.episode.id, 20)
+        with mock.patch.object(WatchProgress.objects, 'bulk_create', side_effect=OperationalError('locked')):
+            with self.assertRaises(OperationalError):
+                progress.flush()
+        self.assertEqual(progress.pending_count(), 2)
+        # A newer heartbeat wins over the requeued one
+        self.heartbeat('movie', self.movie.id, 30)
+        self.assertEqual(progress.flush(), 2)
+        self.assertEqual(WatchProgress.objects.get(movie=self.movie).position_seconds, 30)
+
+    def test_home_shows_continue_watching_row(self):
+        self.heartbeat('movie', self.movie.id, 500)
+        self.heartbeat('episode', self.episode.id, 990)  # completed
+        progress.flush()
+        response = self.client.get(reverse('home'))
+        items = response.context['continue_watching']
+        self.assertEqual([item['object'] for item in items], [self.movie])
+        self.assertEqual(items[0]['percent'], 50)
+        self.assertContains(response, 'Continue Watching')
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        trending.drain()
+        self.hit = make_movie('Hit')
+        self.old_hit = make_movie('Old hit')
+        self.show = make_tvshow('Show')
+
+    def test_counters_flush_into_buckets_additively(self):
+        for _ in range(3):
+            trending.record('movie', self.hit.id, 'views')
+        trending.record('movie', self.hit.id, 'reviews')
+        trending.flush()
+        trending.record('movie', self.hit.id, 'views')
+        trending.flush()
+        bucket = TrendingBucket.objects.get(movie=self.hit)
+        self.assertEqual((bucket.views, bucket.reviews), (4, 1))
+        self.assertTrue(Job.objects.filter(name='content.tasks.rollup_trending').exists())
+
+    def test_failed_flush_keeps_the_counts(self):
+        trending.record('movie', self.hit.id, 'views')
+        failing = mock.Mock(**{'atomic.side_effect': OperationalError('locked')})
+        with mock.patch.object(trending, 'transaction', failing), self.assertRaises(OperationalError):
+            trending.flush()
+        # Counts recorded since add to the requeued ones
+        trending.record('movie', self.hit.id, 'views')
+        trending.record('movie', self.hit.id, 'list_adds')
+        self.assertEqual(trending.flush(), 1)
+        bucket = TrendingBucket.objects.get(movie=self.hit)
+        self.assertEqual((bucket.views, bucket.list_adds), (2, 1))
+
+    def test_rollup_decays_old_engagement(self):
+        now = timezone.now()
+        TrendingBucket.objects.create(movie=self.hit, bucket_start=now - timedelta(hours=1), views=10)
+        # Twice the engagement, but two half-lives ago
+        TrendingBucket.objects.create(movie=self.old_hit, bucket_start=now - timedelta(days=2, hours=1), views=20)
+        TrendingBucket.objects.create(tv_show=self.show, bucket_start=now - timedelta(days=30), views=1000)
+        trending.rollup(now)
+        ranked = [item['object'] for item in trending.trending_titles()]
+        self.assertEqual(ranked, [self.hit, self.old_hit])
+        self.assertFalse(TrendingBucket.objects.filter(tv_show=self.show).exists())
+        hit_score = TrendingScore.objects.get(movie=self.hit).score
+        self.assertAlmostEqual(hit_score, 10 * 0.5 ** (1 / 24), places=5)
+
+    def test_views_are_counted_without_queries(self):
+        response = self.client.get(reverse('movie_detail', args=[self.hit.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(counts[0] for counts in trending.drain().values()), 1)
+
+    def test_home_trending_row_is_one_query(self):
+        TrendingScore.objects.create(movie=self.hit, score=5, computed_at=self.hit.created_at)
+        TrendingScore.objects.create(tv_show=self.show, score=3, computed_at=self.hit.created_at)
+        with self.assertNumQueries(1):
+            items = trending.trending_titles()
+        self.assertEqual([item['kind'] for item in items], ['movie', 'tvshow'])
+        self.assertContains(self.client.get(reverse('home')), 'Trending Now')
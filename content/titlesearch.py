@@ -0,0 +1,334 @@
+"""Typo-tolerant title search over the catalog snapshot.
+
+Titles are normalized: accents are stripped, text is case-folded and
+split into words. The index has two levels:
+* ``word_titles`` maps each distinct title word to the titles using it;
+* ``postings`` maps padded trigrams (``"  in", " in", "inc", ... "on "``)
+  to the distinct words containing them.
+
+Typo matching happens over the vocabulary, which is much smaller and has
+much shorter posting sets than the titles. For each query word:
+1. Trigram candidates. A word within ``k`` edits of the query word shares
+   at least ``len(grams) - 3k`` of its trigrams (the q-gram lemma). Those
+   words are counted from the posting sets and the rest are pruned.
+2. Verification. The survivors are checked with a banded optimal string
+   alignment distance. The allowance is 1 edit up to 5 letters and 2
+   beyond, and a transposition counts as one edit. Short words that are
+   already in the vocabulary must match exactly. The last query word may
+   also be an unfinished prefix.
+A query word that matches nothing is tried as two run-together words.
+
+A title matches when all but ``len(words) // 3`` query words match one of
+its words. Results are ordered by missing words, then total edits, then
+shorter title, then alphabetically. Titles whose title or description
+merely contains the query, as the ``icontains`` fallback matches them, fill
+the rest of the page after every typo-tolerant match. Finding those is a
+scan over pre-folded text, run only when the title tiers leave room. Each (missing, edits) tier is a
+union of set intersections over the per-word title sets. Tiers are taken
+best first until the page is full, so a common word costs set operations
+in C rather than a Python loop over its titles.
+
+The process keeps one index. :func:`sync` brings it up to date with a new
+snapshot incrementally: it only re-indexes titles that were added, renamed
+or deleted, so a catalog change costs a dict diff rather than a rebuild.
+Without a snapshot :func:`search_database` runs the ``icontains`` query,
+which has no typo tolerance, title matches first and with the same
+``SEARCH_LIMIT`` cap.
+"""
+import heapq
+import re
+import threading
+import unicodedata
+from itertools import groupby, product
+
+from django.db.models import Case, Q, Value, When
+
+from .catalog import RecordList
+
+SEARCH_LIMIT = 50
+CACHE_SIZE = 10000
+MAX_WORDS = 6
+EMPTY = frozenset()
+
+_non_word = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    """Lower-case words of ``text`` with accents and punctuation removed."""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _non_word.sub(' ', text.casefold()).split()
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def allowed_edits(word):
+    return 0 if len(word) <= 1 else 1 if len(word) <= 5 else 2
+
+
+def distance(a, b, limit):
+    """Optimal string alignment distance between ``a`` and ``b``, or ``limit + 1`` once it exceeds ``limit``.
+
+    Only the diagonal band of width ``2 * limit + 1`` is filled in; cells
+    outside it can't lead back under the limit.
+    """
+    if a == b:
+        return 0
+    over = limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return over
+    previous2, previous = None, [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        char = a[i - 1]
+        current = [over] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        best = current[low - 1]
+        for j in range(low, high + 1):
+            other = b[j - 1]
+            value = previous[j - 1] + (char != other)
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if i > 1 and j > 1 and char == b[j - 2] and a[i - 2] == other and previous2[j - 2] + 1 < value:
+                value = previous2[j - 2] + 1
+            current[j] = value
+            if value < best:
+                best = value
+        if best > limit:
+            return over
+        previous2, previous = previous, current
+    return min(previous[-1], over)
+
+
+class Document:
+    __slots__ = ('key', 'title', 'description', 'words', 'text', 'order')
+
+    def __init__(self, key, title, description=''):
+        self.key = key
+        self.title = title
+        self.description = description
+        self.words = normalize(title)
+        # What the substring tier searches
+        self.text = f'{title}\n{description}'.casefold()
+        # Ties go to the shorter title, then alphabetically
+        self.order = (len(self.words), title)
+
+
+class TrigramIndex:
+    def __init__(self):
+        self.documents = {}  # key -> Document
+        self.word_titles = {}  # word -> set of keys
+        self.postings = {}  # trigram -> set of words
+        self.cache = {}  # (query word, prefix) -> similar_words(); cleared when the vocabulary changes
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, key, title, description=''):
+        """Index ``title`` under ``key``, replacing any earlier title for it."""
+        if key in self.documents:
+            self.remove(key)
+        document = self.documents[key] = Document(key, title, description)
+        for word in set(document.words):
+            keys = self.word_titles.get(word)
+            if keys is None:
+                keys = self.word_titles[word] = set()
+                self.cache.clear()
+                for gram in trigrams(word):
+                    self.postings.setdefault(gram, set()).add(word)
+            keys.add(key)
+
+    def remove(self, key):
+        document = self.documents.pop(key, None)
+        if document is None:
+            return
+        for word in set(document.words):
+            keys = self.word_titles[word]
+            keys.discard(key)
+            if keys:
+                continue
+            del self.word_titles[word]
+            self.cache.clear()
+            for gram in trigrams(word):
+                words = self.postings[gram]
+                words.discard(word)
+                if not words:
+                    del self.postings[gram]
+
+    def similar_words(self, word, prefix=False):
+        """``{indexed word: edits}`` for the words within ``word``'s edit allowance."""
+        cached = self.cache.get((word, prefix))
+        if cached is not None:
+            return cached
+        limit = allowed_edits(word)
+        known = word in self.word_titles
+        if known and len(word) <= 3:
+            # Short words typed correctly are by far the common case, and
+            # their one-edit neighbourhood is a large slice of the vocabulary
+            limit = 0
+        # A word typed in full only extends to longer words exactly
+        # ("star" -> "stargate"); an unknown one may be a mistyped prefix,
+        # as long as its first letter is right.
+        prefix_limit = 0 if known else limit
+        grams = trigrams(word)
+        # Each edit breaks at most three trigrams; a prefix lacks the end one
+        needed = max(1, len(grams) - 3 * limit)
+        prefix_needed = max(1, len(grams) - 1 - 3 * prefix_limit)
+        counts = {}
+        for gram in grams:
+            for candidate in self.postings.get(gram, EMPTY):
+                counts[candidate] = counts.get(candidate, 0) + 1
+        over = limit + 1
+        matches = {}
+        for candidate, shared in counts.items():
+            edits = over
+            if shared >= needed and abs(len(candidate) - len(word)) <= limit:
+                edits = distance(word, candidate, limit)
+            if (
+                prefix and edits and shared >= prefix_needed and len(candidate) > len(word)
+                and candidate[0] == word[0]
+            ):
+                prefix_edits = distance(word, candidate[:len(word)], prefix_limit)
+                if prefix_edits <= prefix_limit:
+                    edits = min(edits, prefix_edits)
+            if edits <= limit:
+                matches[candidate] = edits
+        if len(self.cache) >= CACHE_SIZE:
+            self.cache.clear()
+        self.cache[word, prefix] = matches
+        return matches
+
+    def split(self, word):
+        """Two indexed words that ``word`` runs together ("strangerthings", "strangerxthings"), if any."""
+        for cut in range(1, len(word)):
+            for rest in (word[cut:], word[cut + 1:]):
+                if word[:cut] in self.word_titles and rest in self.word_titles:
+                    return word[:cut], rest
+        return None
+
+    def containing(self, query, exclude, limit):
+        """Keys not in ``exclude`` whose title or description contains ``query``, shortest title first."""
+        needle = query.strip().casefold()
+        if not needle or limit <= 0:
+            return []
+        found = [key for key, document in self.documents.items() if needle in document.text and key not in exclude]
+        return heapq.nsmallest(limit, found, key=lambda key: self.documents[key].order)
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Keys of the titles matching ``query``, best first."""
+        results = self.search_titles(query, limit)
+        return results + self.containing(query, set(results), limit - len(results))
+
+    def search_titles(self, query, limit):
+        words = list(dict.fromkeys(normalize(query)))[:MAX_WORDS]
+        if not words:
+            return []
+        # Three or more words may leave one out ("lord rings king")
+        missing_allowed = len(words) // 3
+        matches = []
+        for i, word in enumerate(list(words)):
+            found = self.similar_words(word, prefix=i == len(words) - 1)
+            parts = None if found else self.split(word)
+            if parts:
+                # The missing space counts as one edit
+                words[len(matches):len(matches) + 1] = parts
+                matches += [{parts[0]: 0}, {parts[1]: 1}]
+            else:
+                matches.append(found)
+
+        # Per query word, the titles reached at each edit count, plus the
+        # option of leaving the word out. Each combination of choices is a
+        # set intersection, taken in (missing words, total edits) order, so
+        # only the tiers that fill the page are ever ranked in Python.
+        options = []
+        for word, found in zip(words, matches):
+            levels = {}
+            for match, edits in found.items():
+                levels.setdefault(edits, []).append(self.word_titles[match])
+            choices = [(0, edits, set().union(*sets)) for edits, sets in levels.items()]
+            if missing_allowed:
+                choices.append((1, len(word), None))
+            options.append(choices)
+        combinations = []
+        for combination in product(*options):
+            missing = sum(choice[0] for choice in combination)
+            if missing <= missing_allowed:
+                total = sum(choice[1] for choice in combination)
+                combinations.append((missing, total, [choice[2] for choice in combination]))
+        combinations.sort(key=lambda combination: combination[:2])
+        results, seen = [], set()
+        for _tier, group in groupby(combinations, key=lambda combination: combination[:2]):
+            tier = set()
+            for _missing, _total, title_sets in group:
+                present = sorted((titles for titles in title_sets if titles is not None), key=len)
+                tier |= present[0].intersection(*present[1:])
+            tier -= seen
+            seen |= tier
+            results += heapq.nsmallest(limit - len(results), tier, key=lambda key: self.documents[key].order)
+            if len(results) >= limit:
+                break
+        return results
+
+
+_index = TrigramIndex()
+_index_version = None
+_lock = threading.Lock()
+
+
+def sync(snapshot):
+    """Bring the index up to date with ``snapshot``; returns (added, removed) counts."""
+    global _index_version
+    with _lock:
+        if _index_version == snapshot.version:
+            return 0, 0
+        titles = {('movie', record.id): (record.title, record.description) for record in snapshot.movies}
+        titles.update((('tvshow', record.id), (record.title, record.description)) for record in snapshot.tvshows)
+        stale = [key for key in _index.documents if key not in titles]
+        for key in stale:
+            _index.remove(key)
+        added = 0
+        for key, (title, description) in titles.items():
+            document = _index.documents.get(key)
+            if document is None or (document.title, document.description) != (title, description):
+                _index.add(key, title, description)
+                added += 1
+        _index_version = snapshot.version
+        return added, len(stale)
+
+
+def search(snapshot, query, limit=SEARCH_LIMIT):
+    """``(movies, tvshows)`` records matching ``query``, best first."""
+    sync(snapshot)
+    with _lock:
+        keys = _index.search(query, limit)
+    movies, tvshows = [], []
+    for kind, pk in keys:
+        record = snapshot.movie(pk) if kind == 'movie' else snapshot.tvshow(pk)
+        if record is not None:
+            (movies if kind == 'movie' else tvshows).append(record)
+    return RecordList(movies), RecordList(tvshows)
+
+
+def search_database(query, limit=SEARCH_LIMIT):
+    """``(movies, tvshows)`` whose title or description contains ``query``; title matches first."""
+    from .models import Movie, TVShow
+
+    results = []
+    for model in (Movie, TVShow):
+        matches = model.objects.filter(Q(title__icontains=query) | Q(description__icontains=query)).alias(
+            description_only=Case(When(title__icontains=query, then=Value(0)), default=Value(1)),
+        ).order_by('description_only', 'title')
+        results.append(RecordList(matches[:limit - sum(map(len, results))]))
+    return tuple(results)
+
+
+def reset():
+    global _index, _index_version
+    with _lock:
+        _index, _index_version = TrigramIndex(), None
@@ -0,0 +1,98 @@
+"""TMDB lookups for movie detail pages.
+
+Fetching happens in a background job (see ``content.tasks``); views only read
+the cached result, so a slow or unreachable TMDB never delays a page render.
+"""
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+EMPTY = {
+    'tmdb': {},
+    'tmdb_images': {},
+    'tmdb_videos': {},
+    'tmdb_poster_url': '',
+    'tmdb_backdrop_url': '',
+    'tmdb_trailer_url': '',
+}
+
+
+def movie_cache_key(movie_id):
+    return f'tmdb:movie:{movie_id}'
+
+
+def get_json(url):
+    # Imported here: only the background job talks to TMDB
+    import json
+    from urllib.request import urlopen
+
+    with urlopen(url, timeout=5) as resp:
+        return json.loads(resp.read().decode('utf-8'))
+
+
+def api_url(path, params):
+    base = getattr(settings, 'TMDB_API_URL', 'https://api.themoviedb.org/3').rstrip('/')
+    return f'{base}/{path}?' + urlencode(params)
+
+
+def ping():
+    """Cheap authenticated request used by the readiness check."""
+    return get_json(api_url('configuration', {'api_key': settings.TMDB_API_KEY}))
+
+
+def fetch_movie(title, year=None):
+    """Search TMDB by title/year and return template context for the best match."""
+    api_key = getattr(settings, 'TMDB_API_KEY', '')
+    if not api_key or not title:
+        return dict(EMPTY)
+
+    search_params = {
+        'api_key': api_key,
+        'query': title,
+        'include_adult': 'false',
+    }
+    if year:
+        search_params['year'] = year
+    payload = get_json(api_url('search/movie', search_params))
+    results = payload.get('results', [])
+    if not results or not results[0].get('id'):
+        return dict(EMPTY)
+
+    details_params = {'api_key': api_key, 'append_to_response': 'images,videos'}
+    tmdb_id = results[0]['id']
+    tmdb_data = get_json(api_url(f'movie/{tmdb_id}', details_params)) or {}
+    context = dict(EMPTY)
+    context['tmdb'] = tmdb_data
+    context['tmdb_images'] = tmdb_data.get('images', {})
+    context['tmdb_videos'] = tmdb_data.get('videos', {})
+
+    # Build helpful URLs for template
+    poster_path = tmdb_data.get('poster_path')
+    backdrop_path = tmdb_data.get('backdrop_path')
+    if poster_path:
+        context['tmdb_poster_url'] = f'https://image.tmdb.org/t/p/w500{poster_path}'
+    if backdrop_path:
+        context['tmdb_backdrop_url'] = f'https://image.tmdb.org/t/p/w1280{backdrop_path}'
+
+    # Find a trailer or teaser from YouTube
+    videos = (context['tmdb_videos'] or {}).get('results', [])
+    for video in videos:
+        if video.get('site') == 'YouTube' and video.get('key') and video.get('type') in ('Trailer', 'Teaser'):
+            context['tmdb_trailer_url'] = f"https://www.youtube.com/watch?v={video['key']}"
+            break
+    return context
+
+
+def cached_movie_context(movie):
+    """Cached TMDB context for a movie, queueing a refresh on a miss."""
+    context = cache.get(movie_cache_key(movie.id))
+    if context is not None:
+        return context
+    if getattr(settings, 'TMDB_API_KEY', '') and movie.title:
+        from .tasks import refresh_tmdb_movie
+
+        refresh_tmdb_movie.enqueue(movie.id, idempotency_key=movie_cache_key(movie.id))
+    return dict(EMPTY)
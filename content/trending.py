@@ -0,0 +1,227 @@
+"""Engagement counters and time-decayed trending scores.
+
+Views, list adds and reviews are counted in sharded in-process counters
+(:func:`record`), so the request path only increments a dict entry. A flush
+every ``TRENDING_FLUSH_INTERVAL`` seconds adds the counts into hourly
+``TrendingBucket`` rows. The ``rollup_trending`` background job then turns
+those buckets into ``TrendingScore`` rows::
+
+    score = sum(weight(event) * count * 0.5 ** (age / half_life))
+
+The Trending Now row on the home page is one indexed read of the
+precomputed scores.
+"""
+import logging
+import math
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('movie', 'tvshow')
+EVENTS = ('views', 'list_adds', 'reviews')
+
+DEFAULT_WEIGHTS = {'views': 1.0, 'list_adds': 3.0, 'reviews': 5.0}
+
+SHARDS = 8
+
+
+class CounterShard:
+    __slots__ = ('lock', 'counts')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (kind, object_id, bucket_start) -> [views, list_adds, reviews]
+        self.counts = {}
+
+
+_shards = [CounterShard() for _ in range(SHARDS)]
+_timer_lock = threading.Lock()
+_timer = None
+
+
+def bucket_seconds():
+    return getattr(settings, 'TRENDING_BUCKET_SECONDS', 3600)
+
+
+def bucket_start(moment):
+    size = bucket_seconds()
+    return moment - timedelta(seconds=moment.timestamp() % size)
+
+
+def record(kind, object_id, event):
+    """Count one engagement event for a title."""
+    global _timer
+
+    if kind not in KINDS or event not in EVENTS:
+        raise ValueError(f'Unknown trending event {kind!r}/{event!r}')
+    key = (kind, int(object_id), bucket_start(timezone.now()))
+    shard = _shards[hash(key[:2]) % SHARDS]
+    with shard.lock:
+        counts = shard.counts.get(key)
+        if counts is None:
+            counts = shard.counts[key] = [0, 0, 0]
+        counts[EVENTS.index(event)] += 1
+
+    interval = getattr(settings, 'TRENDING_FLUSH_INTERVAL', 30)
+    if interval <= 0:
+        flush()
+        return
+    if _timer is None:
+        with _timer_lock:
+            if _timer is None:
+                _timer = threading.Timer(interval, _flush_from_timer)
+                _timer.daemon = True
+                _timer.start()
+
+
+def drain():
+    """Take and merge the counts from every shard."""
+    global _timer
+
+    with _timer_lock:
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    merged = {}
+    for shard in _shards:
+        with shard.lock:
+            counts, shard.counts = shard.counts, {}
+        merged.update(counts)
+    return merged
+
+
+def requeue(pending):
+    """Add unwritten counts back into the shards, on top of any recorded since."""
+    for key, counts in pending.items():
+        shard = _shards[hash(key[:2]) % SHARDS]
+        with shard.lock:
+            current = shard.counts.get(key)
+            if current is None:
+                shard.counts[key] = list(counts)
+            else:
+                for index, count in enumerate(counts):
+                    current[index] += count
+
+
+def flush():
+    """Add buffered counts into TrendingBucket rows. Returns the rows touched."""
+    pending = drain()
+    if not pending:
+        return 0
+    try:
+        touched = write_buckets(pending)
+    except Exception:
+        # Nothing was committed, so every count goes back
+        requeue(pending)
+        raise
+    schedule_rollup()
+    return touched
+
+
+def write_buckets(pending):
+    """Upsert ``pending`` counts in one transaction."""
+    from .models import Movie, TrendingBucket, TVShow
+
+    ids = defaultdict(set)
+    for kind, object_id, _bucket in pending:
+        ids[kind].add(object_id)
+    valid = {
+        'movie': set(Movie.objects.filter(id__in=ids['movie']).order_by().values_list('id', flat=True)),
+        'tvshow': set(TVShow.objects.filter(id__in=ids['tvshow']).order_by().values_list('id', flat=True)),
+    }
+
+    qn = connection.ops.quote_name
+    table = qn(TrendingBucket._meta.db_table)
+    adapt = connection.ops.adapt_datetimefield_value
+    increments = ', '.join(f'{qn(event)} = {table}.{qn(event)} + excluded.{qn(event)}' for event in EVENTS)
+    touched = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for kind, column in (('movie', 'movie_id'), ('tvshow', 'tv_show_id')):
+                params = [
+                    (object_id, adapt(bucket), *counts)
+                    for (row_kind, object_id, bucket), counts in pending.items()
+                    if row_kind == kind and object_id in valid[kind]
+                ]
+                if not params:
+                    continue
+                # Counts are added, not overwritten, so concurrent flushes
+                # from other processes never lose events
+                cursor.executemany(
+                    f'INSERT INTO {table} ({qn(column)}, {qn("bucket_start")}, '
+                    f'{qn("views")}, {qn("list_adds")}, {qn("reviews")}) '
+                    f'VALUES (%s, %s, %s, %s, %s) '
+                    f'ON CONFLICT ({qn(column)}, {qn("bucket_start")}) DO UPDATE SET {increments}',
+                    params,
+                )
+                touched += len(params)
+    return touched
+
+
+def schedule_rollup():
+    from .tasks import rollup_trending
+
+    rollup_trending.enqueue(
+        idempotency_key='trending:rollup',
+        delay=getattr(settings, 'TRENDING_ROLLUP_INTERVAL', 300),
+    )
+
+
+def rollup(now=None):
+    """Recompute TrendingScore from recent buckets and prune expired ones."""
+    from .models import TrendingBucket, TrendingScore
+
+    now = now or timezone.now()
+    half_life = getattr(settings, 'TRENDING_HALF_LIFE', 24 * 3600)
+    weights = getattr(settings, 'TRENDING_WEIGHTS', DEFAULT_WEIGHTS)
+    # Past eight half-lives a bucket contributes under 0.4% of its weight
+    horizon = now - timedelta(seconds=half_life * 8)
+    decay = math.log(2) / half_life
+
+    scores = defaultdict(float)
+    buckets = TrendingBucket.objects.filter(bucket_start__gte=horizon).values_list(
+        'movie_id', 'tv_show_id', 'bucket_start', *EVENTS
+    )
+    for movie_id, tv_show_id, start, *counts in buckets.iterator():
+        weight = sum(weights[event] * count for event, count in zip(EVENTS, counts))
+        age = max(0.0, (now - start).total_seconds())
+        scores[(movie_id, tv_show_id)] += weight * math.exp(-decay * age)
+
+    limit = getattr(settings, 'TRENDING_MAX_TITLES', 500)
+    top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+    with transaction.atomic():
+        TrendingScore.objects.all().delete()
+        TrendingScore.objects.bulk_create([
+            TrendingScore(movie_id=movie_id, tv_show_id=tv_show_id, score=score, computed_at=now)
+            for (movie_id, tv_show_id), score in top
+        ])
+        TrendingBucket.objects.filter(bucket_start__lt=horizon).delete()
+    return len(top)
+
+
+def trending_titles(limit=12):
+    """Top titles by precomputed score, in one indexed query."""
+    from .models import TrendingScore
+
+    rows = TrendingScore.objects.select_related('movie', 'tv_show')[:limit]
+    return [
+        {'kind': 'movie', 'object': row.movie} if row.movie_id else {'kind': 'tvshow', 'object': row.tv_show}
+        for row in rows
+    ]
+
+
+def _flush_from_timer():
+    from django.db import connections
+
+    try:
+        flush()
+    except Exception:
+        logger.exception('Could not flush trending counters')
+    finally:
+        connections.close_all()
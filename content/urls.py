@@ -6,12 +6,17 @@ urlpatterns = [
     path('profiles/', views.profile_select, name='profile_select'),
     path('profiles/use/<int:profile_id>/', views.profile_use, name='profile_use'),
     path('movie/<int:movie_id>/', views.movie_detail, name='movie_detail'),
+    path('movie/<int:movie_id>/reviews/', views.movie_reviews, name='movie_reviews'),
     path('tv-show/<int:tvshow_id>/', views.tvshow_detail, name='tvshow_detail'),
+    path('tv-show/<int:tvshow_id>/reviews/', views.tvshow_reviews, name='tvshow_reviews'),
     path('episode/<int:episode_id>/', views.episode_detail, name='episode_detail'),
+    path('episode/<int:episode_id>/master.m3u8', views.episode_manifest, name='episode_manifest'),
     path('search/', views.search, name='search'),
     path('genre/<int:genre_id>/', views.genre_view, name='genre_view'),
+    path('browse/', views.browse, name='browse'),
     path('watchlist/', views.watchlist_view, name='watchlist'),
     path('watchlist/add/', views.add_to_watchlist, name='add_to_watchlist'),
     path('watchlist/remove/', views.remove_from_watchlist, name='remove_from_watchlist'),
     path('review/add/', views.add_review, name='add_review'),
+    path('progress/', views.update_progress, name='update_progress'),
 ]
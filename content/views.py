@@ -1,29 +1,44 @@
+import math
+import mimetypes
+import os
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q
-from .models import Movie, TVShow, Episode, Genre, Watchlist, Review, Profile, ProfileWatchlist
 from django.conf import settings
-import json
-from urllib.parse import urlencode
-from urllib.request import urlopen
-from urllib.error import URLError, HTTPError
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.urls import reverse
+from django.utils._os import safe_join
+from .middleware import IMMUTABLE_CACHE_CONTROL
+from .models import Movie, TVShow, Episode, Genre, Watchlist, Review, Profile, ProfileWatchlist, VideoRendition
+from . import catalog, facets, feeds, fileserving, packaging, progress, reviews, titlesearch, tmdb, trending
+from .ratelimit import ratelimit
 
 
 def home(request):
     """Home page with featured content and genre sections"""
-    featured_movies = Movie.objects.filter(featured=True)[:6]
-    featured_tvshows = TVShow.objects.filter(featured=True)[:6]
-    genres = Genre.objects.all()[:8]
-    
-    # Get recent movies and TV shows
-    recent_movies = Movie.objects.all()[:12]
-    recent_tvshows = TVShow.objects.all()[:12]
-    my_list_movies = []
+    snapshot = catalog.get()
+    if snapshot is not None:
+        featured_movies = snapshot.featured_movies[:6]
+        featured_tvshows = snapshot.featured_tvshows[:6]
+        genres = snapshot.genres[:8]
+        recent_movies = snapshot.movies[:12]
+        recent_tvshows = snapshot.tvshows[:12]
+    else:
+        featured_movies = Movie.objects.filter(featured=True)[:6]
+        featured_tvshows = TVShow.objects.filter(featured=True)[:6]
+        genres = Genre.objects.all()[:8]
+        
+        # Get recent movies and TV shows
+        recent_movies = Movie.objects.all()[:12]
+        recent_tvshows = TVShow.objects.all()[:12]
+    feed = {}
+    continue_watching = []
     active_profile_id = request.session.get('active_profile_id')
     if request.user.is_authenticated and active_profile_id:
-        my_list_movies = Movie.objects.filter(profilewatchlist__profile_id=active_profile_id).distinct()
+        feed = feeds.home_feed(active_profile_id)
+        continue_watching = progress.continue_watching(active_profile_id)
     
     context = {
         'featured_movies': featured_movies,
@@ -31,103 +46,53 @@ def home(request):
         'genres': genres,
         'recent_movies': recent_movies,
         'recent_tvshows': recent_tvshows,
-        'my_list_movies': my_list_movies,
+        'my_list_movies': feed.get('my_list', []),
+        'top_picks': feed.get('top_picks', []),
+        'continue_watching': continue_watching,
+        'trending': trending.trending_titles(),
     }
     return render(request, 'content/home.html', context)
 
 
+# Latest reviews shown on a detail page; the rest are on its reviews page
+DETAIL_REVIEWS = 5
+
+
 def movie_detail(request, movie_id):
     """Movie detail page"""
-    movie = get_object_or_404(Movie, id=movie_id)
-    reviews = Review.objects.filter(movie=movie).order_by('-created_at')[:5]
+    movie = catalog.get_or_404(Movie, movie_id)
+    trending.record('movie', movie.id, 'views')
+    latest = reviews.review_page('movie', movie.id, size=DETAIL_REVIEWS)
     is_in_watchlist = False
     active_profile_id = request.session.get('active_profile_id')
     if request.user.is_authenticated and active_profile_id:
-        is_in_watchlist = ProfileWatchlist.objects.filter(profile_id=active_profile_id, movie=movie).exists()
+        is_in_watchlist = ProfileWatchlist.objects.filter(profile_id=active_profile_id, movie_id=movie.id).exists()
     
-    # Fetch TMDB data (best-effort) by searching title and year
-    tmdb_data = {}
-    tmdb_images = {}
-    tmdb_videos = {}
-    tmdb_poster_url = ''
-    tmdb_backdrop_url = ''
-    tmdb_trailer_url = ''
-    api_key = getattr(settings, 'TMDB_API_KEY', '')
-    if api_key and movie.title:
-        try:
-            search_params = {
-                'api_key': api_key,
-                'query': movie.title,
-                'include_adult': 'false',
-            }
-            try:
-                if movie.release_date:
-                    search_params['year'] = movie.release_date.year
-            except Exception:
-                pass
-
-            search_url = 'https://api.themoviedb.org/3/search/movie?' + urlencode(search_params)
-            with urlopen(search_url, timeout=5) as resp:
-                payload = json.loads(resp.read().decode('utf-8'))
-            results = payload.get('results', [])
-            if results:
-                tmdb_match = results[0]
-                tmdb_id = tmdb_match.get('id')
-                if tmdb_id:
-                    details_params = {'api_key': api_key, 'append_to_response': 'images,videos'}
-                    details_url = f'https://api.themoviedb.org/3/movie/{tmdb_id}?' + urlencode(details_params)
-                    with urlopen(details_url, timeout=5) as resp:
-                        data = json.loads(resp.read().decode('utf-8'))
-                    tmdb_data = data or {}
-                    tmdb_images = tmdb_data.get('images', {})
-                    tmdb_videos = tmdb_data.get('videos', {})
-
-                    # Build helpful URLs for template
-                    poster_path = tmdb_data.get('poster_path')
-                    backdrop_path = tmdb_data.get('backdrop_path')
-                    if poster_path:
-                        tmdb_poster_url = f'https://image.tmdb.org/t/p/w500{poster_path}'
-                    if backdrop_path:
-                        tmdb_backdrop_url = f'https://image.tmdb.org/t/p/w1280{backdrop_path}'
-
-                    # Find a trailer or teaser from YouTube
-                    videos = (tmdb_videos or {}).get('results', [])
-                    for video in videos:
-                        if video.get('site') == 'YouTube' and video.get('key') and video.get('type') in ('Trailer', 'Teaser'):
-                            tmdb_trailer_url = f"https://www.youtube.com/watch?v={video['key']}"
-                            break
-        except (URLError, HTTPError, TimeoutError, ValueError, Exception):
-            # Swallow errors to avoid breaking page render
-            tmdb_data = {}
-            tmdb_images = {}
-            tmdb_videos = {}
-            tmdb_poster_url = ''
-            tmdb_backdrop_url = ''
-            tmdb_trailer_url = ''
-
     context = {
         'movie': movie,
-        'reviews': reviews,
+        'reviews': latest.reviews,
+        'more_reviews': latest.next_cursor is not None,
+        'review_summary': reviews.summary_for('movie', movie.id),
         'is_in_watchlist': is_in_watchlist,
-        'tmdb': tmdb_data,
-        'tmdb_images': tmdb_images,
-        'tmdb_videos': tmdb_videos,
-        'tmdb_poster_url': tmdb_poster_url,
-        'tmdb_backdrop_url': tmdb_backdrop_url,
-        'tmdb_trailer_url': tmdb_trailer_url,
     }
+    # TMDB data is fetched by a background job; a miss renders without it
+    context.update(tmdb.cached_movie_context(movie))
     return render(request, 'content/movie_detail.html', context)
 
 
 def tvshow_detail(request, tvshow_id):
     """TV Show detail page"""
-    tvshow = get_object_or_404(TVShow, id=tvshow_id)
-    episodes = Episode.objects.filter(tv_show=tvshow).order_by('season_number', 'episode_number')
-    reviews = Review.objects.filter(tv_show=tvshow).order_by('-created_at')[:5]
+    tvshow = catalog.get_or_404(TVShow, tvshow_id)
+    trending.record('tvshow', tvshow.id, 'views')
+    if isinstance(tvshow, TVShow):
+        episodes = Episode.objects.filter(tv_show=tvshow).order_by('season_number', 'episode_number')
+    else:
+        episodes = tvshow.episodes
+    latest = reviews.review_page('tvshow', tvshow.id, size=DETAIL_REVIEWS)
     is_in_watchlist = False
     
     if request.user.is_authenticated:
-        is_in_watchlist = Watchlist.objects.filter(user=request.user, tv_show=tvshow).exists()
+        is_in_watchlist = Watchlist.objects.filter(user=request.user, tv_show_id=tvshow.id).exists()
     
     # Group episodes by season
     seasons = {}
@@ -140,51 +105,95 @@ def tvshow_detail(request, tvshow_id):
     context = {
         'tvshow': tvshow,
         'seasons': seasons,
-        'reviews': reviews,
+        'reviews': latest.reviews,
+        'more_reviews': latest.next_cursor is not None,
+        'review_summary': reviews.summary_for('tvshow', tvshow.id),
         'is_in_watchlist': is_in_watchlist,
     }
     return render(request, 'content/tvshow_detail.html', context)
 
 
+def movie_reviews(request, movie_id):
+    """All reviews of a movie, newest first"""
+    return review_list(request, 'movie', catalog.get_or_404(Movie, movie_id))
+
+
+def tvshow_reviews(request, tvshow_id):
+    """All reviews of a TV show, newest first"""
+    return review_list(request, 'tvshow', catalog.get_or_404(TVShow, tvshow_id))
+
+
+def review_list(request, kind, title):
+    page = reviews.review_page(kind, title.id, after=request.GET.get('after', ''), before=request.GET.get('before', ''))
+    return render(request, 'content/reviews.html', {
+        'title': title,
+        'kind': kind,
+        'detail_url': reverse(f'{kind}_detail', args=[title.id]),
+        'reviews': page.reviews,
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+        'review_summary': reviews.summary_for(kind, title.id),
+    })
+
+
 def episode_detail(request, episode_id):
     """Episode detail page"""
-    episode = get_object_or_404(Episode, id=episode_id)
+    episode = catalog.get_or_404(Episode, episode_id)
     tvshow = episode.tv_show
     
     # Get next and previous episodes
-    next_episode = Episode.objects.filter(
-        tv_show=tvshow,
-        season_number=episode.season_number,
-        episode_number__gt=episode.episode_number
-    ).first()
-    
-    prev_episode = Episode.objects.filter(
-        tv_show=tvshow,
-        season_number=episode.season_number,
-        episode_number__lt=episode.episode_number
-    ).last()
+    if isinstance(episode, Episode):
+        next_episode = Episode.objects.filter(
+            tv_show=tvshow,
+            season_number=episode.season_number,
+            episode_number__gt=episode.episode_number
+        ).first()
+        
+        prev_episode = Episode.objects.filter(
+            tv_show=tvshow,
+            season_number=episode.season_number,
+            episode_number__lt=episode.episode_number
+        ).last()
+        has_stream = episode.renditions.exists()
+    else:
+        season = [other for other in tvshow.episodes if other.season_number == episode.season_number]
+        next_episode = next((other for other in season if other.episode_number > episode.episode_number), None)
+        prev_episode = next((other for other in reversed(season) if other.episode_number < episode.episode_number), None)
+        has_stream = episode.has_stream
     
     context = {
         'episode': episode,
         'tvshow': tvshow,
         'next_episode': next_episode,
         'prev_episode': prev_episode,
+        'has_stream': has_stream,
     }
     return render(request, 'content/episode_detail.html', context)
 
 
+def episode_manifest(request, episode_id):
+    """Adaptive HLS manifest listing every packaged bitrate of an episode"""
+    renditions = list(VideoRendition.objects.filter(episode_id=episode_id))
+    if not renditions:
+        raise Http404('Episode has no packaged video')
+    response = HttpResponse(packaging.master_playlist(renditions), content_type='application/vnd.apple.mpegurl')
+    # Short-lived: repackaging replaces the renditions it points at
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
+@ratelimit('search')
 def search(request):
     """Search functionality"""
     query = request.GET.get('q', '')
     results = []
     
     if query:
-        movies = Movie.objects.filter(
-            Q(title__icontains=query) | Q(description__icontains=query)
-        )
-        tvshows = TVShow.objects.filter(
-            Q(title__icontains=query) | Q(description__icontains=query)
-        )
+        snapshot = catalog.get()
+        if snapshot is not None:
+            movies, tvshows = titlesearch.search(snapshot, query)
+        else:
+            movies, tvshows = titlesearch.search_database(query)
         results = {
             'movies': movies,
             'tvshows': tvshows,
@@ -220,9 +229,16 @@ def profile_use(request, profile_id):
 
 def genre_view(request, genre_id):
     """View content by genre"""
-    genre = get_object_or_404(Genre, id=genre_id)
-    movies = Movie.objects.filter(genres=genre)
-    tvshows = TVShow.objects.filter(genres=genre)
+    snapshot = catalog.get()
+    if snapshot is not None:
+        genre = snapshot.genre(genre_id)
+        if genre is None:
+            raise Http404('No Genre matches the given query.')
+        movies, tvshows = snapshot.in_genre(genre)
+    else:
+        genre = get_object_or_404(Genre, id=genre_id)
+        movies = Movie.objects.filter(genres=genre)
+        tvshows = TVShow.objects.filter(genres=genre)
     
     context = {
         'genre': genre,
@@ -232,10 +248,83 @@ def genre_view(request, genre_id):
     return render(request, 'content/genre_view.html', context)
 
 
+BROWSE_PAGE_SIZE = 48
+
+
+def browse(request):
+    """Filter the catalog by genres, rating, release year and length"""
+    filters = facets.Filters.from_query(request.GET)
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    start = (page - 1) * BROWSE_PAGE_SIZE
+
+    snapshot = catalog.get()
+    if snapshot is not None:
+        index = snapshot.facets
+        matches, counts = index.search(filters)
+        genres = snapshot.genres
+        totals = {kind: bits.bit_count() for kind, bits in matches.items()}
+        movies = index.page('movie', matches['movie'], start, BROWSE_PAGE_SIZE)
+        tvshows = index.page('tvshow', matches['tvshow'], start, BROWSE_PAGE_SIZE)
+        genre_counts = {genre.id: count for genre, count in counts['genres']}
+    else:
+        # Without the snapshot only the results are filtered; no facet counts
+        counts, genre_counts = None, {}
+        genres = Genre.objects.all()
+        movie_qs = facets.filter_queryset(Movie.objects.all(), filters, 'movie')
+        tvshow_qs = facets.filter_queryset(TVShow.objects.all(), filters, 'tvshow')
+        totals = {'movie': movie_qs.count(), 'tvshow': tvshow_qs.count()}
+        movies = movie_qs[start:start + BROWSE_PAGE_SIZE]
+        tvshows = tvshow_qs[start:start + BROWSE_PAGE_SIZE]
+
+    genre_options = [
+        {'genre': genre, 'count': genre_counts.get(genre.id), 'checked': genre.id in filters.genres}
+        for genre in genres
+    ]
+    links = {}
+    if counts is not None:
+        links = {
+            'ratings': [
+                {'label': label, 'count': count, 'url': filters.url(rating_min=low, rating_max=high),
+                 'active': (filters.rating_min, filters.rating_max) == (low, high)}
+                for label, low, high, count in counts['ratings']
+            ],
+            'decades': [
+                {'label': f'{decade}s', 'count': count, 'url': filters.url(year_from=decade, year_to=decade + 9),
+                 'active': (filters.year_from, filters.year_to) == (decade, decade + 9)}
+                for decade, count in counts['decades']
+            ],
+            'durations': [
+                {'label': label, 'count': count, 'url': filters.url(duration=key), 'active': filters.duration == key}
+                for key, label, count in counts['durations']
+            ],
+            'kinds': [
+                {'label': 'Movies' if kind == 'movie' else 'TV Shows', 'count': count, 'url': filters.url(kind=kind),
+                 'active': filters.kind == kind}
+                for kind, count in counts['kinds']
+            ],
+        }
+    context = {
+        'genres': genres,
+        'filters': filters,
+        'genre_options': genre_options,
+        'links': links,
+        'movies': movies,
+        'tvshows': tvshows,
+        'totals': totals,
+        'page': page,
+        'previous_url': filters.page_url(page - 1) if page > 1 else '',
+        'next_url': filters.page_url(page + 1) if max(totals.values()) > start + BROWSE_PAGE_SIZE else '',
+    }
+    return render(request, 'content/browse.html', context)
+
+
 @login_required
 def watchlist_view(request):
     """User's watchlist"""
-    watchlist_items = Watchlist.objects.filter(user=request.user).order_by('-added_at')
+    watchlist_items = Watchlist.objects.filter(user=request.user).select_related('movie', 'tv_show').order_by('-added_at')
     
     context = {
         'watchlist_items': watchlist_items,
@@ -244,6 +333,7 @@ def watchlist_view(request):
 
 
 @login_required
+@ratelimit('watchlist', methods=['POST'])
 def add_to_watchlist(request):
     """Add item to watchlist"""
     if request.method == 'POST':
@@ -256,10 +346,14 @@ def add_to_watchlist(request):
         
         if content_type == 'movie':
             movie = get_object_or_404(Movie, id=content_id)
-            ProfileWatchlist.objects.get_or_create(profile_id=active_profile_id, movie=movie)
+            _, created = ProfileWatchlist.objects.get_or_create(profile_id=active_profile_id, movie=movie)
+            if created:
+                trending.record('movie', movie.id, 'list_adds')
         elif content_type == 'tvshow':
             tvshow = get_object_or_404(TVShow, id=content_id)
-            ProfileWatchlist.objects.get_or_create(profile_id=active_profile_id, tv_show=tvshow)
+            _, created = ProfileWatchlist.objects.get_or_create(profile_id=active_profile_id, tv_show=tvshow)
+            if created:
+                trending.record('tvshow', tvshow.id, 'list_adds')
         
         messages.success(request, 'Added to watchlist!')
     
@@ -267,6 +361,7 @@ def add_to_watchlist(request):
 
 
 @login_required
+@ratelimit('watchlist', methods=['POST'])
 def remove_from_watchlist(request):
     """Remove item from watchlist"""
     if request.method == 'POST':
@@ -288,13 +383,20 @@ def remove_from_watchlist(request):
 
 
 @login_required
+@ratelimit('review', methods=['POST'])
 def add_review(request):
     """Add a review"""
     if request.method == 'POST':
         content_type = request.POST.get('content_type')
         content_id = request.POST.get('content_id')
-        rating = int(request.POST.get('rating'))
-        comment = request.POST.get('comment')
+        try:
+            rating = int(request.POST.get('rating'))
+        except (TypeError, ValueError):
+            rating = None
+        if rating is None or not 1 <= rating <= 5:
+            messages.error(request, 'Please choose a rating from 1 to 5.')
+            return redirect(request.META.get('HTTP_REFERER', '/'))
+        comment = request.POST.get('comment', '')
         
         if content_type == 'movie':
             movie = get_object_or_404(Movie, id=content_id)
@@ -303,6 +405,7 @@ def add_review(request):
                 movie=movie,
                 defaults={'rating': rating, 'comment': comment}
             )
+            trending.record('movie', movie.id, 'reviews')
         elif content_type == 'tvshow':
             tvshow = get_object_or_404(TVShow, id=content_id)
             Review.objects.update_or_create(
@@ -310,7 +413,61 @@ def add_review(request):
                 tv_show=tvshow,
                 defaults={'rating': rating, 'comment': comment}
             )
+            trending.record('tvshow', tvshow.id, 'reviews')
         
         messages.success(request, 'Review added successfully!')
     
     return redirect(request.META.get('HTTP_REFERER', '/'))
+
+
+@login_required
+@ratelimit('progress', methods=['POST'], json=True)
+def update_progress(request):
+    """Record a player heartbeat for the active profile"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    active_profile_id = request.session.get('active_profile_id')
+    if not active_profile_id:
+        return JsonResponse({'error': 'Select a profile first.'}, status=400)
+    content_type = request.POST.get('content_type')
+    try:
+        content_id = int(request.POST.get('content_id'))
+        position = float(request.POST.get('position'))
+        duration = float(request.POST.get('duration', 0))
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'Invalid progress data'}, status=400)
+    if not (math.isfinite(position) and math.isfinite(duration)):
+        return JsonResponse({'error': 'Invalid progress data'}, status=400)
+    if content_type not in progress.KINDS:
+        return JsonResponse({'error': 'Invalid content type'}, status=400)
+
+    progress.record_heartbeat(active_profile_id, content_type, content_id, position, duration)
+    return JsonResponse({'ok': True}, status=202)
+
+
+def serve_media(request, path):
+    """Serve an uploaded file from MEDIA_ROOT with Range and conditional request support"""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('File not found')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found')
+
+    # Image renditions and HLS output embed a content hash, so they never change in place
+    if path.startswith(('renditions/', 'hls/')):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = getattr(settings, 'MEDIA_CACHE_CONTROL', 'public, max-age=3600')
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+    if accel_prefix:
+        # nginx sends the file (ranges included) from its internal location
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_prefix + path
+        response['Cache-Control'] = cache_control
+        return response
+    return fileserving.serve_file(request, full_path, content_type, cache_control)
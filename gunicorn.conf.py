@@ -0,0 +1,18 @@
+"""gunicorn settings, read automatically when it's started from this directory.
+
+With ``--preload`` the master imports ``netflix_clone.wsgi`` before forking.
+Warming up there would open database connections that every worker then
+shares, so ``content.health.warm_up_on_boot`` skips the process whose pid
+is exported below, and :func:`post_fork` warms each worker instead.
+"""
+import os
+
+os.environ['GUNICORN_MASTER_PID'] = str(os.getpid())
+
+
+def post_fork(server, worker):
+    # Without --preload each worker imports the application, and warms up, after this
+    if server.cfg.preload_app:
+        from content.health import warm_up_on_boot
+
+        warm_up_on_boot(forked=True)
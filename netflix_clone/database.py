@@ -0,0 +1,116 @@
+"""Database profiles selected with the DB_PROFILE environment variable.
+
+``sqlite`` (default)
+    Local file database tuned for concurrent readers and writers:
+    ``synchronous=NORMAL``, memory-mapped I/O and a busy timeout, applied to
+    every new connection by :func:`apply_sqlite_pragmas`. Readers only stop
+    blocking on writers in WAL mode. That is stored in the file itself, so
+    it is switched on once per database rather than per connection, and not
+    for the ``db.sqlite3`` checked into the repository::
+
+        sqlite3 /srv/netflix_clone/db.sqlite3 'PRAGMA journal_mode=WAL'
+
+``postgres``
+    PostgreSQL configured from ``POSTGRES_*`` variables. Connections are
+    either kept open per worker (``CONN_MAX_AGE``) or, with ``DB_POOL=1``,
+    shared through psycopg's connection pool.
+
+Read replicas are listed in DB_REPLICAS (comma-separated SQLite paths or
+PostgreSQL hosts) and become the ``replica1``, ``replica2``... aliases used by
+``content.routers.ReplicaRouter``.
+"""
+import os
+import tempfile
+
+from django.db.backends.signals import connection_created
+
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # KiB
+    'temp_store': 'MEMORY',
+}
+
+
+def env_flag(name, default=False):
+    return os.environ.get(name, '1' if default else '0').lower() in ('1', 'true', 'yes', 'on')
+
+
+def sqlite_database(base_dir):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', os.path.join(base_dir, 'db.sqlite3')),
+        'OPTIONS': {
+            # Take the write lock at BEGIN so concurrent writers queue on
+            # busy_timeout instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+        },
+        # A file, like the real database: the in-memory test database's
+        # shared cache fails concurrent writers instead of queueing them
+        'TEST': {'NAME': os.path.join(tempfile.gettempdir(), f'netflix_clone_test_{os.getpid()}.sqlite3')},
+    }
+
+
+def postgres_database():
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'netflix_clone'),
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    if env_flag('DB_POOL'):
+        # The pool owns connection reuse; Django requires CONN_MAX_AGE = 0
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
+    else:
+        database['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+    return database
+
+
+def database_profile(base_dir, profile=None):
+    """Return the ``default`` DATABASES entry for a profile name."""
+    profile = profile or os.environ.get('DB_PROFILE', 'sqlite')
+    if profile == 'sqlite':
+        return sqlite_database(base_dir)
+    if profile == 'postgres':
+        return postgres_database()
+    raise ValueError(f"Unknown DB_PROFILE {profile!r}; expected 'sqlite' or 'postgres'")
+
+
+def replica_databases(base_dir, profile=None):
+    """Return DATABASES entries for the replicas listed in DB_REPLICAS."""
+    profile = profile or os.environ.get('DB_PROFILE', 'sqlite')
+    locations = [item.strip() for item in os.environ.get('DB_REPLICAS', '').split(',') if item.strip()]
+    replicas = {}
+    for index, location in enumerate(locations, start=1):
+        database = database_profile(base_dir, profile)
+        if profile == 'sqlite':
+            database['NAME'] = location
+        else:
+            database['HOST'] = location
+        # Tests run against a single database; replicas read from it
+        database['TEST'] = {'MIRROR': 'default'}
+        replicas[f'replica{index}'] = database
+    return replicas
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """connection_created handler applying SQLITE_PRAGMAS to new SQLite connections."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+connection_created.connect(apply_sqlite_pragmas, dispatch_uid='sqlite-pragmas')
@@ -0,0 +1,17 @@
+"""Load the settings for the environment named by DJANGO_ENV (default ``dev``).
+
+``DJANGO_SETTINGS_MODULE=netflix_clone.settings`` keeps working everywhere;
+pointing it at ``netflix_clone.settings.prod`` directly works too.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+ENVIRONMENT = os.environ.get('DJANGO_ENV', 'dev')
+
+if ENVIRONMENT == 'dev':
+    from .dev import *  # noqa: F401,F403
+elif ENVIRONMENT == 'prod':
+    from .prod import *  # noqa: F401,F403
+else:
+    raise ImproperlyConfigured(f"Unknown DJANGO_ENV {ENVIRONMENT!r}; expected 'dev' or 'prod'")
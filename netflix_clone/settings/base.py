@@ -0,0 +1,286 @@
+"""
+Settings shared by every environment of the netflix_clone project.
+
+``DJANGO_ENV`` picks the environment module layered on top of these (see
+``netflix_clone/settings/__init__.py``): ``dev`` for local work and ``prod``
+for deployments. Values here are production-safe defaults.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/5.2/ref/settings/
+"""
+
+from pathlib import Path
+import os
+
+from ..database import database_profile, replica_databases
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+DEBUG = False
+
+ALLOWED_HOSTS = []
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'content',
+]
+
+MIDDLEWARE = [
+    'content.middleware.HealthCheckMiddleware',
+    'content.middleware.InvalidationMiddleware',
+    'content.middleware.QueryProfilerMiddleware',
+    'content.middleware.SamplingProfilerMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'content.middleware.StaticFilesMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'content.middleware.ReplicaPinningMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'netflix_clone.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [BASE_DIR / 'templates'],
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+                'django.template.context_processors.static',
+            ],
+            # Compile each template once per process; outside DEBUG there is
+            # no autoreloader to reset the cache, so restart to pick up edits
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    },
+]
+
+# Rendered title cards kept per process (see content/templatetags/content_cards.py)
+CARD_MEMO_SIZE = 2000
+
+WSGI_APPLICATION = 'netflix_clone.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# DB_PROFILE=sqlite (default) or postgres; see netflix_clone/database.py
+
+DATABASES = {
+    'default': database_profile(BASE_DIR),
+    **replica_databases(BASE_DIR),
+}
+
+# Reads go to healthy replicas (DB_REPLICAS), writes to default
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['content.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = 5
+REPLICA_MAX_LAG = 10
+REPLICA_HEALTH_INTERVAL = 15
+
+
+# Cache
+# File-based so results written by `run_workers` are visible to web processes.
+# Rate-limit counters need add/incr that are atomic across every worker:
+# Redis when REDIS_URL is set, else per-process LocMem, which only suits the
+# single-process development server (`check --deploy` rejects it)
+
+REDIS_URL = os.environ.get('REDIS_URL', '')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache',
+    },
+    'counters': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'counters',
+    },
+}
+
+
+# Player heartbeats are buffered per process and written in batches
+PROGRESS_FLUSH_INTERVAL = 10
+PROGRESS_MAX_BUFFER = 5000
+
+
+# Trending Now: counters flushed into hourly buckets, scores decay by half daily
+TRENDING_FLUSH_INTERVAL = 30
+TRENDING_BUCKET_SECONDS = 3600
+TRENDING_ROLLUP_INTERVAL = 300
+TRENDING_HALF_LIFE = 24 * 3600
+
+
+# Password validation
+# https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/5.2/topics/i18n/
+
+LANGUAGE_CODE = 'en-us'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/5.2/howto/static-files/
+
+STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# `collectstatic` writes content-hashed names plus .gz/.br siblings, which
+# StaticFilesMiddleware serves with far-future immutable caching
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'content.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Media files
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+# Media is served by content.views.serve_media. Behind nginx, set this to an
+# internal location (e.g. '/protected-media/') to hand the transfer to nginx.
+MEDIA_ACCEL_REDIRECT = None
+MEDIA_CACHE_CONTROL = 'public, max-age=3600'
+
+# Poster/avatar derivatives built after upload (see content/images.py)
+IMAGE_RENDITION_WIDTHS = [160, 320, 640]
+IMAGE_RENDITION_FORMATS = ['avif', 'webp']
+
+# Fixed-window limits per user (or IP when signed out); see content/ratelimit.py
+RATELIMIT_ENABLED = True
+RATELIMIT_CACHE = 'counters'
+RATELIMITS = {
+    'search': '30/m',
+    'review': '10/m',
+    'watchlist': '30/m',
+    'progress': '30/m',
+}
+# Only enable behind a proxy that sets X-Forwarded-For
+RATELIMIT_TRUST_FORWARDED_FOR = False
+
+# Per-profile home rows, rebuilt on watchlist/review changes (see content/feeds.py)
+HOME_FEED_TIMEOUT = 60 * 60
+
+# HLS packaging of uploaded episodes (see content/packaging.py); needs ffmpeg
+# and ffprobe on PATH or FFMPEG_BINARY / FFPROBE_BINARY
+FFMPEG_BINARY = None
+FFPROBE_BINARY = None
+VIDEO_PACKAGING_PROCESSES = os.cpu_count() or 1
+
+# In-memory catalog served to home/genre/detail pages (see content/catalog.py)
+CATALOG_SNAPSHOT_ENABLED = True
+CATALOG_VERSION_CHECK_INTERVAL = 1.0
+CATALOG_SNAPSHOT_MAX_BYTES = 128 * 1024 * 1024
+
+# Cache invalidation published on commit and polled by every worker (see
+# content/invalidation.py)
+INVALIDATION_POLL_INTERVAL = 1.0
+INVALIDATION_CHUNK_SIZE = 500
+INVALIDATION_EVENT_TIMEOUT = 300
+INVALIDATION_MAX_BACKLOG = 1000
+INVALIDATION_GAP_TIMEOUT = 5.0
+
+# Per-request SQL profiling (see content/sqlprofile.py); summarize the log
+# with `manage.py sql_report`
+SQL_PROFILER_ENABLED = os.environ.get('SQL_PROFILER_ENABLED', '') == '1'
+SQL_SLOW_QUERY_MS = 100
+SQL_REPEATED_QUERY_THRESHOLD = 5
+SQL_SLOW_QUERY_LOG = BASE_DIR / 'logs' / 'slow_queries.log'
+SQL_SLOW_QUERY_LOG_BYTES = 10 * 1024 * 1024
+SQL_SLOW_QUERY_LOG_BACKUPS = 5
+# Parameter values may be secrets or personal data; only log them when debugging
+SQL_SLOW_QUERY_LOG_PARAMS = False
+
+# Stack sampling of selected requests (see content/sampling.py); merge the
+# per-process output with `manage.py flamegraph`
+SAMPLING_PROFILER_ENABLED = os.environ.get('SAMPLING_PROFILER_ENABLED', '') == '1'
+SAMPLING_PROFILER_RATE = 100
+SAMPLING_PROFILER_ROUTES = []
+# Requests sending `X-Profile: <token>` are always sampled; empty disables
+SAMPLING_PROFILER_TOKEN = os.environ.get('SAMPLING_PROFILER_TOKEN', '')
+SAMPLING_PROFILER_INTERVAL = 0.005
+# 'auto' uses SIGPROF for requests on the main thread, 'thread' never does
+SAMPLING_PROFILER_MODE = 'auto'
+SAMPLING_PROFILER_FLUSH_INTERVAL = 30
+SAMPLING_PROFILER_DIR = BASE_DIR / 'logs' / 'stacks'
+
+# Workers render the home and first WARMUP_GENRES genre pages when wsgi.py or
+# asgi.py is imported, and /readyz stays 503 until that's done (see content/health.py).
+# Under gunicorn --preload that import happens in the master, so it must not
+# warm up there: start gunicorn from the project root so gunicorn.conf.py is
+# read, and its post_fork hook warms each worker instead
+WARMUP_ON_BOOT = True
+WARMUP_GENRES = 8
+
+# Background jobs (see content/taskqueue.py); run them with `manage.py run_workers`.
+# TASK_QUEUE_EAGER runs each job inline as it's queued instead (dev.py sets it)
+TASK_QUEUE_EAGER = False
+TASK_QUEUE_RETRY_BACKOFF = 5
+# A running job renews its lease every HEARTBEAT_INTERVAL seconds; one not
+# renewed for VISIBILITY_TIMEOUT seconds is taken to be orphaned and requeued
+TASK_QUEUE_VISIBILITY_TIMEOUT = 600
+TASK_QUEUE_HEARTBEAT_INTERVAL = 60
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# After successful login, show the profile selection screen
+LOGIN_REDIRECT_URL = '/profiles/'
+
+# Third-party API settings
+# Set your TMDB API key in environment variable TMDB_API_KEY
+TMDB_API_KEY = os.environ.get('TMDB_API_KEY', '')
+# Point at a local stub for load tests (see content/loadtest.py)
+TMDB_API_URL = os.environ.get('TMDB_API_URL', 'https://api.themoviedb.org/3')
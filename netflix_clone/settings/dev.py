@@ -0,0 +1,35 @@
+"""Local development: DEBUG on, plain static files, LAN hosts allowed."""
+from .base import *  # noqa: F401,F403
+from .base import STORAGES
+
+# SECURITY WARNING: this key is public; prod.py requires DJANGO_SECRET_KEY
+SECRET_KEY = 'django-insecure-&kvox(96yezdi_12#))3+g9d%oig%l&u+o0kn&=*h-hc9^ke#i'
+
+DEBUG = True
+
+ALLOWED_HOSTS = ['localhost', '127.0.0.1', '192.168.1.42']
+
+# Allow CSRF from common local development hosts
+CSRF_TRUSTED_ORIGINS = [
+    'http://localhost',
+    'http://127.0.0.1',
+    'http://192.168.1.42',
+    'https://localhost',
+    'https://127.0.0.1',
+    'https://192.168.1.42',
+]
+
+# Serve edited templates and cards straight away
+CARD_MEMO_SIZE = 0
+
+# Keep runserver reloads quick
+WARMUP_ON_BOOT = False
+
+# No `run_workers` needed next to runserver: jobs such as TMDB lookups run
+# inline as they're queued. Turn this off to exercise the queue itself
+TASK_QUEUE_EAGER = True
+
+STORAGES = {
+    **STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
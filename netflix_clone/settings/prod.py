@@ -0,0 +1,29 @@
+"""Deployments: everything that varies per host comes from the environment.
+
+Required: ``DJANGO_SECRET_KEY`` and ``DJANGO_ALLOWED_HOSTS`` (comma-separated).
+Optional: ``DJANGO_CSRF_TRUSTED_ORIGINS``, ``DJANGO_SECURE_COOKIES`` (default on)
+and ``DJANGO_HSTS_SECONDS``.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from ..database import env_flag
+from .base import *  # noqa: F401,F403
+
+
+def env_list(name):
+    return [item.strip() for item in os.environ.get(name, '').split(',') if item.strip()]
+
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', '')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Set DJANGO_SECRET_KEY when DJANGO_ENV=prod')
+
+DEBUG = False
+
+ALLOWED_HOSTS = env_list('DJANGO_ALLOWED_HOSTS')
+CSRF_TRUSTED_ORIGINS = env_list('DJANGO_CSRF_TRUSTED_ORIGINS')
+
+SESSION_COOKIE_SECURE = CSRF_COOKIE_SECURE = env_flag('DJANGO_SECURE_COOKIES', True)
+SECURE_HSTS_SECONDS = int(os.environ.get('DJANGO_HSTS_SECONDS', 0))
@@ -1 +0,0 @@
-192.168.1.42
\ No newline at end of file
@@ -17,13 +17,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from content.views import serve_media
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Uploaded media (posters, avatars, video) with byte-range support
+    path(settings.MEDIA_URL.lstrip('/') + '<path:path>', serve_media, name='media'),
     path('', include('content.urls')),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'netflix_clone.settings')
 
 application = get_wsgi_application()
+
+# Pay cold-start costs before the first request (see content/health.py)
+from content.health import warm_up_on_boot  # noqa: E402
+
+warm_up_on_boot()